@@ -29,8 +29,10 @@ from controlnet_aux.open_pose.body import Body
 
 
 from inference.models import YOLOWorld
-from src.efficientvit.models.efficientvit.sam import EfficientViTSamPredictor
+from src.efficientvit.models.efficientvit.sam import EfficientViTSamPredictor, SamImageEmbeddingCache
+from src.efficientvit.models.efficientvit.sam_onnx import EfficientViTSamOnnx, EfficientViTSamOnnxPredictor, export_sam_onnx
 from src.efficientvit.sam_model_zoo import create_sam_model
+from src.efficientvit.models.nn import fuse_for_inference
 import supervision as sv
 
 
@@ -49,6 +51,11 @@ from src.pipelines.lora_pipeline import LoraMultiConceptPipeline
 from src.prompt_attention.p2p_attention import AttentionReplace
 from diffusers import ControlNetModel, StableDiffusionXLPipeline
 from src.pipelines.lora_pipeline import revise_regionally_controlnet_forward
+from src.pipelines.stage_cache import Stage1Cache
+from src.pipelines.controlnet_pool import ControlNetPool
+from src.pipelines.prompt_cache import PromptEmbeddingCache
+from src.pipelines.lora_pool import LoraResidencyManager, lora_adapter_name
+from src.pipelines.request_batcher import RequestBatcher
 
 from download import OMG_download
 
@@ -113,7 +120,10 @@ def sample_image(pipe,
 
     spatial_condition = extra_kargs.pop('spatial_condition')
     if spatial_condition is not None:
-        spatial_condition_input = [spatial_condition] * len(input_prompt)
+        # one condition image per request, shared by its two copies
+        if not isinstance(spatial_condition, list):
+            spatial_condition = [spatial_condition]
+        spatial_condition_input = [image for image in spatial_condition for _ in range(2)]
     else:
         spatial_condition_input = None
 
@@ -177,9 +187,10 @@ def predict_mask(segmentmodel, sam, image, TEXT_PROMPT, segmentType, confidence
         image_source = load_image_yoloworld(image)
         segmentmodel.set_classes([TEXT_PROMPT])
         results = segmentmodel.infer(image_source, confidence=confidence)
-        detections = sv.Detections.from_inference(results).with_nms(
-            class_agnostic=True, threshold=threshold
-        )
+        # the response is columnar, no need for the per-box round trip of from_inference
+        detections = sv.Detections(
+            xyxy=results.xyxy, confidence=results.confidence, class_id=results.class_id
+        ).with_nms(class_agnostic=True, threshold=threshold)
         masks = None
         if len(detections) != 0:
             print(TEXT_PROMPT + " detected!")
@@ -189,6 +200,71 @@ def predict_mask(segmentmodel, sam, image, TEXT_PROMPT, segmentType, confidence
 
     return masks
 
+def predict_masks(segmentmodel, sam, image, text_prompts, segmentType, confidence = 0.2, threshold = 0.5, mask_size=None):
+    '''
+    Segments every prompt of `text_prompts` in `image` with a single detection pass and a single
+    image embedding, returns one mask per prompt (None when the prompt is not detected). With
+    YOLO-World the masks are returned at `mask_size` (H, W), by default the image size.
+    '''
+    return predict_masks_batch(segmentmodel, sam, [image], text_prompts, segmentType, confidence, threshold, mask_size)[0]
+
+def predict_masks_batch(segmentmodel, sam, images, text_prompts, segmentType, confidence = 0.2, threshold = 0.5, mask_size=None):
+    '''
+    predict_masks for a list of images, with YOLO-World the detection runs as one batch.
+    '''
+    if len(text_prompts) == 0:
+        return [[] for _ in images]
+    if segmentType=='GroundingDINO':
+        return [[predict_mask(segmentmodel, sam, image, text_prompt, segmentType, confidence, threshold)
+                 for text_prompt in text_prompts] for image in images]
+
+    image_sources = [load_image_yoloworld(image) for image in images]
+    results = segmentmodel.infer_batch(image_sources, text=text_prompts, confidence=confidence)
+    image_masks = []
+    for image_source, result in zip(image_sources, results):
+        # suppress per class, a man and a woman may well overlap
+        detections = sv.Detections(
+            xyxy=result.xyxy, confidence=result.confidence, class_id=result.class_id
+        ).with_nms(class_agnostic=False, threshold=threshold)
+        boxes = []
+        detected = []
+        for class_id, text_prompt in enumerate(text_prompts):
+            class_detections = detections[detections.class_id == class_id]
+            if len(class_detections) != 0:
+                print(text_prompt + " detected!")
+                boxes.append(class_detections.xyxy[np.argmax(class_detections.confidence)])
+                detected.append(class_id)
+
+        masks = [None] * len(text_prompts)
+        if len(boxes) != 0:
+            sam.set_image(image_source, image_format="RGB")
+            box_masks, _, _ = sam.predict_batch(boxes=np.stack(boxes), multimask_output=False, output_size=mask_size)
+            for k, class_id in enumerate(detected):
+                masks[class_id] = box_masks[k, 0]
+        image_masks.append(masks)
+    return image_masks
+
+def attention_masks(token_maps, mask_size, threshold=0.5):
+    '''
+    Region masks from the stage-1 cross-attention maps of the subject tokens, (num_subjects, h, w)
+    as recorded by the controller. A pixel goes to the subject with the strongest normalized
+    attention if it is above `threshold`. Returns one mask per subject (None when empty) at
+    `mask_size` and a confidence per subject: the mean attention inside its mask minus outside.
+    '''
+    token_maps = token_maps / token_maps.flatten(1).amax(1).clamp(min=1e-6)[:, None, None]
+    token_maps = torch.nn.functional.interpolate(token_maps[None], size=mask_size, mode='bilinear', align_corners=False)[0]
+    owner = token_maps.argmax(0)
+    masks, confidences = [], []
+    for s, token_map in enumerate(token_maps):
+        mask = (owner == s) & (token_map >= threshold)
+        if not mask.any() or mask.all():
+            masks.append(None)
+            confidences.append(0.)
+            continue
+        masks.append(mask)
+        confidences.append(float(token_map[mask].mean() - token_map[~mask].mean()))
+    return masks, confidences
+
 def prepare_text(prompt, region_prompts):
     '''
     Args:
@@ -213,44 +289,73 @@ def prepare_text(prompt, region_prompts):
     return (prompt, region_collection)
 
 
-def build_model_sd(pretrained_model, controlnet_path, device, prompts):
+def build_model_sd(pretrained_model, controlnet_path, device, prompts, concept_device=None):
     controlnet = ControlNetModel.from_pretrained(controlnet_path, torch_dtype=torch.float16).to(device)
     pipe = LoraMultiConceptPipeline.from_pretrained(
         pretrained_model, controlnet=controlnet, torch_dtype=torch.float16, variant="fp16").to(device)
     controller = AttentionReplace(prompts, 50, cross_replace_steps={"default_": 1.}, self_replace_steps=0.4, tokenizer=pipe.tokenizer, device=device, dtype=torch.float16, width=1024//32, height=1024//32)
     revise_regionally_controlnet_forward(pipe.unet, controller)
     pipe_concept = StableDiffusionXLPipeline.from_pretrained(pretrained_model, torch_dtype=torch.float16,
-                                                             variant="fp16").to(device)
+                                                             variant="fp16").to(concept_device or device)
     return pipe, controller, pipe_concept
 
-def build_model_lora(pipe_concept, lora_paths, style_path, condition, args, pipe):
+def build_model_lora(pipe_concept, lora_paths, style_path, condition, args, pipe, controlnet_pool, lora_pool=None):
     pipe_list = []
-    if condition == "Human pose":
-        controlnet = ControlNetModel.from_pretrained(args.openpose_checkpoint, torch_dtype=torch.float16).to(device)
-        pipe.controlnet = controlnet
-    elif condition == "Canny Edge":
-        controlnet = ControlNetModel.from_pretrained(args.canny_checkpoint, torch_dtype=torch.float16, variant="fp16").to(device)
-        pipe.controlnet = controlnet
-    elif condition == "Depth":
-        controlnet = ControlNetModel.from_pretrained(args.depth_checkpoint, torch_dtype=torch.float16).to(device)
-        pipe.controlnet = controlnet
+    style_adapter = 'style'
+    if condition != "None":
+        pipe.controlnet = controlnet_pool.get(condition)
 
     if style_path is not None and os.path.exists(style_path):
-        pipe_concept.load_lora_weights(style_path, weight_name="pytorch_lora_weights.safetensors", adapter_name='style')
-        pipe.load_lora_weights(style_path, weight_name="pytorch_lora_weights.safetensors", adapter_name='style')
+        if lora_pool is not None:
+            style_adapter = lora_pool.load(pipe_concept, style_path, lora_adapter_name(style_path, prefix='style_'))
+            lora_pool.activate_style(pipe, style_path)
+        else:
+            pipe_concept.load_lora_weights(style_path, weight_name="pytorch_lora_weights.safetensors", adapter_name='style')
+            pipe.load_lora_weights(style_path, weight_name="pytorch_lora_weights.safetensors", adapter_name='style')
+    elif lora_pool is not None:
+        lora_pool.activate_style(pipe, None)
 
     for lora_path in lora_paths.split('|'):
-        adapter_name = lora_path.split('/')[-1].split('.')[0]
-        pipe_concept.load_lora_weights(lora_path, weight_name="pytorch_lora_weights.safetensors", adapter_name=adapter_name)
+        adapter_name = lora_adapter_name(lora_path)
+        if lora_pool is not None:
+            lora_pool.load(pipe_concept, lora_path, adapter_name)
+        else:
+            pipe_concept.load_lora_weights(lora_path, weight_name="pytorch_lora_weights.safetensors", adapter_name=adapter_name)
         pipe_concept.enable_xformers_memory_efficient_attention()
         pipe_list.append(adapter_name)
-    return pipe_list
-
-def build_yolo_segment_model(sam_path, device):
+    return pipe_list, style_adapter
+
+def build_controlnet_pool(pipe, device, args):
+    controlnet_pool = ControlNetPool(device, dtype=torch.float16, offload=args.controlnet_offload)
+    controlnet_pool.register("Human pose", args.openpose_checkpoint)
+    controlnet_pool.register("Canny Edge", args.canny_checkpoint, variant="fp16")
+    controlnet_pool.register("Depth", args.depth_checkpoint)
+    # build_model_sd already loaded the openpose ControlNet
+    controlnet_pool.add("Human pose", pipe.controlnet)
+    if args.controlnet_preload:
+        for name in ["Canny Edge", "Depth"]:
+            controlnet_pool.prefetch(name)
+    return controlnet_pool
+
+def build_yolo_segment_model(sam_path, device, args):
     yolo_world = YOLOWorld(model_id="yolo_world/l")
-    sam = EfficientViTSamPredictor(
-        create_sam_model(name="xl1", weight_url=sam_path).to(device).eval()
-    )
+    # the subjects every request segments, their text embeddings are then never computed on the request path
+    yolo_world.preload_classes(["man", "woman"])
+    if args.sam_cache_size > 0:
+        embedding_cache = SamImageEmbeddingCache(max_bytes=int(args.sam_cache_size * 1024 ** 2),
+                                                 spill_dir=args.sam_cache_dir, namespace="xl1")
+    else:
+        embedding_cache = None
+    if args.sam_backend == 'onnx':
+        if not EfficientViTSamOnnx.is_exported(args.sam_onnx_dir):
+            export_sam_onnx(fuse_for_inference(create_sam_model(name="xl1", weight_url=sam_path), inplace=True),
+                            args.sam_onnx_dir)
+        # on the CPU by default, so that segmentation stays off the GPU workers
+        sam = EfficientViTSamOnnxPredictor(EfficientViTSamOnnx(args.sam_onnx_dir, providers=args.sam_onnx_providers),
+                                           embedding_cache=embedding_cache)
+    else:
+        sam_model = fuse_for_inference(create_sam_model(name="xl1", weight_url=sam_path), inplace=True)
+        sam = EfficientViTSamPredictor(sam_model.to(device), embedding_cache=embedding_cache)
     return yolo_world, sam
 
 def load_model_hf(repo_id, filename, ckpt_config_filename, device='cpu'):
@@ -300,12 +405,13 @@ def resize_and_center_crop(image, output_size=(1024, 576)):
     return cropped_image
 
 def main(device, segment_type):
-    pipe, controller, pipe_concept = build_model_sd(args.pretrained_sdxl_model, args.openpose_checkpoint, device, prompts_tmp)
+    pipe, controller, pipe_concept = build_model_sd(args.pretrained_sdxl_model, args.openpose_checkpoint, device, prompts_tmp,
+                                                    concept_device=args.concept_device)
 
     if segment_type == 'GroundingDINO':
         detect_model, sam = build_dino_segment_model(args.dino_checkpoint, args.sam_checkpoint)
     else:
-        detect_model, sam = build_yolo_segment_model(args.efficientViT_checkpoint, device)
+        detect_model, sam = build_yolo_segment_model(args.efficientViT_checkpoint, device, args)
 
     resolution_list = ["1440*728",
                        "1344*768",
@@ -328,6 +434,23 @@ def main(device, segment_type):
     body_model = Body(args.pose_detector_checkpoint)
     openpose = OpenposeDetector(body_model)
 
+    controlnet_pool = build_controlnet_pool(pipe, device, args)
+
+    if args.lora_residency:
+        lora_pool = LoraResidencyManager(max_resident_adapters=args.max_resident_loras, fuse_style=args.fuse_style_lora)
+    else:
+        lora_pool = None
+
+    if args.prompt_cache_size > 0:
+        prompt_cache = PromptEmbeddingCache(max_bytes=int(args.prompt_cache_size * 1024 ** 2))
+    else:
+        prompt_cache = None
+
+    if args.stage1_cache_dir is not None:
+        stage1_cache = Stage1Cache(args.stage1_cache_dir, max_bytes=args.stage1_cache_size * 1024 ** 3)
+    else:
+        stage1_cache = None
+
     def remove_tips():
         return gr.update(visible=False)
 
@@ -367,125 +490,229 @@ def main(device, segment_type):
         image = Image.fromarray((image * 255.0).clip(0, 255).astype(np.uint8))
         return image
 
-    @spaces.GPU(duration=200)
-    def generate_image(prompt1, negative_prompt, man, woman, resolution, local_prompt1, local_prompt2, seed, condition, condition_img1, style):
-        # try:
+    def prepare_request(prompt1, negative_prompt, man, woman, resolution, local_prompt1, local_prompt2, seed, condition, condition_img, style):
+        # everything that does not need the diffusion pipelines, runs in the thread of the caller
         path1 = lorapath_man[man]
         path2 = lorapath_woman[woman]
-        pipe_concept.unload_lora_weights()
-        pipe.unload_lora_weights()
-        pipe_list = build_model_lora(pipe_concept, path1 + "|" + path2, lorapath_styles[style], condition, args, pipe)
 
         if lorapath_styles[style] is not None and os.path.exists(lorapath_styles[style]):
             styleL = True
         else:
             styleL = False
 
-        input_list = [prompt1]
-        condition_list = [condition_img1]
-        output_list = []
-
         width, height = int(resolution.split("*")[0]), int(resolution.split("*")[1])
 
-        kwargs = {
-            'height': height,
+        input_prompt = []
+        p = '{prompt}, 35mm photograph, film, professional, 4k, highly detailed.'
+        if styleL:
+            p = styles[style] + p
+        input_prompt.append([p.replace("{prompt}", prompt1), p.replace("{prompt}", prompt1)])
+        if styleL:
+            input_prompt.append([(styles[style] + local_prompt1, character_man.get(man)[1]),
+                                 (styles[style] + local_prompt2, character_woman.get(woman)[1])])
+        else:
+            input_prompt.append([(local_prompt1, character_man.get(man)[1]),
+                                 (local_prompt2, character_woman.get(woman)[1])])
+
+        if condition == 'Human pose' and condition_img is not None:
+            index = ratio_list.index(
+                min(ratio_list, key=lambda x: abs(x - condition_img.shape[1] / condition_img.shape[0])))
+            resolution = resolution_list[index]
+            width, height = int(resolution.split("*")[0]), int(resolution.split("*")[1])
+            condition_img = resize_and_center_crop(Image.fromarray(condition_img), (width, height))
+            spatial_condition = get_humanpose(condition_img)
+        elif condition == 'Canny Edge' and condition_img is not None:
+            index = ratio_list.index(
+                min(ratio_list, key=lambda x: abs(x - condition_img.shape[1] / condition_img.shape[0])))
+            resolution = resolution_list[index]
+            width, height = int(resolution.split("*")[0]), int(resolution.split("*")[1])
+            condition_img = resize_and_center_crop(Image.fromarray(condition_img), (width, height))
+            spatial_condition = get_cannyedge(condition_img)
+        elif condition == 'Depth' and condition_img is not None:
+            index = ratio_list.index(
+                min(ratio_list, key=lambda x: abs(x - condition_img.shape[1] / condition_img.shape[0])))
+            resolution = resolution_list[index]
+            width, height = int(resolution.split("*")[0]), int(resolution.split("*")[1])
+            condition_img = resize_and_center_crop(Image.fromarray(condition_img), (width, height))
+            spatial_condition = get_depth(condition_img)
+        else:
+            spatial_condition = None
+
+        return {
+            'prompt': prompt1,
+            'input_prompt': input_prompt,
+            'negative_prompt': negative_prompt,
+            'seed': seed,
             'width': width,
+            'height': height,
+            'condition': condition,
+            'condition_img': condition_img,
+            'spatial_condition': spatial_condition,
+            'path1': path1,
+            'path2': path2,
+            'style': style,
+            'styleL': styleL,
+        }
+
+    def batch_key(request):
+        # requests that can share one denoising batch
+        return (request['width'], request['height'], request['condition'], request['spatial_condition'] is not None,
+                request['path1'], request['path2'], request['style'])
+
+    def batch_prompts(requests):
+        # two copies of the global prompt per request, the region prompts are given per request
+        global_prompt = [p for request in requests for p in request['input_prompt'][0]]
+        region_prompts = []
+        for r in range(len(requests[0]['input_prompt'][1])):
+            region_prompts.append(([request['input_prompt'][1][r][0] for request in requests],
+                                   [request['input_prompt'][1][r][1] for request in requests]))
+        return [global_prompt, region_prompts]
+
+    def run_batch(requests):
+        first = requests[0]
+        if lora_pool is None:
+            pipe_concept.unload_lora_weights()
+            pipe.unload_lora_weights()
+            if prompt_cache is not None:
+                # the embeddings of the unloaded adapters are never hit again
+                prompt_cache.clear()
+        pipe_list, style_adapter = build_model_lora(pipe_concept, first['path1'] + "|" + first['path2'], lorapath_styles[first['style']], first['condition'], args, pipe, controlnet_pool, lora_pool)
+        styleL = first['styleL']
+
+        kwargs = {
+            'height': first['height'],
+            'width': first['width'],
+            'batched_concepts': args.batched_concepts,
+            'divergence_step': args.divergence_step,
+            'prompt_cache': prompt_cache,
+            'overlap_concepts': args.overlap_concepts,
         }
 
-        for prompt, condition_img in zip(input_list, condition_list):
-            if prompt!='':
-                input_prompt = []
-                p = '{prompt}, 35mm photograph, film, professional, 4k, highly detailed.'
-                if styleL:
-                    p = styles[style] + p
-                input_prompt.append([p.replace("{prompt}", prompt), p.replace("{prompt}", prompt)])
-                if styleL:
-                    input_prompt.append([(styles[style] + local_prompt1, character_man.get(man)[1]),
-                                         (styles[style] + local_prompt2, character_woman.get(woman)[1])])
-                else:
-                    input_prompt.append([(local_prompt1, character_man.get(man)[1]),
-                                         (local_prompt2, character_woman.get(woman)[1])])
-
-                if condition == 'Human pose' and condition_img is not None:
-                    index = ratio_list.index(
-                        min(ratio_list, key=lambda x: abs(x - condition_img.shape[1] / condition_img.shape[0])))
-                    resolution = resolution_list[index]
-                    width, height = int(resolution.split("*")[0]), int(resolution.split("*")[1])
-                    kwargs['height'] = height
-                    kwargs['width'] = width
-                    condition_img = resize_and_center_crop(Image.fromarray(condition_img), (width, height))
-                    spatial_condition = get_humanpose(condition_img)
-                elif condition == 'Canny Edge' and condition_img is not None:
-                    index = ratio_list.index(
-                        min(ratio_list, key=lambda x: abs(x - condition_img.shape[1] / condition_img.shape[0])))
-                    resolution = resolution_list[index]
-                    width, height = int(resolution.split("*")[0]), int(resolution.split("*")[1])
-                    kwargs['height'] = height
-                    kwargs['width'] = width
-                    condition_img = resize_and_center_crop(Image.fromarray(condition_img), (width, height))
-                    spatial_condition = get_cannyedge(condition_img)
-                elif condition == 'Depth' and condition_img is not None:
-                    index = ratio_list.index(
-                        min(ratio_list, key=lambda x: abs(x - condition_img.shape[1] / condition_img.shape[0])))
-                    resolution = resolution_list[index]
-                    width, height = int(resolution.split("*")[0]), int(resolution.split("*")[1])
-                    kwargs['height'] = height
-                    kwargs['width'] = width
-                    condition_img = resize_and_center_crop(Image.fromarray(condition_img), (width, height))
-                    spatial_condition = get_depth(condition_img)
-                else:
-                    spatial_condition = None
-
-                kwargs['spatial_condition'] = spatial_condition
-                controller.reset()
-                image = sample_image(
-                    pipe,
-                    input_prompt=input_prompt,
-                    concept_models=pipe_concept,
-                    input_neg_prompt=[negative_prompt] * len(input_prompt),
-                    generator=torch.Generator(device).manual_seed(seed),
-                    controller=controller,
-                    stage=1,
-                    lora_list=pipe_list,
-                    styleL=styleL,
-                    **kwargs)
-
-                controller.reset()
-                if pipe.tokenizer("man")["input_ids"][1] in pipe.tokenizer(args.prompt)["input_ids"][1:-1]:
-                    mask1 = predict_mask(detect_model, sam, image[0], 'man', args.segment_type, confidence=0.15,
-                                         threshold=0.5)
-                else:
-                    mask1 = None
-
-                if pipe.tokenizer("woman")["input_ids"][1] in pipe.tokenizer(args.prompt)["input_ids"][1:-1]:
-                    mask2 = predict_mask(detect_model, sam, image[0], 'woman', args.segment_type, confidence=0.15,
-                                         threshold=0.5)
-                else:
-                    mask2 = None
-
-                if mask1 is None and mask2 is None:
-                    output_list.append(image[1])
-                else:
-                    image = sample_image(
-                        pipe,
-                        input_prompt=input_prompt,
-                        concept_models=pipe_concept,
-                        input_neg_prompt=[negative_prompt] * len(input_prompt),
-                        generator=torch.Generator(device).manual_seed(seed),
-                        controller=controller,
-                        stage=2,
-                        region_masks=[mask1, mask2],
-                        lora_list=pipe_list,
-                        styleL=styleL,
-                        **kwargs)
-                    output_list.append(image[1])
+        def sample_requests(indices, stage, **stage_kwargs):
+            batch = [requests[n] for n in indices]
+            spatial_condition = [request['spatial_condition'] for request in batch] if first['spatial_condition'] is not None else None
+            return sample_image(
+                pipe,
+                input_prompt=batch_prompts(batch),
+                concept_models=pipe_concept,
+                input_neg_prompt=[request['negative_prompt'] for request in batch for _ in range(2)],
+                generator=[torch.Generator(device).manual_seed(request['seed']) for request in batch],
+                controller=controller,
+                stage=stage,
+                lora_list=pipe_list,
+                styleL=styleL,
+                style_adapter=style_adapter,
+                spatial_condition=spatial_condition,
+                **stage_kwargs,
+                **kwargs)
+
+        images = [None] * len(requests)
+        masks = [None] * len(requests)
+        latents = [None] * len(requests)
+        stage1_keys = [None] * len(requests)
+        for n, request in enumerate(requests):
+            if stage1_cache is not None:
+                stage1_keys[n] = stage1_cache.make_key(
+                    prompt=request['input_prompt'][0][0],
+                    negative_prompt=request['negative_prompt'],
+                    seed=request['seed'],
+                    resolution=(request['width'], request['height']),
+                    condition=request['condition'],
+                    condition_image=request['condition_img'] if request['spatial_condition'] is not None else None,
+                    lora_paths=(request['path1'], request['path2']),
+                    style=request['style'],
+                    segment_type=args.segment_type,
+                    mask_source=args.mask_source,
+                    divergence_step=args.divergence_step,
+                )
+                stage1_result = stage1_cache.get(stage1_keys[n])
+                if stage1_result is not None:
+                    images[n] = stage1_result["images"]
+                    masks[n] = stage1_result["masks"]
+                    latents[n] = stage1_result["latents"]
+
+        stage1_indices = [n for n in range(len(requests)) if images[n] is None]
+        if len(stage1_indices) > 0:
+            controller.reset()
+            subjects = ['man', 'woman']
+            if args.mask_source != 'detector':
+                # record the cross-attention of the subject tokens at the lowest UNet resolution
+                token_indices = []
+                for n in stage1_indices:
+                    input_ids = pipe.tokenizer(requests[n]['input_prompt'][0][0])["input_ids"][:pipe.tokenizer.model_max_length]
+                    token_indices.append([[i for i, input_id in enumerate(input_ids) if input_id == pipe.tokenizer(subject)["input_ids"][1]]
+                                          for subject in subjects])
+                # the latents are downsampled twice by stride-2 convolutions, which round up: 1440 -> 180 -> 90 -> 45, 728 -> 91 -> 46 -> 23
+                token_map_size = tuple(-(-(size // pipe.vae_scale_factor) // 4) for size in (first['height'], first['width']))
+                controller.set_token_maps(token_indices, size=token_map_size, num_tokens=pipe.tokenizer.model_max_length)
+            stage1_images = sample_requests(stage1_indices, stage=1)
+            stage1_latents = pipe.divergence_latents
+            token_maps = controller.get_token_maps() if args.mask_source != 'detector' else None
+            for k, n in enumerate(stage1_indices):
+                images[n] = stage1_images[2 * k: 2 * k + 2]
+                latents[n] = stage1_latents[2 * k: 2 * k + 2] if stage1_latents is not None else None
+
+            text_prompts = [text_prompt for text_prompt in subjects
+                            if pipe.tokenizer(text_prompt)["input_ids"][1] in pipe.tokenizer(args.prompt)["input_ids"][1:-1]]
+            # all requests of a batch share the resolution, the pipeline only looks at the masks at latent resolution
+            mask_size = (first['height'] // pipe.vae_scale_factor, first['width'] // pipe.vae_scale_factor)
+            detect_indices = stage1_indices
+            if token_maps is not None:
+                detect_indices = []
+                for k, n in enumerate(stage1_indices):
+                    subject_masks, confidences = attention_masks(token_maps[k], mask_size, threshold=args.attention_mask_threshold)
+                    masks[n] = [subject_masks[subjects.index(subject)] if subject in text_prompts else None for subject in subjects]
+                    confident = all(confidences[subjects.index(subject)] >= args.attention_mask_confidence for subject in text_prompts)
+                    if args.mask_source == 'attention_prior' and not confident:
+                        detect_indices.append(n)
+            if len(detect_indices) > 0:
+                stage1_masks = predict_masks_batch(detect_model, sam, [images[n][0] for n in detect_indices], text_prompts,
+                                                   args.segment_type, confidence=0.15, threshold=0.5, mask_size=mask_size)
+                for n, image_masks in zip(detect_indices, stage1_masks):
+                    detected = dict(zip(text_prompts, image_masks))
+                    masks[n] = [detected.get('man'), detected.get('woman')]
+
+            if stage1_cache is not None:
+                for n in stage1_indices:
+                    stage1_cache.put(stage1_keys[n], images[n], masks[n], latents=latents[n],
+                                     latents_step=kwargs['divergence_step'])
+
+        output_list = [image[1] for image in images]
+
+        # stage 2 only for the requests where a character was found
+        stage2_indices = [n for n in range(len(requests)) if any(mask is not None for mask in masks[n])]
+        if len(stage2_indices) > 0:
+            controller.reset()
+            if all(latents[n] is not None for n in stage2_indices):
+                resume_from_latents = torch.cat([latents[n].to(device) for n in stage2_indices])
             else:
-                output_list.append(None)
-        output_list.append(spatial_condition)
-        return output_list
-        # except:
-        #     print("error")
-        #     return
+                resume_from_latents = None
+            stage2_images = sample_requests(
+                stage2_indices,
+                stage=2,
+                region_masks=[[masks[n][r] for n in stage2_indices] for r in range(2)],
+                resume_from_latents=resume_from_latents)
+            for k, n in enumerate(stage2_indices):
+                output_list[n] = stage2_images[2 * k + 1]
+
+        return [[output, request['spatial_condition']] for output, request in zip(output_list, requests)]
+
+    if args.max_batch > 1:
+        # run_batch runs on the batcher thread and not inside generate_image, so @spaces.GPU does not
+        # cover it: batching needs a GPU the process owns, see parse_args for ZeroGPU
+        batcher = RequestBatcher(run_batch, max_batch=args.max_batch, max_wait=args.max_batch_wait)
+    else:
+        batcher = None
+
+    @spaces.GPU(duration=200)
+    def generate_image(prompt1, negative_prompt, man, woman, resolution, local_prompt1, local_prompt2, seed, condition, condition_img1, style):
+        request = prepare_request(prompt1, negative_prompt, man, woman, resolution, local_prompt1, local_prompt2,
+                                  seed, condition, condition_img1, style)
+        if prompt1 == '':
+            return [None, request['spatial_condition']]
+        if batcher is None:
+            return run_batch([request])[0]
+        return batcher(batch_key(request), request)
 
     def get_local_value_man(input):
         return character_man[input][0]
@@ -562,6 +789,9 @@ def main(device, segment_type):
             inputs=[prompt, negative_prompt, man, woman, resolution, local_prompt1, local_prompt2, seed, condition, condition_img1, style],
             outputs=[gallery, gen_condition]
         )
+    if args.max_batch > 1:
+        # concurrent requests have to reach the batcher at the same time
+        demo.queue(concurrency_count=args.max_batch)
     demo.launch(share=True)
 
 
@@ -582,7 +812,34 @@ def parse_args():
     parser.add_argument('--seed', default=22, type=int)
     parser.add_argument('--suffix', default='', type=str)
     parser.add_argument('--segment_type', default='yoloworld', help='GroundingDINO or yoloworld', type=str)
-    return parser.parse_args()
+    parser.add_argument('--mask_source', default='detector', choices=['detector', 'attention', 'attention_prior'],
+                        help='region masks from the detector and SAM, from the stage-1 cross-attention maps, or from the attention maps with the detector as fallback when they are not confident')
+    parser.add_argument('--attention_mask_threshold', default=0.5, type=float, help='normalized cross-attention above which a pixel belongs to a subject')
+    parser.add_argument('--attention_mask_confidence', default=0.4, type=float, help='attention contrast inside/outside a mask above which the detector is skipped with --mask_source attention_prior')
+    parser.add_argument('--stage1_cache_dir', default=None, type=str, help='directory of the stage-1 image/mask cache, disabled if not set')
+    parser.add_argument('--stage1_cache_size', default=8, type=float, help='size limit of the stage-1 cache in GB')
+    parser.add_argument('--divergence_step', default=16, type=int, help='first denoising step where stage 2 differs from stage 1')
+    parser.add_argument('--controlnet_offload', action='store_true', help='keep inactive ControlNets in pinned CPU memory')
+    parser.add_argument('--controlnet_preload', action='store_true', help='load every ControlNet variant in the background at startup')
+    parser.add_argument('--lora_residency', action='store_true', help='keep LoRA adapters resident across requests instead of reloading them')
+    parser.add_argument('--max_resident_loras', default=8, type=int, help='number of LoRA adapters kept resident per pipeline')
+    parser.add_argument('--fuse_style_lora', action='store_true', help='fuse the style LoRA into the base pipeline while it is reused')
+    parser.add_argument('--prompt_cache_size', default=256, type=float, help='size limit of the on-device prompt embedding cache in MB, 0 disables it')
+    parser.add_argument('--concept_device', default=None, type=str, help='device of the concept pipeline, e.g. cuda:1, defaults to the base pipeline device')
+    parser.add_argument('--overlap_concepts', action='store_true', help='run the region concepts on a side CUDA stream next to the base UNet')
+    parser.add_argument('--batched_concepts', action='store_true', help='run all region concepts in one batched UNet call during stage 2')
+    parser.add_argument('--max_batch', default=1, type=int, help='max number of concurrent requests denoised in one batch, 1 disables batching')
+    parser.add_argument('--max_batch_wait', default=0.05, type=float, help='max time in seconds a request waits for others to share its batch')
+    parser.add_argument('--sam_cache_size', default=0, type=float, help='size limit of the on-device SAM image embedding cache in MB, 0 disables it')
+    parser.add_argument('--sam_cache_dir', default=None, type=str, help='directory where SAM image embeddings evicted from the device are spilled')
+    parser.add_argument('--sam_backend', default='torch', choices=['torch', 'onnx'], help='run EfficientViT-SAM with PyTorch on the GPU or with ONNX Runtime, on the CPU unless --sam_onnx_providers says otherwise')
+    parser.add_argument('--sam_onnx_dir', default='./checkpoint/sam/onnx', type=str, help='directory of the exported EfficientViT-SAM onnx graphs, exported at startup if missing')
+    parser.add_argument('--sam_onnx_providers', default=['CPUExecutionProvider'], nargs='+', type=str, help='ONNX Runtime execution providers of the onnx SAM backend, e.g. CUDAExecutionProvider CPUExecutionProvider to run it on the GPU')
+    args = parser.parse_args()
+    if args.max_batch > 1 and os.getenv('SPACES_ZERO_GPU', '').lower() in ('1', 't', 'true'):
+        # on ZeroGPU only the @spaces.GPU function holds a GPU, batches run on the batcher thread outside of it
+        parser.error('--max_batch > 1 is not supported on ZeroGPU Spaces')
+    return args
 
 if __name__ == '__main__':
     args = parse_args()
@@ -0,0 +1,94 @@
+"""Load test of ModelExecutor: concurrent clients against a stand-in model.
+
+The stand-in model spends `--compute-ms` in NumPy (which releases the GIL, like the ONNX
+Runtime and torch calls of real models) and `--python-ms` in Python code holding the GIL.
+
+    python -m benchmarks.bench_model_executor --clients 64 --requests 2000 --workers 4
+"""
+import argparse
+import asyncio
+import time
+
+import numpy as np
+
+from inference.core.exceptions import InferenceQueueFull
+from inference.core.managers.executors import EXECUTOR_TYPES, ModelExecutor
+from inference.core.registries.base import ModelRegistry
+
+MODEL_ID = "stand-in/1"
+
+
+class StandInModel:
+    compute_ms = 5.0
+    python_ms = 0.5
+
+    def __init__(self, model_id: str, api_key: str):
+        self.weights = np.random.rand(256, 256).astype(np.float32)
+
+    def infer_from_request(self, request):
+        deadline = time.perf_counter() + self.compute_ms / 1000
+        x = self.weights
+        while time.perf_counter() < deadline:
+            x = np.tanh(x @ self.weights)
+        deadline = time.perf_counter() + self.python_ms / 1000
+        while time.perf_counter() < deadline:
+            pass
+        return request
+
+
+async def load_test(executor: ModelExecutor, model: StandInModel, clients: int, requests: int):
+    latencies, rejected = [], 0
+    remaining = iter(range(requests))
+    load_args = (MODEL_ID, None, None)
+
+    async def client():
+        nonlocal rejected
+        for request in remaining:
+            start = time.perf_counter()
+            try:
+                await executor.infer_from_request(MODEL_ID, model, request, model_load_args=load_args)
+                latencies.append(time.perf_counter() - start)
+            except InferenceQueueFull:
+                rejected += 1
+                # a client backing off before retrying, as on a 503
+                await asyncio.sleep(0.01)
+
+    if executor.executor_type == "process":
+        # the worker processes load the model on their first call, keep that out of the timing
+        await asyncio.gather(
+            *[executor.infer_from_request(MODEL_ID, model, -1, model_load_args=load_args) for _ in range(executor.workers)]
+        )
+    start = time.perf_counter()
+    await asyncio.gather(*[client() for _ in range(clients)])
+    return time.perf_counter() - start, np.array(latencies) * 1000, rejected
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--executor-types", nargs="+", default=list(EXECUTOR_TYPES), choices=EXECUTOR_TYPES)
+    parser.add_argument("--clients", type=int, default=64)
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--queue-size", type=int, default=32)
+    parser.add_argument("--compute-ms", type=float, default=StandInModel.compute_ms)
+    parser.add_argument("--python-ms", type=float, default=StandInModel.python_ms)
+    args = parser.parse_args()
+
+    StandInModel.compute_ms = args.compute_ms
+    StandInModel.python_ms = args.python_ms
+    registry = ModelRegistry({MODEL_ID: StandInModel})
+    model = StandInModel(MODEL_ID, None)
+
+    print(f"{'executor':>8} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'rejected':>9}")
+    for executor_type in args.executor_types:
+        executor = ModelExecutor(registry, executor_type, workers=args.workers, queue_size=args.queue_size)
+        elapsed, latencies, rejected = asyncio.run(load_test(executor, model, args.clients, args.requests))
+        executor.remove(MODEL_ID)
+        print(
+            f"{executor_type:>8} {len(latencies) / elapsed:>8.1f} {np.percentile(latencies, 50):>8.2f} "
+            f"{np.percentile(latencies, 99):>8.2f} {rejected:>9}"
+        )
+
+
+if __name__ == "__main__":
+    main()
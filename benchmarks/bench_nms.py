@@ -0,0 +1,62 @@
+"""Times w_np_non_max_suppression against the per-class loop it replaced.
+
+    python -m benchmarks.bench_nms --candidates 1000 5000 30000 --classes 1 10 80
+"""
+import argparse
+import time
+
+import numpy as np
+
+from inference.core.nms import w_np_non_max_suppression
+from tests.test_nms import random_prediction, reference_w_np_non_max_suppression
+
+
+def timeit(fn, prediction, repeats):
+    best = float("inf")
+    for _ in range(repeats):
+        # both implementations convert the boxes in place
+        prediction_copy = prediction.copy()
+        start = time.perf_counter()
+        result = fn(prediction_copy)
+        best = min(best, time.perf_counter() - start)
+    return best * 1000, result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--candidates", type=int, nargs="+", default=[1000, 5000, 10000, 30000])
+    parser.add_argument("--classes", type=int, nargs="+", default=[1, 10, 80])
+    parser.add_argument("--batch-size", type=int, default=1)
+    parser.add_argument("--conf-thresh", type=float, default=0.25)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    kwargs = dict(
+        conf_thresh=args.conf_thresh,
+        iou_thresh=0.45,
+        class_agnostic=False,
+        max_detections=300,
+        num_masks=0,
+        box_format="xywh",
+    )
+    print(f"{'candidates':>10} {'classes':>7} {'loop ms':>9} {'current ms':>10} {'speedup':>8} {'kept':>5}")
+    for num_candidates in args.candidates:
+        for num_classes in args.classes:
+            prediction = random_prediction(rng, args.batch_size, num_candidates, num_classes, 0)
+            loop_ms, _ = timeit(lambda p: reference_w_np_non_max_suppression(p, **kwargs), prediction, args.repeats)
+            # no candidate cap, so that both see the same boxes
+            current_ms, result = timeit(
+                lambda p: w_np_non_max_suppression(p, max_candidate_detections=None, **kwargs),
+                prediction,
+                args.repeats,
+            )
+            kept = sum(len(image) for image in result)
+            print(
+                f"{num_candidates:>10} {num_classes:>7} {loop_ms:>9.2f} {current_ms:>10.2f} "
+                f"{loop_ms / current_ms:>7.2f}x {kept:>5}"
+            )
+
+
+if __name__ == "__main__":
+    main()
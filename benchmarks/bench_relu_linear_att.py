@@ -0,0 +1,51 @@
+"""Times LiteMLA.relu_linear_att against relu_linear_att_inference.
+
+    python -m benchmarks.bench_relu_linear_att --device cuda --dtype float16
+"""
+import argparse
+import time
+
+import torch
+
+from src.efficientvit.models.nn.ops import LiteMLA
+
+
+def timeit(fn, qkv, warmup, iters, device):
+    for _ in range(warmup):
+        fn(qkv)
+    if device.type == "cuda":
+        torch.cuda.synchronize(device)
+    start = time.perf_counter()
+    for _ in range(iters):
+        fn(qkv)
+    if device.type == "cuda":
+        torch.cuda.synchronize(device)
+    return (time.perf_counter() - start) / iters * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--device", default="cuda" if torch.cuda.is_available() else "cpu")
+    parser.add_argument("--dtype", default="float32", choices=["float32", "float16", "bfloat16"])
+    parser.add_argument("--batch", type=int, default=1)
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--iters", type=int, default=50)
+    args = parser.parse_args()
+
+    device = torch.device(args.device)
+    dtype = getattr(torch, args.dtype)
+    # stage widths and feature sizes of the EfficientViT-SAM xl1 encoder at 1024x1024
+    shapes = [(256, 64), (512, 32), (1024, 16)]
+    print(f"{'channels':>8} {'size':>5} {'reference ms':>13} {'inference ms':>13} {'speedup':>8} {'max abs diff':>13}")
+    with torch.inference_mode():
+        for channels, size in shapes:
+            att = LiteMLA(channels, channels, dim=32).eval().to(device)
+            qkv = torch.randn(args.batch, 6 * channels, size, size, device=device, dtype=dtype)
+            reference = timeit(att.relu_linear_att, qkv, args.warmup, args.iters, device)
+            inference = timeit(lambda x: att.relu_linear_att_inference(x.clone()), qkv, args.warmup, args.iters, device)
+            diff = (att.relu_linear_att(qkv) - att.relu_linear_att_inference(qkv.clone()).float()).abs().max().item()
+            print(f"{channels:>8} {size:>5} {reference:>13.3f} {inference:>13.3f} {reference / inference:>7.2f}x {diff:>13.2e}")
+
+
+if __name__ == "__main__":
+    main()
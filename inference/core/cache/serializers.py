@@ -4,6 +4,7 @@ from fastapi.encoders import jsonable_encoder
 
 from inference.core.devices.utils import GLOBAL_INFERENCE_SERVER_ID
 from inference.core.entities.requests.inference import InferenceRequest
+from inference.core.entities.responses.detections import DetectionsInferenceResponse
 from inference.core.entities.responses.inference import InferenceResponse
 from inference.core.env import TINY_CACHE
 from inference.core.logger import logger
@@ -20,7 +21,7 @@ def to_cachable_inference_item(
             "inference_server_version": __version__,
             "inference_server_id": GLOBAL_INFERENCE_SERVER_ID,
             "request": jsonable_encoder(infer_request),
-            "response": jsonable_encoder(infer_response),
+            "response": jsonable_encoder(to_serialisable_response(infer_response)),
         }
 
     included_request_fields = {
@@ -43,12 +44,39 @@ def to_cachable_inference_item(
     }
 
 
+def to_serialisable_response(
+    infer_response: Union[InferenceResponse, list[InferenceResponse]]
+) -> Union[InferenceResponse, dict, list]:
+    if isinstance(infer_response, list):
+        return [to_serialisable_response(response) for response in infer_response]
+    if isinstance(infer_response, DetectionsInferenceResponse):
+        return infer_response.dict(by_alias=True)
+    return infer_response
+
+
 def build_condensed_response(responses):
     if not isinstance(responses, list):
         responses = [responses]
 
     formatted_responses = []
     for response in responses:
+        if isinstance(response, DetectionsInferenceResponse):
+            # straight from the columns, without materializing the predictions
+            if len(response.confidence) == 0:
+                continue
+            predictions = [
+                {"confidence": confidence, "class": response.class_names[class_id]}
+                for confidence, class_id in zip(
+                    response.confidence.tolist(), response.class_id.tolist()
+                )
+            ]
+            formatted_responses.append(
+                {
+                    "predictions": predictions,
+                    "time": response.time,
+                }
+            )
+            continue
         if not getattr(response, "predictions", None):
             continue
         try:
@@ -54,7 +54,7 @@ class InferenceRequestImage(BaseModel):
     value: Optional[Any] = Field(
         None,
         examples=["http://www.example-image-url.com"],
-        description="Image data corresponding to the image type, if type = 'url' then value is a string containing the url of an image, else if type = 'base64' then value is a string containing base64 encoded image data, else if type = 'numpy' then value is binary numpy data serialized using pickle.dumps(); array should 3 dimensions, channels last, with values in the range [0,255].",
+        description="Image data corresponding to the image type, if type = 'url' then value is a string containing the url of an image, else if type = 'base64' then value is a string containing base64 encoded image data, else if type = 'bytes' then value is the encoded image (e.g. JPEG or PNG) as bytes, else if type = 'numpy' then value is binary numpy data serialized using pickle.dumps(); array should 3 dimensions, channels last, with values in the range [0,255].",
     )
 
 
@@ -0,0 +1,284 @@
+import base64
+import json
+from typing import Any, Dict, List, Optional, Sequence, Set, Type, Union
+from uuid import uuid4
+
+import numpy as np
+
+from inference.core.entities.responses.inference import (
+    InferenceResponseImage,
+    InstanceSegmentationInferenceResponse,
+    KeypointsDetectionInferenceResponse,
+    ObjectDetectionInferenceResponse,
+)
+from inference.core.exceptions import ModelArtefactError
+
+PREDICTION_ROW_WIDTH = 7
+
+
+class DetectionsInferenceResponse:
+    """Object detection, instance segmentation or keypoints detection result of one image, stored as columns.
+
+    The boxes stay in NumPy arrays from postprocessing on, the response schema of
+    `ObjectDetectionInferenceResponse`, `InstanceSegmentationInferenceResponse` or
+    `KeypointsDetectionInferenceResponse` is only produced when the response is serialized with
+    `dict` or `json`. Accessing `predictions` materializes the pydantic response; from then on it
+    is the source of truth, so that edits to the predictions (e.g. tracker ids) are serialized.
+
+    Attributes:
+        xyxy (np.ndarray): (N, 4) boxes as x1, y1, x2, y2 pixel coordinates.
+        confidence (np.ndarray): (N,) detection confidences.
+        class_id (np.ndarray): (N,) class ids.
+        class_names (List[str]): The class names of the model, indexed by class id.
+        image (InferenceResponseImage): The size of the image used in inference.
+        class_confidence (Optional[np.ndarray]): (N,) class confidences, if reported.
+        polygons (Optional[List[np.ndarray]]): One (P, 2) instance polygon per detection.
+        keypoints (Optional[np.ndarray]): (N, K, 3) keypoints as x, y, confidence.
+        keypoints_class_id (Optional[np.ndarray]): (N,) ids of the keypoints metadata entry per detection.
+        keypoints_metadata (Optional[dict]): Maps a keypoints class id to the names of its keypoints.
+        keypoint_confidence_threshold (float): Keypoints below this confidence are left out.
+        frame_id (Optional[int]): The frame id of the image used in inference if the input was a video.
+        time (Optional[float]): The time in seconds it took to produce the predictions.
+        visualization (Optional[Any]): The prediction visualization image data.
+    """
+
+    def __init__(
+        self,
+        xyxy: np.ndarray,
+        confidence: np.ndarray,
+        class_id: np.ndarray,
+        class_names: List[str],
+        image: InferenceResponseImage,
+        class_confidence: Optional[np.ndarray] = None,
+        polygons: Optional[List[np.ndarray]] = None,
+        keypoints: Optional[np.ndarray] = None,
+        keypoints_class_id: Optional[np.ndarray] = None,
+        keypoints_metadata: Optional[dict] = None,
+        keypoint_confidence_threshold: float = 0.0,
+        frame_id: Optional[int] = None,
+        time: Optional[float] = None,
+        visualization: Optional[Any] = None,
+    ):
+        self.xyxy = xyxy
+        self.confidence = confidence
+        self.class_id = class_id
+        self.class_names = class_names
+        self.image = image
+        self.class_confidence = class_confidence
+        self.polygons = polygons
+        self.keypoints = keypoints
+        self.keypoints_class_id = keypoints_class_id
+        self.keypoints_metadata = keypoints_metadata
+        self.keypoint_confidence_threshold = keypoint_confidence_threshold
+        self.frame_id = frame_id
+        self.time = time
+        self.visualization = visualization
+        self._detection_ids = None
+        self._response = None
+
+    @property
+    def response_class(
+        self,
+    ) -> Type[
+        Union[
+            ObjectDetectionInferenceResponse,
+            InstanceSegmentationInferenceResponse,
+            KeypointsDetectionInferenceResponse,
+        ]
+    ]:
+        """The pydantic response type whose schema this response serializes to."""
+        if self.polygons is not None:
+            return InstanceSegmentationInferenceResponse
+        if self.keypoints is not None:
+            return KeypointsDetectionInferenceResponse
+        return ObjectDetectionInferenceResponse
+
+    @property
+    def detection_ids(self) -> List[str]:
+        """Unique identifiers of the detections, generated on first use."""
+        if self._detection_ids is None:
+            self._detection_ids = [str(uuid4()) for _ in range(len(self.confidence))]
+        return self._detection_ids
+
+    @property
+    def predictions(self) -> list:
+        """The per-detection pydantic predictions, see `to_response`."""
+        return self.to_response().predictions
+
+    def to_response(
+        self,
+    ) -> Union[
+        ObjectDetectionInferenceResponse,
+        InstanceSegmentationInferenceResponse,
+        KeypointsDetectionInferenceResponse,
+    ]:
+        """Materializes the pydantic response, once.
+
+        Returns:
+            Union[ObjectDetectionInferenceResponse, InstanceSegmentationInferenceResponse, KeypointsDetectionInferenceResponse]:
+            The response, with the current `frame_id`, `time` and `visualization`.
+        """
+        if self._response is None:
+            self._response = self.response_class(
+                predictions=self._prediction_dicts(by_alias=True, exclude_none=True),
+                image=self.image,
+            )
+        self._response.frame_id = self.frame_id
+        self._response.time = self.time
+        self._response.visualization = self.visualization
+        return self._response
+
+    def dict(
+        self,
+        by_alias: bool = False,
+        exclude_none: bool = False,
+        exclude: Optional[Set[str]] = None,
+        **kwargs,
+    ) -> Dict[str, Any]:
+        """Serializes the response like `BaseModel.dict` of its `response_class` would.
+
+        Args:
+            by_alias (bool): Whether to use the "class" alias of the class name field.
+            exclude_none (bool): Whether to leave out fields that are None.
+            exclude (Optional[Set[str]]): Top level fields to leave out.
+
+        Returns:
+            Dict[str, Any]: The response in the schema of `response_class`.
+        """
+        if self._response is not None or len(kwargs) > 0:
+            return self.to_response().dict(
+                by_alias=by_alias, exclude_none=exclude_none, exclude=exclude, **kwargs
+            )
+        result = {
+            "frame_id": self.frame_id,
+            "time": self.time,
+            "image": {"width": self.image.width, "height": self.image.height},
+            "visualization": self.visualization,
+        }
+        if exclude_none:
+            result = {key: value for key, value in result.items() if value is not None}
+        result["predictions"] = self._prediction_dicts(
+            by_alias=by_alias, exclude_none=exclude_none
+        )
+        if exclude:
+            result = {key: value for key, value in result.items() if key not in exclude}
+        return result
+
+    def json(self, by_alias: bool = False, exclude_none: bool = False, **kwargs) -> str:
+        """Serializes the response to a JSON string, the visualization is base64 encoded."""
+        if self._response is not None:
+            return self.to_response().json(
+                by_alias=by_alias, exclude_none=exclude_none, **kwargs
+            )
+        result = self.dict(by_alias=by_alias, exclude_none=exclude_none, **kwargs)
+        if result.get("visualization") is not None:
+            result["visualization"] = base64.b64encode(result["visualization"]).decode(
+                "utf-8"
+            )
+        return json.dumps(result)
+
+    def _prediction_dicts(
+        self, by_alias: bool, exclude_none: bool
+    ) -> List[Dict[str, Any]]:
+        count = len(self.confidence)
+        if count == 0:
+            return []
+        xyxy = np.asarray(self.xyxy, dtype=np.float64)
+        class_ids = np.asarray(self.class_id).astype(int).tolist()
+        # one vectorized pass and one tolist per column instead of per-box arithmetic
+        columns = {
+            "x": ((xyxy[:, 0] + xyxy[:, 2]) / 2).tolist(),
+            "y": ((xyxy[:, 1] + xyxy[:, 3]) / 2).tolist(),
+            "width": (xyxy[:, 2] - xyxy[:, 0]).tolist(),
+            "height": (xyxy[:, 3] - xyxy[:, 1]).tolist(),
+            "confidence": np.asarray(self.confidence, dtype=np.float64).tolist(),
+            "class" if by_alias else "class_name": [
+                self.class_names[class_id] for class_id in class_ids
+            ],
+            "class_confidence": None
+            if self.class_confidence is None
+            else np.asarray(self.class_confidence, dtype=np.float64).tolist(),
+        }
+        if self.polygons is not None:
+            columns["points"] = [
+                [{"x": x, "y": y} for x, y in np.asarray(polygon).reshape(-1, 2).tolist()]
+                for polygon in self.polygons
+            ]
+        columns["class_id"] = class_ids
+        if self.polygons is None:
+            columns["tracker_id"] = None
+        columns["detection_id"] = self.detection_ids
+        columns["parent_id"] = None
+        if self.keypoints is not None:
+            columns["keypoints"] = self._keypoint_dicts()
+        if exclude_none:
+            columns = {key: value for key, value in columns.items() if value is not None}
+        keys = list(columns.keys())
+        values = [
+            [None] * count if value is None else value for value in columns.values()
+        ]
+        return [dict(zip(keys, row)) for row in zip(*values)]
+
+    def _keypoint_dicts(self) -> List[List[Dict[str, Any]]]:
+        if self.keypoints_metadata is None:
+            raise ModelArtefactError("Keypoints metadata not available.")
+        keypoints = np.asarray(self.keypoints, dtype=np.float64).tolist()
+        keypoints_class_ids = np.asarray(self.keypoints_class_id).astype(int).tolist()
+        results = []
+        for detection_keypoints, keypoints_class_id in zip(
+            keypoints, keypoints_class_ids
+        ):
+            keypoint_id2name = self.keypoints_metadata[keypoints_class_id]
+            results.append(
+                [
+                    {
+                        "x": x,
+                        "y": y,
+                        "confidence": confidence,
+                        "class_id": keypoint_id,
+                        "class_name": keypoint_id2name[keypoint_id],
+                    }
+                    # Ultralytics only supports single class keypoint detection, so points might be padded with zeros
+                    for keypoint_id, (x, y, confidence) in enumerate(
+                        detection_keypoints[: len(keypoint_id2name)]
+                    )
+                    if confidence >= self.keypoint_confidence_threshold
+                ]
+            )
+        return results
+
+
+def as_prediction_array(
+    predictions: Sequence[Sequence[float]], width: int = PREDICTION_ROW_WIDTH
+) -> np.ndarray:
+    """Stacks the postprocessed rows of one image, [x1, y1, x2, y2, conf, class_conf, class_id, ...].
+
+    Args:
+        predictions (Sequence[Sequence[float]]): The rows, possibly empty.
+        width (int): The row width assumed when there are no rows.
+
+    Returns:
+        np.ndarray: A (N, width) float64 array.
+    """
+    if len(predictions) == 0:
+        return np.zeros((0, width), dtype=np.float64)
+    return np.asarray(predictions, dtype=np.float64)
+
+
+def class_filter_mask(
+    class_id: np.ndarray, class_names: List[str], class_filter: Optional[List[str]]
+) -> np.ndarray:
+    """Selects the detections whose class is in `class_filter`, all of them if it is empty.
+
+    Args:
+        class_id (np.ndarray): (N,) class ids.
+        class_names (List[str]): The class names, indexed by class id.
+        class_filter (Optional[List[str]]): The class names to keep.
+
+    Returns:
+        np.ndarray: An (N,) boolean mask.
+    """
+    if not class_filter:
+        return np.ones(len(class_id), dtype=bool)
+    kept_ids = [idx for idx, name in enumerate(class_names) if name in class_filter]
+    return np.isin(class_id, kept_ids)
@@ -125,6 +125,12 @@ DISABLE_PREPROC_STATIC_CROP = str2bool(os.getenv("DISABLE_PREPROC_STATIC_CROP",
 # Flag to disable version check, default is False
 DISABLE_VERSION_CHECK = str2bool(os.getenv("DISABLE_VERSION_CHECK", False))
 
+# Flag to merge concurrent requests to the same model into one batch, default is False
+DYNAMIC_BATCHING_ENABLED = str2bool(os.getenv("DYNAMIC_BATCHING_ENABLED", False))
+
+# Seconds a request waits for others to share its batch, default is 0.005
+DYNAMIC_BATCHING_MAX_WAIT = float(os.getenv("DYNAMIC_BATCHING_MAX_WAIT", 0.005))
+
 # ElastiCache endpoint
 ELASTICACHE_ENDPOINT = os.environ.get(
     "ELASTICACHE_ENDPOINT",
@@ -213,6 +219,16 @@ METRICS_URL = os.getenv("METRICS_URL", f"{API_BASE_URL}/inference-stats")
 # Model cache directory, default is "/tmp/cache"
 MODEL_CACHE_DIR = os.getenv("MODEL_CACHE_DIR", "/tmp/cache")
 
+# Where ModelManager runs model calls, one of "none" (on the event loop), "thread" or "process" pools per model, default is "thread"
+# In "process" mode every worker loads the model besides the server process, each model takes MODEL_EXECUTOR_WORKERS + 1 times its memory
+MODEL_EXECUTOR_TYPE = os.getenv("MODEL_EXECUTOR_TYPE", "thread")
+
+# Number of model executor workers per model, default is 1
+MODEL_EXECUTOR_WORKERS = int(os.getenv("MODEL_EXECUTOR_WORKERS", 1))
+
+# Number of model calls that may wait for a model executor worker before requests are rejected, default is 32
+MODEL_EXECUTOR_QUEUE_SIZE = int(os.getenv("MODEL_EXECUTOR_QUEUE_SIZE", 32))
+
 # Model ID, default is None
 MODEL_ID = os.getenv("MODEL_ID")
 
@@ -281,6 +297,12 @@ TENSORRT_CACHE_PATH = os.getenv("TENSORRT_CACHE_PATH", MODEL_CACHE_DIR)
 # Set TensorRT cache path
 os.environ["ORT_TENSORRT_CACHE_PATH"] = TENSORRT_CACHE_PATH
 
+# YOLO-World per-class text embedding store, default is MODEL_CACHE_DIR/yolo_world/text_embeddings
+YOLO_WORLD_TEXT_EMBEDDINGS_DIR = os.getenv(
+    "YOLO_WORLD_TEXT_EMBEDDINGS_DIR",
+    os.path.join(MODEL_CACHE_DIR, "yolo_world", "text_embeddings"),
+)
+
 # Version check mode, one of "once" or "continuous", default is "once"
 VERSION_CHECK_MODE = os.getenv("VERSION_CHECK_MODE", "once")
 
@@ -30,6 +30,14 @@ class InferenceModelNotFound(Exception):
     """
 
 
+class InferenceQueueFull(Exception):
+    """Raised when a model has too many requests queued.
+
+    Attributes:
+        message (str): Optional message describing the error.
+    """
+
+
 class InvalidEnvironmentVariableError(Exception):
     """Raised when an environment variable is invalid.
 
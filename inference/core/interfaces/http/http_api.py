@@ -1,4 +1,3 @@
-import base64
 import traceback
 from functools import partial, wraps
 from time import sleep
@@ -97,10 +96,12 @@ from inference.core.exceptions import (
     ContentTypeInvalid,
     ContentTypeMissing,
     InferenceModelNotFound,
+    InferenceQueueFull,
     InputImageLoadError,
     InvalidEnvironmentVariableError,
     InvalidMaskDecodeArgument,
     InvalidModelIDError,
+    InvalidNumpyInput,
     MalformedRoboflowAPIResponseError,
     MalformedWorkflowResponseError,
     MissingApiKeyError,
@@ -126,6 +127,7 @@ from inference.core.roboflow_api import (
     get_roboflow_workspace,
     get_workflow_specification,
 )
+from inference.core.utils.image_utils import ImageType, load_image_from_raw_buffer
 from inference.core.utils.notebooks import start_notebook
 from inference.enterprise.workflows.complier.core import compile_and_execute_async
 from inference.enterprise.workflows.complier.entities import StepExecutionMode
@@ -146,6 +148,32 @@ if METLO_KEY:
 
 from inference.core.version import __version__
 
+IMAGE_SHAPE_HEADER = "X-Image-Shape"
+IMAGE_DTYPE_HEADER = "X-Image-Dtype"
+
+
+def binary_request_image(data: bytes, headers: Any) -> InferenceRequestImage:
+    """
+    Wraps the body of a binary request, without copying it.
+
+    Args:
+        data (bytes): The request body or multipart file content.
+        headers (Any): The headers describing `data`. With an `X-Image-Shape` header (e.g. "480,640,3")
+            and an optional `X-Image-Dtype` header (default "uint8") the data are raw BGR pixels,
+            otherwise an encoded image such as a JPEG or PNG.
+
+    Returns:
+        InferenceRequestImage: The request image.
+    """
+    if IMAGE_SHAPE_HEADER in headers:
+        image = load_image_from_raw_buffer(
+            data,
+            shape=headers[IMAGE_SHAPE_HEADER],
+            dtype=headers.get(IMAGE_DTYPE_HEADER, "uint8"),
+        )
+        return InferenceRequestImage(type=ImageType.NUMPY_OBJECT.value, value=image)
+    return InferenceRequestImage(type=ImageType.BYTES.value, value=data)
+
 
 def with_route_exceptions(route):
     """
@@ -169,6 +197,7 @@ def with_route_exceptions(route):
             InputImageLoadError,
             InvalidModelIDError,
             InvalidMaskDecodeArgument,
+            InvalidNumpyInput,
             MissingApiKeyError,
             RuntimePayloadError,
         ) as e:
@@ -203,7 +232,7 @@ def with_route_exceptions(route):
         ) as e:
             resp = JSONResponse(status_code=502, content={"message": str(e)})
             traceback.print_exc()
-        except RoboflowAPIConnectionError as e:
+        except (RoboflowAPIConnectionError, InferenceQueueFull) as e:
             resp = JSONResponse(status_code=503, content={"message": str(e)})
             traceback.print_exc()
         except Exception:
@@ -912,7 +941,7 @@ class HttpInterface(BaseInterface):
                             "authorizer"
                         ]["lambda"]["actor"]
                         trackUsage(yolo_world_model_id, actor)
-                    return response
+                    return orjson_response(response)
 
             if CORE_MODEL_DOCTR_ENABLED:
 
@@ -1172,7 +1201,7 @@ class HttpInterface(BaseInterface):
                 ),
                 image_type: Optional[str] = Query(
                     "base64",
-                    description="One of base64 or numpy. Note, numpy input is not supported for Roboflow Hosted Inference.",
+                    description="One of base64 or numpy. Note, numpy input is not supported for Roboflow Hosted Inference. Prefer an application/octet-stream body with the encoded image, or with raw pixels described by X-Image-Shape / X-Image-Dtype headers, over pickled numpy.",
                 ),
                 labels: Optional[bool] = Query(
                     False,
@@ -1268,10 +1297,15 @@ class HttpInterface(BaseInterface):
                         )
                     if "multipart/form-data" in request.headers["Content-Type"]:
                         form_data = await request.form()
-                        base64_image_str = await form_data["file"].read()
-                        base64_image_str = base64.b64encode(base64_image_str)
-                        request_image = InferenceRequestImage(
-                            type="base64", value=base64_image_str.decode("ascii")
+                        image_file = form_data["file"]
+                        request_image = binary_request_image(
+                            await image_file.read(), image_file.headers
+                        )
+                    elif (
+                        "application/octet-stream" in request.headers["Content-Type"]
+                    ):
+                        request_image = binary_request_image(
+                            await request.body(), request.headers
                         )
                     elif (
                         "application/x-www-form-urlencoded"
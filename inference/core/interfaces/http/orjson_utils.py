@@ -5,6 +5,7 @@ import orjson
 from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel
 
+from inference.core.entities.responses.detections import DetectionsInferenceResponse
 from inference.core.entities.responses.inference import InferenceResponse
 from inference.core.utils.image_utils import ImageType, encode_image_to_jpeg_bytes
 
@@ -28,8 +29,16 @@ def default(obj: Any) -> JSON:
 
 
 def orjson_response(
-    response: Union[List[InferenceResponse], InferenceResponse, BaseModel]
+    response: Union[
+        List[InferenceResponse],
+        InferenceResponse,
+        List[DetectionsInferenceResponse],
+        DetectionsInferenceResponse,
+        BaseModel,
+    ]
 ) -> ORJSONResponseBytes:
+    # DetectionsInferenceResponse builds the response schema straight from its columns,
+    # without pydantic models in between
     if isinstance(response, list):
         content = [r.dict(by_alias=True, exclude_none=True) for r in response]
     else:
@@ -1,4 +1,5 @@
 import time
+from functools import partial
 from typing import Dict, List, Optional, Tuple
 
 import numpy as np
@@ -11,16 +12,20 @@ from inference.core.entities.requests.inference import InferenceRequest
 from inference.core.entities.responses.inference import InferenceResponse
 from inference.core.env import (
     DISABLE_INFERENCE_CACHE,
+    DYNAMIC_BATCHING_ENABLED,
     METRICS_ENABLED,
     METRICS_INTERVAL,
     ROBOFLOW_SERVER_UUID,
 )
 from inference.core.exceptions import InferenceModelNotFound
 from inference.core.logger import logger
+from inference.core.managers.batching import DynamicBatcher
 from inference.core.managers.entities import ModelDescription
+from inference.core.managers.executors import ModelExecutor
 from inference.core.managers.pingback import PingbackInfo
 from inference.core.models.base import Model, PreprocessReturnMetadata
 from inference.core.registries.base import ModelRegistry
+from inference.core.utils.image_utils import ImageType
 
 
 class ModelManager:
@@ -29,6 +34,9 @@ class ModelManager:
     def __init__(self, model_registry: ModelRegistry, models: Optional[dict] = None):
         self.model_registry = model_registry
         self._models: Dict[str, Model] = models if models is not None else {}
+        self._model_load_args: Dict[str, Tuple[str, str, Optional[str]]] = {}
+        self._executor = ModelExecutor(model_registry)
+        self._batcher = DynamicBatcher() if DYNAMIC_BATCHING_ENABLED else None
 
     def init_pingback(self):
         """Initializes pingback mechanism."""
@@ -63,7 +71,9 @@ class ModelManager:
             api_key=api_key,
         )
         logger.debug("ModelManager - model successfully loaded.")
-        self._models[model_id if model_id_alias is None else model_id_alias] = model
+        key = model_id if model_id_alias is None else model_id_alias
+        self._models[key] = model
+        self._model_load_args[key] = (model_id, api_key, model_id_alias)
 
     def check_for_model(self, model_id: str) -> None:
         """Checks whether the model with the given ID is in the manager.
@@ -110,12 +120,15 @@ class ModelManager:
                     score=finish_time,
                     expire=METRICS_INTERVAL * 2,
                 )
-                if (
-                    hasattr(request, "image")
-                    and hasattr(request.image, "type")
-                    and request.image.type == "numpy"
-                ):
-                    request.image.value = str(request.image.value)
+                if hasattr(request, "image") and hasattr(request.image, "type"):
+                    if request.image.type in (
+                        ImageType.NUMPY.value,
+                        ImageType.NUMPY_OBJECT.value,
+                    ):
+                        request.image.value = str(request.image.value)
+                    elif request.image.type == ImageType.BYTES.value:
+                        # the whole encoded image would be cached as its repr
+                        request.image.value = f"<{len(request.image.value)} bytes>"
                 cache.zadd(
                     f"inference:{GLOBAL_INFERENCE_SERVER_ID}:{model_id}",
                     value=to_cachable_inference_item(request, rtn_val),
@@ -150,7 +163,24 @@ class ModelManager:
 
     async def model_infer(self, model_id: str, request: InferenceRequest, **kwargs):
         self.check_for_model(model_id)
-        return self._models[model_id].infer_from_request(request)
+        model = self._models[model_id]
+        model_load_args = self._model_load_args.get(model_id)
+        if self._batcher is not None and model.can_batch_request(request):
+            # merged with concurrent requests to the same model into one predict call
+            return await self._batcher.infer_from_request(
+                model_id,
+                request,
+                run_batch=partial(
+                    self._executor.infer_from_requests,
+                    model_id,
+                    model,
+                    model_load_args=model_load_args,
+                ),
+            )
+        # the model call runs in the pool of the model, the event loop stays free for other requests
+        return await self._executor.infer_from_request(
+            model_id, model, request, model_load_args=model_load_args
+        )
 
     def make_response(
         self, model_id: str, predictions: List[List[float]], *args, **kwargs
@@ -253,8 +283,12 @@ class ModelManager:
         """
         try:
             self.check_for_model(model_id)
+            if self._batcher is not None:
+                self._batcher.remove(model_id)
+            self._executor.remove(model_id)
             self._models[model_id].clear_cache()
             del self._models[model_id]
+            self._model_load_args.pop(model_id, None)
         except InferenceModelNotFound:
             logger.warning(
                 f"Attempted to remove model with id {model_id}, but it is not loaded. Skipping..."
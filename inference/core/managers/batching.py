@@ -0,0 +1,147 @@
+import asyncio
+from typing import Awaitable, Callable, Dict, List, Set, Tuple
+
+from inference.core.entities.requests.inference import InferenceRequest
+from inference.core.entities.responses.inference import InferenceResponse
+from inference.core.env import (
+    DYNAMIC_BATCHING_MAX_WAIT,
+    MAX_BATCH_SIZE,
+    MODEL_EXECUTOR_QUEUE_SIZE,
+    MODEL_EXECUTOR_WORKERS,
+)
+from inference.core.exceptions import InferenceModelNotFound, InferenceQueueFull
+from inference.core.logger import logger
+
+# used when MAX_BATCH_SIZE is not set, as in the parallel deployment
+DEFAULT_DYNAMIC_BATCH_SIZE = 32
+
+BatchRunner = Callable[[List[InferenceRequest]], Awaitable[List[InferenceResponse]]]
+
+
+class DynamicBatcher:
+    """Coalesces concurrent requests to the same model into batches.
+
+    Every model gets a queue and a consumer task on the event loop. The consumer takes the oldest
+    request, waits at most `max_wait` seconds for more, and hands up to `max_batch_size` requests to
+    the batch runner of the model in one call. Up to `max_concurrent_batches` batches of a model
+    run at once, requests keep coalescing in the queue in the meantime. The batch runner may return
+    an exception in place of the response of a request, only that request then fails.
+
+    Attributes:
+        max_batch_size (int): Maximum number of requests per batch.
+        max_wait (float): Seconds the oldest request of a batch waits for others.
+        max_queue_size (int): Number of requests that may wait per model before new ones are rejected.
+        max_concurrent_batches (int): Number of batches of a model that run at once.
+    """
+
+    def __init__(
+        self,
+        max_batch_size: int = MAX_BATCH_SIZE,
+        max_wait: float = DYNAMIC_BATCHING_MAX_WAIT,
+        max_queue_size: int = MODEL_EXECUTOR_QUEUE_SIZE,
+        max_concurrent_batches: int = MODEL_EXECUTOR_WORKERS,
+    ):
+        if max_batch_size == float("inf"):
+            max_batch_size = DEFAULT_DYNAMIC_BATCH_SIZE
+        self.max_batch_size = int(max_batch_size)
+        self.max_wait = max_wait
+        self.max_queue_size = max_queue_size
+        self.max_concurrent_batches = max_concurrent_batches
+        self._queues: Dict[str, asyncio.Queue] = {}
+        self._consumers: Dict[str, asyncio.Task] = {}
+        # the event loop only keeps weak references to tasks, running batches are kept alive here
+        self._batch_tasks: Set[asyncio.Task] = set()
+
+    async def infer_from_request(
+        self, model_id: str, request: InferenceRequest, run_batch: BatchRunner
+    ) -> InferenceResponse:
+        """Queues a request and waits for the response of its batch.
+
+        Args:
+            model_id (str): The identifier of the model.
+            request (InferenceRequest): The request to process.
+            run_batch (BatchRunner): Coroutine function running a list of requests of the model,
+                taken from the first request of the model that reaches the batcher.
+
+        Returns:
+            InferenceResponse: The response to the request.
+
+        Raises:
+            InferenceQueueFull: If `max_queue_size` requests of the model are already waiting.
+        """
+        if model_id not in self._queues:
+            self._queues[model_id] = asyncio.Queue(maxsize=self.max_queue_size)
+            self._consumers[model_id] = asyncio.create_task(
+                self._consume(self._queues[model_id], run_batch)
+            )
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self._queues[model_id].put_nowait((request, future))
+        except asyncio.QueueFull:
+            raise InferenceQueueFull(
+                f"Too many requests queued for model {model_id}, try again later."
+            )
+        return await future
+
+    async def _next_batch(
+        self, queue: asyncio.Queue
+    ) -> List[Tuple[InferenceRequest, asyncio.Future]]:
+        batch = [await queue.get()]
+        deadline = asyncio.get_running_loop().time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            if not queue.empty():
+                batch.append(queue.get_nowait())
+                continue
+            timeout = deadline - asyncio.get_running_loop().time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _consume(self, queue: asyncio.Queue, run_batch: BatchRunner) -> None:
+        slots = asyncio.Semaphore(self.max_concurrent_batches)
+        while True:
+            # requests keep coalescing while every batch slot is busy
+            await slots.acquire()
+            batch = await self._next_batch(queue)
+            task = asyncio.create_task(self._run(batch, run_batch))
+            self._batch_tasks.add(task)
+            task.add_done_callback(self._batch_tasks.discard)
+            task.add_done_callback(lambda _: slots.release())
+
+    async def _run(
+        self,
+        batch: List[Tuple[InferenceRequest, asyncio.Future]],
+        run_batch: BatchRunner,
+    ) -> None:
+        logger.debug(f"DynamicBatcher - running a batch of {len(batch)} requests")
+        try:
+            responses = await run_batch([request for request, _ in batch])
+        except Exception as error:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(error)
+            return
+        for (_, future), response in zip(batch, responses):
+            if future.done():
+                continue
+            if isinstance(response, Exception):
+                future.set_exception(response)
+            else:
+                future.set_result(response)
+
+    def remove(self, model_id: str) -> None:
+        """Stops batching for a model, its waiting requests fail with `InferenceModelNotFound`."""
+        consumer = self._consumers.pop(model_id, None)
+        queue = self._queues.pop(model_id, None)
+        if consumer is not None:
+            consumer.cancel()
+        while queue is not None and not queue.empty():
+            _, future = queue.get_nowait()
+            if not future.done():
+                future.set_exception(
+                    InferenceModelNotFound(f"Model with id {model_id} was removed.")
+                )
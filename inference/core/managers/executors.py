@@ -0,0 +1,181 @@
+import asyncio
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from threading import BoundedSemaphore, Lock
+from typing import Any, Dict, List, Optional, Tuple
+
+from inference.core.entities.requests.inference import InferenceRequest
+from inference.core.entities.responses.inference import InferenceResponse
+from inference.core.env import (
+    MODEL_EXECUTOR_QUEUE_SIZE,
+    MODEL_EXECUTOR_TYPE,
+    MODEL_EXECUTOR_WORKERS,
+)
+from inference.core.exceptions import InferenceQueueFull
+from inference.core.logger import logger
+from inference.core.registries.base import ModelRegistry
+
+EXECUTOR_TYPES = ("none", "thread", "process")
+
+_process_model_manager = None
+
+
+def _init_process_worker(model_registry: ModelRegistry) -> None:
+    """Creates the model manager of a process pool worker."""
+    global _process_model_manager
+    from inference.core.managers.base import ModelManager
+
+    _process_model_manager = ModelManager(model_registry)
+
+
+def _process_model_call(
+    model_load_args: Tuple[str, str, Optional[str]], method: str, payload: Any
+) -> Any:
+    """Runs a model method in a process pool worker, loading the model on first use."""
+    model_id, api_key, model_id_alias = model_load_args
+    _process_model_manager.add_model(model_id, api_key, model_id_alias=model_id_alias)
+    key = model_id if model_id_alias is None else model_id_alias
+    return getattr(_process_model_manager[key], method)(payload)
+
+
+class ModelExecutor:
+    """Runs the synchronous model calls of a ModelManager off the event loop.
+
+    Every model gets its own pool of `workers` threads or processes. At most `workers + queue_size`
+    calls of a model are in flight, calls beyond that are rejected with `InferenceQueueFull`
+    instead of piling up behind a slow model. In process mode each worker process loads its own
+    copy of the model, on top of the one `ModelManager.add_model` loads in the server process for
+    request routing and the model methods that do not run inference: a model then takes
+    `workers + 1` times its memory, and its first call in every worker pays the load time again.
+
+    Attributes:
+        executor_type (str): One of "none" (run on the event loop), "thread" or "process".
+        workers (int): Number of workers per model.
+        queue_size (int): Number of calls per model that may wait for a free worker.
+    """
+
+    def __init__(
+        self,
+        model_registry: ModelRegistry,
+        executor_type: str = MODEL_EXECUTOR_TYPE,
+        workers: int = MODEL_EXECUTOR_WORKERS,
+        queue_size: int = MODEL_EXECUTOR_QUEUE_SIZE,
+    ):
+        if executor_type not in EXECUTOR_TYPES:
+            raise ValueError(
+                f"Model executor type must be one of {EXECUTOR_TYPES}, got {executor_type}."
+            )
+        self.model_registry = model_registry
+        self.executor_type = executor_type
+        self.workers = workers
+        self.queue_size = queue_size
+        self._executors: Dict[str, Executor] = {}
+        self._slots: Dict[str, BoundedSemaphore] = {}
+        self._lock = Lock()
+
+    def _get_executor(self, model_id: str) -> Tuple[Executor, BoundedSemaphore]:
+        with self._lock:
+            if model_id not in self._executors:
+                if self.executor_type == "process":
+                    executor = ProcessPoolExecutor(
+                        max_workers=self.workers,
+                        initializer=_init_process_worker,
+                        initargs=(self.model_registry,),
+                    )
+                else:
+                    executor = ThreadPoolExecutor(
+                        max_workers=self.workers,
+                        thread_name_prefix=f"model-{model_id}",
+                    )
+                self._executors[model_id] = executor
+                self._slots[model_id] = BoundedSemaphore(self.workers + self.queue_size)
+            return self._executors[model_id], self._slots[model_id]
+
+    async def infer_from_request(
+        self,
+        model_id: str,
+        model: Any,
+        request: InferenceRequest,
+        model_load_args: Optional[Tuple[str, str, Optional[str]]] = None,
+    ) -> InferenceResponse:
+        """Runs `model.infer_from_request(request)` in the pool of the model.
+
+        Args:
+            model_id (str): The identifier of the model.
+            model (Model): The model instance, used in thread mode.
+            request (InferenceRequest): The request to process.
+            model_load_args (Optional[Tuple[str, str, Optional[str]]]): The `add_model` arguments of the
+                model, used to load it in process mode.
+
+        Returns:
+            InferenceResponse: The response from the inference.
+
+        Raises:
+            InferenceQueueFull: If the model already has `workers + queue_size` calls in flight.
+        """
+        return await self._run(
+            model_id, model, "infer_from_request", request, model_load_args
+        )
+
+    async def infer_from_requests(
+        self,
+        model_id: str,
+        model: Any,
+        requests: List[InferenceRequest],
+        model_load_args: Optional[Tuple[str, str, Optional[str]]] = None,
+    ) -> List[InferenceResponse]:
+        """Runs `model.infer_from_requests(requests)` in the pool of the model, as a single call.
+
+        Args:
+            model_id (str): The identifier of the model.
+            model (Model): The model instance, used in thread mode.
+            requests (List[InferenceRequest]): The requests to process together.
+            model_load_args (Optional[Tuple[str, str, Optional[str]]]): The `add_model` arguments of the
+                model, used to load it in process mode.
+
+        Returns:
+            List[InferenceResponse]: One response per request, or the exception the request raised.
+
+        Raises:
+            InferenceQueueFull: If the model already has `workers + queue_size` calls in flight.
+        """
+        return await self._run(
+            model_id, model, "infer_from_requests", requests, model_load_args
+        )
+
+    async def _run(
+        self,
+        model_id: str,
+        model: Any,
+        method: str,
+        payload: Any,
+        model_load_args: Optional[Tuple[str, str, Optional[str]]],
+    ) -> Any:
+        if self.executor_type == "none":
+            return getattr(model, method)(payload)
+        executor, slots = self._get_executor(model_id)
+        if not slots.acquire(blocking=False):
+            raise InferenceQueueFull(
+                f"Too many requests queued for model {model_id}, try again later."
+            )
+        try:
+            if self.executor_type == "process":
+                future = executor.submit(
+                    _process_model_call, model_load_args, method, payload
+                )
+            else:
+                future = executor.submit(getattr(model, method), payload)
+        except Exception:
+            slots.release()
+            raise
+        # the slot is held until the call finishes, even if the awaiting request is cancelled
+        future.add_done_callback(lambda _: slots.release())
+        return await asyncio.wrap_future(future)
+
+    def remove(self, model_id: str) -> None:
+        """Shuts down the pool of a model, calls in flight still complete."""
+        with self._lock:
+            executor = self._executors.pop(model_id, None)
+            self._slots.pop(model_id, None)
+        if executor is not None:
+            logger.debug(f"ModelExecutor - shutting down pool of model_id={model_id}")
+            executor.shutdown(wait=False)
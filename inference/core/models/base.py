@@ -131,6 +131,37 @@ class Model(BaseInference):
 
         return responses
 
+    def can_batch_request(self, request: InferenceRequest) -> bool:
+        """Whether the request may be merged with other requests by `infer_from_requests`.
+
+        Args:
+            request (InferenceRequest): The request object.
+
+        Returns:
+            bool: False unless the model implements cross-request batching.
+        """
+        return False
+
+    def infer_from_requests(
+        self, requests: List[InferenceRequest]
+    ) -> List[Union[List[InferenceResponse], InferenceResponse, Exception]]:
+        """Runs inference on several independent requests, one `infer_from_request` call each.
+
+        Args:
+            requests (List[InferenceRequest]): The request objects.
+
+        Returns:
+            List[Union[List[InferenceResponse], InferenceResponse, Exception]]: The response(s) of
+            every request, or the exception it raised.
+        """
+        responses = []
+        for request in requests:
+            try:
+                responses.append(self.infer_from_request(request))
+            except Exception as error:
+                responses.append(error)
+        return responses
+
     def make_response(
         self, *args, **kwargs
     ) -> Union[InferenceResponse, List[InferenceResponse]]:
@@ -2,12 +2,12 @@ from typing import Any, List, Tuple, Union
 
 import numpy as np
 
-from inference.core.entities.responses.inference import (
-    InferenceResponseImage,
-    InstanceSegmentationInferenceResponse,
-    InstanceSegmentationPrediction,
-    Point,
+from inference.core.entities.responses.detections import (
+    DetectionsInferenceResponse,
+    as_prediction_array,
+    class_filter_mask,
 )
+from inference.core.entities.responses.inference import InferenceResponseImage
 from inference.core.exceptions import InvalidMaskDecodeArgument
 from inference.core.models.roboflow import OnnxRoboflowInferenceModel
 from inference.core.models.types import PreprocessReturnMetadata
@@ -114,10 +114,7 @@ class InstanceSegmentationBaseOnnxRoboflowInferenceModel(OnnxRoboflowInferenceMo
         predictions: Tuple[np.ndarray, np.ndarray],
         preprocess_return_metadata: PreprocessReturnMetadata,
         **kwargs,
-    ) -> Union[
-        InstanceSegmentationInferenceResponse,
-        List[InstanceSegmentationInferenceResponse],
-    ]:
+    ) -> List[DetectionsInferenceResponse]:
         predictions, protos = predictions
         predictions = w_np_non_max_suppression(
             predictions,
@@ -219,10 +216,7 @@ class InstanceSegmentationBaseOnnxRoboflowInferenceModel(OnnxRoboflowInferenceMo
         img_dims: List[Tuple[int, int]],
         class_filter: List[str] = [],
         **kwargs,
-    ) -> Union[
-        InstanceSegmentationInferenceResponse,
-        List[InstanceSegmentationInferenceResponse],
-    ]:
+    ) -> List[DetectionsInferenceResponse]:
         """
         Create instance segmentation inference response objects for the provided predictions and masks.
 
@@ -233,40 +227,31 @@ class InstanceSegmentationBaseOnnxRoboflowInferenceModel(OnnxRoboflowInferenceMo
             class_filter (List[str], optional): List of class names to filter predictions by. Defaults to an empty list (no filtering).
 
         Returns:
-            Union[InstanceSegmentationInferenceResponse, List[InstanceSegmentationInferenceResponse]]: A single instance segmentation response or a list of instance segmentation responses based on the number of processed images.
+            List[DetectionsInferenceResponse]: One columnar response per processed image.
 
         Notes:
-            - For each image, constructs an `InstanceSegmentationInferenceResponse` object.
-            - Each response contains a list of `InstanceSegmentationPrediction` objects.
+            - For each image, constructs a `DetectionsInferenceResponse` holding the boxes and polygons.
+            - It is serialized in the schema of `InstanceSegmentationInferenceResponse`.
         """
-        responses = [
-            InstanceSegmentationInferenceResponse(
-                predictions=[
-                    InstanceSegmentationPrediction(
-                        # Passing args as a dictionary here since one of the args is 'class' (a protected term in Python)
-                        **{
-                            "x": (pred[0] + pred[2]) / 2,
-                            "y": (pred[1] + pred[3]) / 2,
-                            "width": pred[2] - pred[0],
-                            "height": pred[3] - pred[1],
-                            "points": [Point(x=point[0], y=point[1]) for point in mask],
-                            "confidence": pred[4],
-                            "class": self.class_names[int(pred[6])],
-                            "class_id": int(pred[6]),
-                        }
-                    )
-                    for pred, mask in zip(batch_predictions, batch_masks)
-                    if not class_filter
-                    or self.class_names[int(pred[6])] in class_filter
-                ],
-                image=InferenceResponseImage(
-                    width=img_dims[ind][1], height=img_dims[ind][0]
-                ),
-            )
-            for ind, (batch_predictions, batch_masks) in enumerate(
-                zip(predictions, masks)
+        responses = []
+        for ind, (batch_predictions, batch_masks) in enumerate(zip(predictions, masks)):
+            batch_predictions = as_prediction_array(batch_predictions)
+            class_id = batch_predictions[:, 6].astype(int)
+            keep = class_filter_mask(class_id, self.class_names, class_filter)
+            responses.append(
+                DetectionsInferenceResponse(
+                    xyxy=batch_predictions[keep, :4],
+                    confidence=batch_predictions[keep, 4],
+                    class_id=class_id[keep],
+                    class_names=self.class_names,
+                    image=InferenceResponseImage(
+                        width=img_dims[ind][1], height=img_dims[ind][0]
+                    ),
+                    polygons=[
+                        mask for mask, kept in zip(batch_masks, keep.tolist()) if kept
+                    ],
+                )
             )
-        ]
         return responses
 
     def predict(self, img_in: np.ndarray, **kwargs) -> Tuple[np.ndarray, np.ndarray]:
@@ -2,18 +2,17 @@ from typing import List, Optional, Tuple
 
 import numpy as np
 
-from inference.core.entities.responses.inference import (
-    InferenceResponseImage,
-    Keypoint,
-    KeypointsDetectionInferenceResponse,
-    KeypointsPrediction,
+from inference.core.entities.responses.detections import (
+    DetectionsInferenceResponse,
+    as_prediction_array,
+    class_filter_mask,
 )
+from inference.core.entities.responses.inference import InferenceResponseImage
 from inference.core.exceptions import ModelArtefactError
 from inference.core.models.object_detection_base import (
     ObjectDetectionBaseOnnxRoboflowInferenceModel,
 )
 from inference.core.models.types import PreprocessReturnMetadata
-from inference.core.models.utils.keypoints import model_keypoints_to_response
 from inference.core.models.utils.validate import (
     get_num_classes_from_model_prediction_shape,
 )
@@ -56,7 +55,7 @@ class KeypointsDetectionBaseOnnxRoboflowInferenceModel(
         max_detections: int = DEFAUlT_MAX_DETECTIONS,
         return_image_dims: bool = False,
         **kwargs,
-    ) -> List[KeypointsDetectionInferenceResponse]:
+    ) -> List[DetectionsInferenceResponse]:
         """Postprocesses the object detection predictions.
 
         Args:
@@ -69,7 +68,7 @@ class KeypointsDetectionBaseOnnxRoboflowInferenceModel(
             max_detections (int): Maximum number of final detections. Default is 300.
 
         Returns:
-            List[KeypointsDetectionInferenceResponse]: The post-processed predictions.
+            List[DetectionsInferenceResponse]: The post-processed predictions.
         """
         predictions = predictions[0]
         number_of_classes = len(self.get_class_names)
@@ -116,7 +115,7 @@ class KeypointsDetectionBaseOnnxRoboflowInferenceModel(
         class_filter: Optional[List[str]] = None,
         *args,
         **kwargs,
-    ) -> List[KeypointsDetectionInferenceResponse]:
+    ) -> List[DetectionsInferenceResponse]:
         """Constructs object detection response objects based on predictions.
 
         Args:
@@ -125,46 +124,44 @@ class KeypointsDetectionBaseOnnxRoboflowInferenceModel(
             class_filter (Optional[List[str]]): A list of class names to filter, if provided.
 
         Returns:
-            List[KeypointsDetectionInferenceResponse]: A list of response objects containing keypoints detection predictions.
+            List[DetectionsInferenceResponse]: A list of columnar responses, serialized in the schema of `KeypointsDetectionInferenceResponse`.
         """
         if isinstance(img_dims, dict) and "img_dims" in img_dims:
             img_dims = img_dims["img_dims"]
         keypoint_confidence_threshold = 0.0
         if "request" in kwargs:
             keypoint_confidence_threshold = kwargs["request"].keypoint_confidence
-        responses = [
-            KeypointsDetectionInferenceResponse(
-                predictions=[
-                    KeypointsPrediction(
-                        # Passing args as a dictionary here since one of the args is 'class' (a protected term in Python)
-                        **{
-                            "x": (pred[0] + pred[2]) / 2,
-                            "y": (pred[1] + pred[3]) / 2,
-                            "width": pred[2] - pred[0],
-                            "height": pred[3] - pred[1],
-                            "confidence": pred[4],
-                            "class": self.class_names[int(pred[6])],
-                            "class_id": int(pred[6]),
-                            "keypoints": model_keypoints_to_response(
-                                keypoints_metadata=self.keypoints_metadata,
-                                keypoints=pred[7:],
-                                predicted_object_class_id=int(
-                                    pred[4 + len(self.get_class_names)]
-                                ),
-                                keypoint_confidence_threshold=keypoint_confidence_threshold,
-                            ),
-                        }
-                    )
-                    for pred in batch_predictions
-                    if not class_filter
-                    or self.class_names[int(pred[6])] in class_filter
-                ],
-                image=InferenceResponseImage(
-                    width=img_dims[ind][1], height=img_dims[ind][0]
-                ),
+        responses = []
+        for ind, batch_predictions in enumerate(predictions):
+            batch_predictions = as_prediction_array(batch_predictions)
+            if len(batch_predictions) > 0 and self.keypoints_metadata is None:
+                raise ModelArtefactError("Keypoints metadata not available.")
+            class_id = batch_predictions[:, 6].astype(int)
+            keep = class_filter_mask(class_id, self.class_names, class_filter)
+            batch_predictions = batch_predictions[keep]
+            num_keypoints = (batch_predictions.shape[1] - 7) // 3
+            keypoints_class_id = class_id[keep]
+            if len(batch_predictions) > 0:
+                keypoints_class_id = batch_predictions[
+                    :, 4 + len(self.get_class_names)
+                ].astype(int)
+            responses.append(
+                DetectionsInferenceResponse(
+                    xyxy=batch_predictions[:, :4],
+                    confidence=batch_predictions[:, 4],
+                    class_id=class_id[keep],
+                    class_names=self.class_names,
+                    image=InferenceResponseImage(
+                        width=img_dims[ind][1], height=img_dims[ind][0]
+                    ),
+                    keypoints=batch_predictions[:, 7 : 7 + 3 * num_keypoints].reshape(
+                        len(batch_predictions), num_keypoints, 3
+                    ),
+                    keypoints_class_id=keypoints_class_id,
+                    keypoints_metadata=self.keypoints_metadata,
+                    keypoint_confidence_threshold=keypoint_confidence_threshold,
+                )
             )
-            for ind, batch_predictions in enumerate(predictions)
-        ]
         return responses
 
     def keypoints_count(self) -> int:
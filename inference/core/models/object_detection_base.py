@@ -1,11 +1,17 @@
+from time import perf_counter
 from typing import Any, List, Optional, Tuple, Union
 
 import numpy as np
 
+from inference.core.entities.requests.inference import InferenceRequest
+from inference.core.entities.responses.detections import (
+    DetectionsInferenceResponse,
+    as_prediction_array,
+    class_filter_mask,
+)
 from inference.core.entities.responses.inference import (
     InferenceResponseImage,
     ObjectDetectionInferenceResponse,
-    ObjectDetectionPrediction,
 )
 from inference.core.env import FIX_BATCH_SIZE, MAX_BATCH_SIZE
 from inference.core.logger import logger
@@ -88,6 +94,92 @@ class ObjectDetectionBaseOnnxRoboflowInferenceModel(OnnxRoboflowInferenceModel):
             **kwargs,
         )
 
+    def can_batch_request(self, request: InferenceRequest) -> bool:
+        """Single image requests can share a batch if the model takes dynamic batches.
+
+        Args:
+            request (InferenceRequest): The request object.
+
+        Returns:
+            bool: Whether the request may be merged with other requests by `infer_from_requests`.
+        """
+        return (
+            self.batching_enabled
+            and not FIX_BATCH_SIZE
+            and not getattr(request, "fix_batch_size", False)
+            and not isinstance(request.image, list)
+        )
+
+    def infer_from_requests(
+        self, requests: List[InferenceRequest]
+    ) -> List[
+        Union[
+            List[ObjectDetectionInferenceResponse],
+            ObjectDetectionInferenceResponse,
+            Exception,
+        ]
+    ]:
+        """Runs independent requests through a single `predict` call.
+
+        Every request is preprocessed and postprocessed with its own parameters, only the model
+        forward pass is shared. Requests that `can_batch_request` rejects run on their own. A
+        request that fails does not fail the others: its exception is returned in its place.
+
+        Args:
+            requests (List[InferenceRequest]): The request objects.
+
+        Returns:
+            List[Union[List[ObjectDetectionInferenceResponse], ObjectDetectionInferenceResponse, Exception]]:
+            The response(s) of every request, or the exception it raised, in order.
+        """
+        t1 = perf_counter()
+        responses = [None] * len(requests)
+        preprocessed = {}
+        for idx, request in enumerate(requests):
+            try:
+                if self.can_batch_request(request):
+                    preprocessed[idx] = self.preprocess(**request.dict())
+                else:
+                    responses[idx] = self.infer_from_request(request)
+            except Exception as error:
+                responses[idx] = error
+
+        # the inputs are resized to the model input size, this only splits on unexpected shapes
+        groups = {}
+        for idx, (img_in, _) in preprocessed.items():
+            groups.setdefault(img_in.shape[1:], []).append(idx)
+        for indices in groups.values():
+            img_in = np.concatenate([preprocessed[idx][0] for idx in indices], axis=0)
+            try:
+                predictions = self.predict(img_in)
+            except Exception as error:
+                for idx in indices:
+                    responses[idx] = error
+                continue
+            for offset, idx in enumerate(indices):
+                request = requests[idx]
+                request_predictions = tuple(
+                    prediction[offset : offset + 1] for prediction in predictions
+                )
+                try:
+                    request_kwargs = request.dict()
+                    request_kwargs.pop("image")
+                    request_responses = self.postprocess(
+                        request_predictions,
+                        preprocessed[idx][1],
+                        **request_kwargs,
+                    )
+                    for response in request_responses:
+                        response.time = perf_counter() - t1
+                        if request.visualize_predictions:
+                            response.visualization = self.draw_predictions(
+                                request, response
+                            )
+                    responses[idx] = request_responses[0]
+                except Exception as error:
+                    responses[idx] = error
+        return responses
+
     def make_response(
         self,
         predictions: List[List[float]],
@@ -95,7 +187,7 @@ class ObjectDetectionBaseOnnxRoboflowInferenceModel(OnnxRoboflowInferenceModel):
         class_filter: Optional[List[str]] = None,
         *args,
         **kwargs,
-    ) -> List[ObjectDetectionInferenceResponse]:
+    ) -> List[DetectionsInferenceResponse]:
         """Constructs object detection response objects based on predictions.
 
         Args:
@@ -104,7 +196,7 @@ class ObjectDetectionBaseOnnxRoboflowInferenceModel(OnnxRoboflowInferenceModel):
             class_filter (Optional[List[str]]): A list of class names to filter, if provided.
 
         Returns:
-            List[ObjectDetectionInferenceResponse]: A list of response objects containing object detection predictions.
+            List[DetectionsInferenceResponse]: A list of columnar responses, serialized in the schema of `ObjectDetectionInferenceResponse`.
         """
 
         if isinstance(img_dims, dict) and "img_dims" in img_dims:
@@ -113,31 +205,22 @@ class ObjectDetectionBaseOnnxRoboflowInferenceModel(OnnxRoboflowInferenceModel):
         predictions = predictions[
             : len(img_dims)
         ]  # If the batch size was fixed we have empty preds at the end
-        responses = [
-            ObjectDetectionInferenceResponse(
-                predictions=[
-                    ObjectDetectionPrediction(
-                        # Passing args as a dictionary here since one of the args is 'class' (a protected term in Python)
-                        **{
-                            "x": (pred[0] + pred[2]) / 2,
-                            "y": (pred[1] + pred[3]) / 2,
-                            "width": pred[2] - pred[0],
-                            "height": pred[3] - pred[1],
-                            "confidence": pred[4],
-                            "class": self.class_names[int(pred[6])],
-                            "class_id": int(pred[6]),
-                        }
-                    )
-                    for pred in batch_predictions
-                    if not class_filter
-                    or self.class_names[int(pred[6])] in class_filter
-                ],
-                image=InferenceResponseImage(
-                    width=img_dims[ind][1], height=img_dims[ind][0]
-                ),
+        responses = []
+        for ind, batch_predictions in enumerate(predictions):
+            batch_predictions = as_prediction_array(batch_predictions)
+            class_id = batch_predictions[:, 6].astype(int)
+            keep = class_filter_mask(class_id, self.class_names, class_filter)
+            responses.append(
+                DetectionsInferenceResponse(
+                    xyxy=batch_predictions[keep, :4],
+                    confidence=batch_predictions[keep, 4],
+                    class_id=class_id[keep],
+                    class_names=self.class_names,
+                    image=InferenceResponseImage(
+                        width=img_dims[ind][1], height=img_dims[ind][0]
+                    ),
+                )
             )
-            for ind, batch_predictions in enumerate(predictions)
-        ]
         return responses
 
     def postprocess(
@@ -151,7 +234,7 @@ class ObjectDetectionBaseOnnxRoboflowInferenceModel(OnnxRoboflowInferenceModel):
         max_detections: int = DEFAUlT_MAX_DETECTIONS,
         return_image_dims: bool = False,
         **kwargs,
-    ) -> List[ObjectDetectionInferenceResponse]:
+    ) -> List[DetectionsInferenceResponse]:
         """Postprocesses the object detection predictions.
 
         Args:
@@ -164,7 +247,7 @@ class ObjectDetectionBaseOnnxRoboflowInferenceModel(OnnxRoboflowInferenceModel):
             max_detections (int): Maximum number of final detections. Default is 300.
 
         Returns:
-            List[ObjectDetectionInferenceResponse]: The post-processed predictions.
+            List[DetectionsInferenceResponse]: The post-processed predictions.
         """
         predictions = predictions[0]
 
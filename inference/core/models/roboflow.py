@@ -388,11 +388,13 @@ class RoboflowInferenceModel(Model):
         Returns:
             Tuple[np.ndarray, Tuple[int, int]]: A tuple containing a numpy array of the preprocessed image pixel data and a tuple of the images original size.
         """
+        # the decoded image is resized below, so its buffer is free again when this returns
         np_image, is_bgr = load_image(
             image,
             disable_preproc_auto_orient=disable_preproc_auto_orient
             or "auto-orient" not in self.preproc.keys()
             or DISABLE_PREPROC_AUTO_ORIENT,
+            reuse_decode_buffer=True,
         )
         preprocessed_image, img_dims = self.preprocess_image(
             np_image,
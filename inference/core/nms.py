@@ -1,4 +1,4 @@
-from typing import Optional
+from typing import Optional, Tuple
 
 import numpy as np
 
@@ -35,13 +35,12 @@ def w_np_non_max_suppression(
     """
     num_classes = prediction.shape[2] - 5 - num_masks
 
-    np_box_corner = np.zeros(prediction.shape)
     if box_format == "xywh":
-        np_box_corner[:, :, 0] = prediction[:, :, 0] - prediction[:, :, 2] / 2
-        np_box_corner[:, :, 1] = prediction[:, :, 1] - prediction[:, :, 3] / 2
-        np_box_corner[:, :, 2] = prediction[:, :, 0] + prediction[:, :, 2] / 2
-        np_box_corner[:, :, 3] = prediction[:, :, 1] + prediction[:, :, 3] / 2
-        prediction[:, :, :4] = np_box_corner[:, :, :4]
+        # converted in place, as callers may read the corner boxes back from `prediction`
+        half_wh = prediction[:, :, 2:4] / 2
+        centers = prediction[:, :, :2].copy()
+        prediction[:, :, :2] = centers - half_wh
+        prediction[:, :, 2:4] = centers + half_wh
     elif box_format == "xyxy":
         pass
     else:
@@ -49,55 +48,103 @@ def w_np_non_max_suppression(
             "box_format must be either 'xywh' or 'xyxy', got {}".format(box_format)
         )
 
-    batch_predictions = []
-    for np_image_i, np_image_pred in enumerate(prediction):
-        filtered_predictions = []
-        np_conf_mask = (np_image_pred[:, 4] >= conf_thresh).squeeze()
-
-        np_image_pred = np_image_pred[np_conf_mask]
-        if np_image_pred.shape[0] == 0:
-            batch_predictions.append(filtered_predictions)
-            continue
-        np_class_conf = np.max(np_image_pred[:, 5 : num_classes + 5], 1)
-        np_class_pred = np.argmax(np_image_pred[:, 5 : num_classes + 5], 1)
-        np_class_conf = np.expand_dims(np_class_conf, axis=1)
-        np_class_pred = np.expand_dims(np_class_pred, axis=1)
-        np_mask_pred = np_image_pred[:, 5 + num_classes :]
-        np_detections = np.append(
-            np.append(
-                np.append(np_image_pred[:, :5], np_class_conf, axis=1),
-                np_class_pred,
-                axis=1,
-            ),
-            np_mask_pred,
-            axis=1,
+    batch_size = prediction.shape[0]
+    image_ids, candidate_ids = np.nonzero(prediction[:, :, 4] >= conf_thresh)
+    if max_candidate_detections is not None:
+        image_ids, candidate_ids = _top_candidates(
+            prediction, image_ids, candidate_ids, max_candidate_detections
         )
+    candidates = prediction[image_ids, candidate_ids]
+    if candidates.shape[0] == 0:
+        return [[] for _ in range(batch_size)]
 
-        np_unique_labels = np.unique(np_detections[:, 6])
-
-        if class_agnostic:
-            np_detections_class = sorted(
-                np_detections, key=lambda row: row[4], reverse=True
-            )
-            filtered_predictions.extend(
-                non_max_suppression_fast(np.array(np_detections_class), iou_thresh)
-            )
-        else:
-            for c in np_unique_labels:
-                np_detections_class = np_detections[np_detections[:, 6] == c]
-                np_detections_class = sorted(
-                    np_detections_class, key=lambda row: row[4], reverse=True
-                )
-                filtered_predictions.extend(
-                    non_max_suppression_fast(np.array(np_detections_class), iou_thresh)
-                )
-        filtered_predictions = sorted(
-            filtered_predictions, key=lambda row: row[4], reverse=True
+    class_scores = candidates[:, 5 : num_classes + 5]
+    class_ids = np.argmax(class_scores, axis=1)
+    class_conf = class_scores[np.arange(class_scores.shape[0]), class_ids]
+    detections = np.concatenate(
+        [
+            candidates[:, :5],
+            class_conf[:, None],
+            class_ids[:, None],
+            candidates[:, 5 + num_classes :],
+        ],
+        axis=1,
+    ).astype("float")
+
+    batch_predictions = []
+    for image_id in range(batch_size):
+        image_detections = detections[image_ids == image_id]
+        if image_detections.shape[0] == 0:
+            batch_predictions.append([])
+            continue
+        # highest confidence first
+        image_detections = image_detections[
+            np.argsort(-image_detections[:, 4], kind="stable")
+        ]
+        groups = None if class_agnostic else image_detections[:, 6]
+        keep = _grouped_non_max_suppression(
+            image_detections[:, :4], groups, iou_thresh, max_detections
         )
-        batch_predictions.append(filtered_predictions[:max_detections])
+        batch_predictions.append(list(image_detections[keep]))
     return batch_predictions
 
 
+def _top_candidates(
+    prediction: np.ndarray,
+    image_ids: np.ndarray,
+    candidate_ids: np.ndarray,
+    max_candidate_detections: int,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Keeps the `max_candidate_detections` most confident candidates of every image."""
+    counts = np.bincount(image_ids, minlength=prediction.shape[0])
+    if counts.max(initial=0) <= max_candidate_detections:
+        return image_ids, candidate_ids
+    conf = prediction[image_ids, candidate_ids, 4]
+    # candidates come grouped by image, rank them by confidence inside their image
+    order = np.lexsort((-conf, image_ids))
+    image_ids, candidate_ids = image_ids[order], candidate_ids[order]
+    starts = np.cumsum(counts) - counts
+    rank = np.arange(image_ids.shape[0]) - starts[image_ids]
+    selected = rank < max_candidate_detections
+    return image_ids[selected], candidate_ids[selected]
+
+
+def _grouped_non_max_suppression(
+    boxes: np.ndarray,
+    groups: Optional[np.ndarray],
+    overlap_thresh: float,
+    max_detections: Optional[int],
+) -> np.ndarray:
+    """Greedy NMS of the confidence sorted xyxy boxes of one image, boxes only suppress boxes of their own group.
+
+    Groups (classes) are moved apart along x so that boxes of different groups never intersect, one pass then
+    suppresses every class. The overlap is the one of `non_max_suppression_fast`.
+    Returns the indices of the kept boxes in confidence order, at most `max_detections` of them.
+    """
+    x1, y1, x2, y2 = boxes[:, 0], boxes[:, 1], boxes[:, 2], boxes[:, 3]
+    area = (x2 - x1 + 1) * (y2 - y1 + 1)
+    if groups is not None:
+        group_offset = groups * (boxes.max() - boxes.min() + 2)
+        x1 = x1 + group_offset
+        x2 = x2 + group_offset
+
+    idxs = np.arange(boxes.shape[0])
+    pick = []
+    while idxs.shape[0] > 0 and (max_detections is None or len(pick) < max_detections):
+        i = idxs[0]
+        idxs = idxs[1:]
+        pick.append(i)
+        xx1 = np.maximum(x1[i], x1[idxs])
+        yy1 = np.maximum(y1[i], y1[idxs])
+        xx2 = np.minimum(x2[i], x2[idxs])
+        yy2 = np.minimum(y2[i], y2[idxs])
+        w = np.maximum(0, xx2 - xx1 + 1)
+        h = np.maximum(0, yy2 - yy1 + 1)
+        overlap = (w * h) / area[idxs]
+        idxs = idxs[overlap <= overlap_thresh]
+    return np.array(pick, dtype=int)
+
+
 # Malisiewicz et al.
 def non_max_suppression_fast(boxes, overlapThresh):
     """Applies non-maximum suppression to bounding boxes.
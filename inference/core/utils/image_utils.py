@@ -2,9 +2,10 @@ import binascii
 import os
 import pickle
 import re
+import threading
 from enum import Enum
 from io import BytesIO
-from typing import Any, Optional, Tuple, Union
+from typing import Any, Optional, Sequence, Tuple, Union
 
 import cv2
 import numpy as np
@@ -22,13 +23,26 @@ from inference.core.exceptions import (
     InvalidImageTypeDeclared,
     InvalidNumpyInput,
 )
+from inference.core.logger import logger
 from inference.core.utils.requests import api_key_safe_raise_for_status
 
+try:
+    import simplejpeg
+except ImportError:
+    simplejpeg = None
+
 BASE64_DATA_TYPE_PATTERN = re.compile(r"^data:image\/[a-z]+;base64,")
+JPEG_MAGIC = b"\xff\xd8\xff"
+# the EXIF segment, if any, sits in the first APPn segments, which are at most 64kB each
+EXIF_SEARCH_BYTES = 1 << 16
+
+_decode_buffers = threading.local()
+_pickle_input_warned = False
 
 
 class ImageType(Enum):
     BASE64 = "base64"
+    BYTES = "bytes"
     FILE = "file"
     MULTIPART = "multipart"
     NUMPY = "numpy"
@@ -49,12 +63,17 @@ def load_image_rgb(value: Any, disable_preproc_auto_orient: bool = False) -> np.
 def load_image(
     value: Any,
     disable_preproc_auto_orient: bool = False,
+    reuse_decode_buffer: bool = False,
 ) -> Tuple[np.ndarray, bool]:
     """Loads an image based on the specified type and value.
 
     Args:
         value (Any): Image value which could be an instance of InferenceRequestImage,
             a dict with 'type' and 'value' keys, or inferred based on the value's content.
+        disable_preproc_auto_orient (bool): If true, the EXIF orientation is not applied.
+        reuse_decode_buffer (bool): If true, JPEGs of the `bytes` type may be decoded into a buffer
+            owned by the calling thread, which the next decode in that thread overwrites. Only for
+            callers that are done with the image before loading another one.
 
     Returns:
         Image.Image: The loaded PIL image, converted to RGB.
@@ -67,7 +86,14 @@ def load_image(
         disable_preproc_auto_orient=disable_preproc_auto_orient
     )
     value, image_type = extract_image_payload_and_type(value=value)
-    if image_type is not None:
+    if image_type is ImageType.BYTES:
+        np_image = load_image_from_encoded_bytes(
+            value=value,
+            cv_imread_flags=cv_imread_flags,
+            reuse_decode_buffer=reuse_decode_buffer,
+        )
+        is_bgr = True
+    elif image_type is not None:
         np_image, is_bgr = load_image_with_known_type(
             value=value,
             image_type=image_type,
@@ -278,6 +304,7 @@ def load_image_from_numpy_str(value: Union[bytes, str]) -> np.ndarray:
     Raises:
         InvalidNumpyInput: If the numpy data is invalid.
     """
+    global _pickle_input_warned
     try:
         if isinstance(value, str):
             value = pybase64.b64decode(value)
@@ -287,6 +314,12 @@ def load_image_from_numpy_str(value: Union[bytes, str]) -> np.ndarray:
             f"Could not unpickle image data. Cause: {error}"
         ) from error
     validate_numpy_image(data=data)
+    if not _pickle_input_warned:
+        _pickle_input_warned = True
+        logger.warning(
+            "Received a pickled numpy image. Sending raw pixels as application/octet-stream "
+            "with X-Image-Shape / X-Image-Dtype headers avoids the base64 and unpickling copies."
+        )
     return data
 
 
@@ -343,19 +376,29 @@ def load_image_from_url(
 
 
 def load_image_from_encoded_bytes(
-    value: bytes, cv_imread_flags: int = cv2.IMREAD_COLOR
+    value: Union[bytes, bytearray, memoryview],
+    cv_imread_flags: int = cv2.IMREAD_COLOR,
+    reuse_decode_buffer: bool = False,
 ) -> np.ndarray:
     """
     Load an image from encoded bytes.
 
+    The bytes are wrapped without a copy. JPEGs are decoded with simplejpeg when it is installed
+    and the result is the same as with OpenCV, i.e. for colour decoding of images without an EXIF
+    orientation or with auto-orient disabled.
+
     Args:
-        value (bytes): The byte sequence representing the image.
+        value (Union[bytes, bytearray, memoryview]): The byte sequence representing the image.
         cv_imread_flags (int): OpenCV flags used for image reading.
+        reuse_decode_buffer (bool): If true, a JPEG is decoded into a buffer owned by the calling
+            thread and reused by its next decode of an image of the same size.
 
     Returns:
         np.ndarray: The loaded image as a numpy array.
     """
-    image_np = np.asarray(bytearray(value), dtype=np.uint8)
+    image_np = np.frombuffer(value, dtype=np.uint8)
+    if can_decode_with_simplejpeg(value=value, cv_imread_flags=cv_imread_flags):
+        return decode_jpeg(value=value, reuse_decode_buffer=reuse_decode_buffer)
     image = cv2.imdecode(image_np, cv_imread_flags)
     if image is None:
         raise InputImageLoadError(
@@ -364,8 +407,88 @@ def load_image_from_encoded_bytes(
     return image
 
 
+def can_decode_with_simplejpeg(
+    value: Union[bytes, bytearray, memoryview], cv_imread_flags: int
+) -> bool:
+    """Checks whether simplejpeg decodes `value` to the same image as cv2.imdecode would."""
+    if simplejpeg is None or bytes(value[: len(JPEG_MAGIC)]) != JPEG_MAGIC:
+        return False
+    if cv_imread_flags & ~cv2.IMREAD_IGNORE_ORIENTATION != cv2.IMREAD_COLOR:
+        return False
+    # simplejpeg ignores the EXIF orientation that cv2.imdecode applies
+    return bool(
+        cv_imread_flags & cv2.IMREAD_IGNORE_ORIENTATION
+        or bytes(value[:EXIF_SEARCH_BYTES]).find(b"Exif\x00\x00") == -1
+    )
+
+
+def decode_jpeg(
+    value: Union[bytes, bytearray, memoryview], reuse_decode_buffer: bool = False
+) -> np.ndarray:
+    """
+    Decode a JPEG to a BGR image with simplejpeg.
+
+    Args:
+        value (Union[bytes, bytearray, memoryview]): The JPEG data.
+        reuse_decode_buffer (bool): If true, the image is decoded into a buffer owned by the calling
+            thread, allocated once per image size.
+
+    Returns:
+        np.ndarray: The decoded image.
+    """
+    try:
+        buffer = None
+        if reuse_decode_buffer:
+            height, width, _, _ = simplejpeg.decode_jpeg_header(value)
+            buffer = getattr(_decode_buffers, "buffer", None)
+            if buffer is None or buffer.shape != (height, width, 3):
+                buffer = np.empty((height, width, 3), dtype=np.uint8)
+                _decode_buffers.buffer = buffer
+        return simplejpeg.decode_jpeg(value, colorspace="BGR", buffer=buffer)
+    except ValueError as error:
+        raise InputImageLoadError(f"Could not decode JPEG image. Cause: {error}")
+
+
+def load_image_from_raw_buffer(
+    value: Union[bytes, bytearray, memoryview],
+    shape: Union[str, Sequence[int]],
+    dtype: str = "uint8",
+) -> np.ndarray:
+    """
+    Wrap raw pixel data, e.g. the body of an application/octet-stream request, without a copy.
+
+    Args:
+        value (Union[bytes, bytearray, memoryview]): The pixels, C-contiguous, channels last.
+        shape (Union[str, Sequence[int]]): The image shape, either a sequence or a string like "480,640,3".
+        dtype (str): The numpy dtype of the pixels.
+
+    Returns:
+        np.ndarray: The image, read-only if `value` is immutable.
+
+    Raises:
+        InvalidNumpyInput: If the shape or dtype is invalid or does not match the data size.
+    """
+    try:
+        if isinstance(shape, str):
+            shape = tuple(int(dim) for dim in shape.replace("x", ",").split(","))
+        dtype = np.dtype(dtype)
+    except (ValueError, TypeError) as error:
+        raise InvalidNumpyInput(
+            f"Invalid raw image shape {shape} or dtype {dtype}. Cause: {error}"
+        ) from error
+    expected_size = int(np.prod(shape)) * dtype.itemsize
+    if len(shape) == 0 or any(dim <= 0 for dim in shape) or len(value) != expected_size:
+        raise InvalidNumpyInput(
+            f"Raw image data of {len(value)} bytes does not match shape {shape} and dtype {dtype}."
+        )
+    data = np.frombuffer(value, dtype=dtype).reshape(shape)
+    validate_numpy_image(data=data)
+    return data
+
+
 IMAGE_LOADERS = {
     ImageType.BASE64: load_image_base64,
+    ImageType.BYTES: load_image_from_encoded_bytes,
     ImageType.FILE: cv2.imread,
     ImageType.MULTIPART: load_image_from_buffer,
     ImageType.NUMPY: lambda v, _: load_image_from_numpy_str(v),
@@ -0,0 +1,120 @@
+import hashlib
+import os
+import uuid
+from threading import Lock
+from typing import Dict, List, Optional
+
+import numpy as np
+
+EMBEDDING_SUFFIX = ".npy"
+
+
+class TextEmbeddingStore:
+    """
+    TextEmbeddingStore keeps one normalized CLIP text embedding per class name on disk.
+
+    Every class is a (D,) float32 .npy file named after a hash of the class name. A file is
+    written to a temporary path and renamed into place, so readers in other processes never
+    see a partial embedding, and concurrent writers never share a file: two processes adding
+    the same class both write the same embedding and the last rename wins. Embeddings read
+    from disk are kept in memory.
+
+    Attributes:
+        cache_dir (str): The directory holding the store.
+        embeddings (Dict[str, np.ndarray]): The embeddings read or written by this instance, by class name.
+    """
+
+    def __init__(self, cache_dir: str) -> None:
+        """
+        Initializes the store, the embeddings are read on first use.
+
+        Args:
+            cache_dir (str): The directory holding the store, created if needed.
+        """
+        self.cache_dir = cache_dir
+        self.embeddings: Dict[str, np.ndarray] = dict()
+        self._lock = Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def path(self, class_name: str) -> str:
+        """
+        Gets the file of a class name.
+
+        Args:
+            class_name (str): The class name.
+
+        Returns:
+            str: The path of its embedding, whether it exists or not.
+        """
+        digest = hashlib.sha256(class_name.encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, digest + EMBEDDING_SUFFIX)
+
+    def _read(self, class_name: str) -> Optional[np.ndarray]:
+        embedding = self.embeddings.get(class_name)
+        if embedding is None:
+            try:
+                embedding = np.load(self.path(class_name))
+            except (OSError, ValueError):
+                return None
+            self.embeddings[class_name] = embedding
+        return embedding
+
+    def __contains__(self, class_name: str) -> bool:
+        return class_name in self.embeddings or os.path.exists(self.path(class_name))
+
+    def __len__(self) -> int:
+        return sum(
+            1
+            for name in os.listdir(self.cache_dir)
+            if name.endswith(EMBEDDING_SUFFIX) and not name.startswith(".")
+        )
+
+    def missing(self, class_names: List[str]) -> List[str]:
+        """
+        Gets the class names that have no stored embedding, without duplicates.
+
+        Args:
+            class_names (List[str]): The class names to look up.
+
+        Returns:
+            List[str]: The unknown class names, in order of first appearance.
+        """
+        return list(dict.fromkeys(c for c in class_names if c not in self))
+
+    def get(self, class_names: List[str]) -> Optional[np.ndarray]:
+        """
+        Gets the embeddings of the given class names.
+
+        Args:
+            class_names (List[str]): The class names, all of them must be stored.
+
+        Returns:
+            Optional[np.ndarray]: A (len(class_names), D) float32 array, or None if a class is unknown.
+        """
+        with self._lock:
+            rows = [self._read(c) for c in class_names]
+        if any(row is None for row in rows):
+            return None
+        return np.stack(rows)
+
+    def add(self, class_names: List[str], embeddings: np.ndarray) -> None:
+        """
+        Stores the embeddings of new class names, classes already stored are skipped.
+
+        Args:
+            class_names (List[str]): The class names.
+            embeddings (np.ndarray): A (len(class_names), D) array of their embeddings.
+        """
+        embeddings = np.asarray(embeddings, dtype=np.float32).reshape(len(class_names), -1)
+        with self._lock:
+            for class_name, embedding in zip(class_names, embeddings):
+                if class_name in self:
+                    continue
+                self._write(class_name, embedding)
+                self.embeddings[class_name] = embedding.copy()
+
+    def _write(self, class_name: str, embedding: np.ndarray) -> None:
+        tmp_path = os.path.join(self.cache_dir, f".tmp-{uuid.uuid4().hex}{EMBEDDING_SUFFIX}")
+        with open(tmp_path, "wb") as f:
+            np.save(f, embedding)
+        os.replace(tmp_path, self.path(class_name))
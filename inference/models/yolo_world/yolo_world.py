@@ -1,19 +1,17 @@
 from time import perf_counter
-from typing import Any
+from typing import Any, List, Optional, Union
 
+import torch
 from ultralytics import YOLO
 
-from inference.core.cache import cache
 from inference.core.entities.requests.yolo_world import YOLOWorldInferenceRequest
-from inference.core.entities.responses.inference import (
-    InferenceResponseImage,
-    ObjectDetectionInferenceResponse,
-    ObjectDetectionPrediction,
-)
+from inference.core.entities.responses.detections import DetectionsInferenceResponse
+from inference.core.entities.responses.inference import InferenceResponseImage
+from inference.core.env import YOLO_WORLD_TEXT_EMBEDDINGS_DIR
 from inference.core.models.defaults import DEFAULT_CONFIDENCE
 from inference.core.models.roboflow import RoboflowCoreModel
-from inference.core.utils.hash import get_string_list_hash
 from inference.core.utils.image_utils import load_image_rgb
+from inference.models.yolo_world.text_embeddings import TextEmbeddingStore
 
 
 class YOLOWorld(RoboflowCoreModel):
@@ -23,11 +21,18 @@ class YOLOWorld(RoboflowCoreModel):
         model: The GroundingDINO model.
     """
 
-    def __init__(self, *args, model_id="yolo_world/l", **kwargs):
+    def __init__(
+        self,
+        *args,
+        model_id="yolo_world/l",
+        text_embeddings_dir=YOLO_WORLD_TEXT_EMBEDDINGS_DIR,
+        **kwargs,
+    ):
         """Initializes the YOLO-World model.
 
         Args:
             *args: Variable length argument list.
+            text_embeddings_dir (str): Directory of the persistent per-class text embedding store.
             **kwargs: Arbitrary keyword arguments.
         """
 
@@ -35,6 +40,7 @@ class YOLOWorld(RoboflowCoreModel):
 
         self.model = YOLO(self.cache_file("yolo-world.pt"))
         self.class_names = None
+        self.text_embeddings = TextEmbeddingStore(text_embeddings_dir)
 
     def preproc_image(self, image: Any):
         """Preprocesses an image.
@@ -51,7 +57,7 @@ class YOLOWorld(RoboflowCoreModel):
     def infer_from_request(
         self,
         request: YOLOWorldInferenceRequest,
-    ) -> ObjectDetectionInferenceResponse:
+    ) -> DetectionsInferenceResponse:
         """
         Perform inference based on the details provided in the request, and return the associated responses.
         """
@@ -69,71 +75,134 @@ class YOLOWorld(RoboflowCoreModel):
         Run inference on a provided image.
 
         Args:
-            request (CVInferenceRequest): The inference request.
-            class_filter (Optional[List[str]]): A list of class names to filter, if provided.
+            image (Any): The image to run inference on.
+            text (list): The class names, by default the class names already set.
+            confidence (float): The confidence threshold.
 
         Returns:
-            GroundingDINOInferenceRequest: The inference response.
+            DetectionsInferenceResponse: The inference response.
         """
-        t1 = perf_counter()
-        image = self.preproc_image(image)
-        img_dims = image.shape
+        return self.infer_batch([image], text=text, confidence=confidence)[0]
+
+    def infer_batch(
+        self,
+        images: List[Any],
+        text: Optional[Union[List[str], List[List[str]]]] = None,
+        confidence: float = DEFAULT_CONFIDENCE,
+        **kwargs,
+    ) -> List[DetectionsInferenceResponse]:
+        """
+        Run inference on a list of images.
 
-        if text is not None and text != self.class_names:
-            self.set_classes(text)
-        if self.class_names is None:
+        Images that share a class list go through a single predict call. Images with
+        different class lists are grouped by class list, one predict call per group,
+        since the text features of a forward pass are shared by the whole batch.
+
+        Args:
+            images (List[Any]): The images to run inference on.
+            text (Optional[Union[List[str], List[List[str]]]]): The class names of all images,
+                or one list of class names per image. By default the class names already set.
+            confidence (float): The confidence threshold.
+
+        Returns:
+            List[DetectionsInferenceResponse]: One inference response per image.
+        """
+        t1 = perf_counter()
+        if not text:
+            text = [None] * len(images)
+        elif isinstance(text[0], str):
+            text = [text] * len(images)
+        text = [self.class_names if classes is None else classes for classes in text]
+        if any(classes is None for classes in text):
             raise ValueError(
                 "Class names not set and not provided in the request. Must set class names before inference or provide them via the argument `text`."
             )
-        results = self.model.predict(
-            image,
-            conf=confidence,
-            verbose=False,
-        )[0]
+        np_images = [self.preproc_image(image) for image in images]
+
+        groups = dict()
+        for idx, classes in enumerate(text):
+            groups.setdefault(tuple(classes), []).append(idx)
+
+        results = [None] * len(images)
+        for classes, indices in groups.items():
+            classes = list(classes)
+            if classes != self.class_names:
+                self.set_classes(classes)
+            group_results = self.model.predict(
+                [np_images[idx] for idx in indices],
+                conf=confidence,
+                verbose=False,
+            )
+            for idx, result in zip(indices, group_results):
+                results[idx] = result
 
         t2 = perf_counter() - t1
 
-        predictions = []
-        for i, box in enumerate(results.boxes):
-            x, y, w, h = box.xywh.tolist()[0]
-            class_id = int(box.cls)
-            predictions.append(
-                ObjectDetectionPrediction(
-                    **{
-                        "x": x,
-                        "y": y,
-                        "width": w,
-                        "height": h,
-                        "confidence": float(box.conf),
-                        "class": self.class_names[class_id],
-                        "class_id": class_id,
-                    }
-                )
-            )
+        return [
+            self.make_response(result, classes, np_image.shape, t2)
+            for result, classes, np_image in zip(results, text, np_images)
+        ]
+
+    def make_response(
+        self, result: Any, class_names: List[str], img_dims: tuple, time: float
+    ) -> DetectionsInferenceResponse:
+        """Build the response of one image from the box tensors of its result.
 
-        responses = ObjectDetectionInferenceResponse(
-            predictions=predictions,
+        Args:
+            result (ultralytics.engine.results.Results): The prediction of the image.
+            class_names (List[str]): The class names the image was run with.
+            img_dims (tuple): The shape of the image.
+            time (float): The inference time.
+
+        Returns:
+            DetectionsInferenceResponse: The inference response, serialized in the schema of `ObjectDetectionInferenceResponse`.
+        """
+        boxes = result.boxes
+        # one device to host copy per field, the boxes stay columnar until serialized
+        return DetectionsInferenceResponse(
+            xyxy=boxes.xyxy.cpu().numpy(),
+            confidence=boxes.conf.cpu().numpy(),
+            class_id=boxes.cls.int().cpu().numpy(),
+            class_names=class_names,
             image=InferenceResponseImage(width=img_dims[1], height=img_dims[0]),
-            time=t2,
+            time=time,
         )
-        return responses
 
     def set_classes(self, text: list):
         """Set the class names for the model.
 
+        The text features are assembled from the per-class embedding store, only class names
+        never seen before are run through the CLIP text encoder.
+
         Args:
             text (list): The class names.
         """
-        text_hash = get_string_list_hash(text)
-        cached_embeddings = cache.get_numpy(text_hash)
-        if cached_embeddings is not None:
-            self.model.model.txt_feats = cached_embeddings
-            self.model.model.model[-1].nc = len(text)
-        else:
-            self.model.set_classes(text)
-            cache.set_numpy(text_hash, self.model.model.txt_feats, expire=300)
+        self.preload_classes(text)
+        txt_feats = torch.from_numpy(self.text_embeddings.get(text))
+        self.model.model.txt_feats = txt_feats.reshape(1, len(text), -1)
+        self.model.model.model[-1].nc = len(text)
+        self.model.model.names = text
+        if self.model.predictor is not None:
+            self.model.predictor.model.names = text
         self.class_names = text
 
+    def preload_classes(self, text: List[str]):
+        """Compute and store the text embeddings of the class names not in the store yet.
+
+        Args:
+            text (List[str]): The class names.
+        """
+        missing = self.text_embeddings.missing(text)
+        if len(missing) == 0:
+            return
+        world_model = self.model.model
+        # WorldModel.set_classes overwrites the current vocabulary, put it back afterwards
+        current_txt_feats, current_nc = world_model.txt_feats, world_model.model[-1].nc
+        world_model.set_classes(missing)
+        txt_feats = world_model.txt_feats.reshape(len(missing), -1)
+        world_model.txt_feats, world_model.model[-1].nc = current_txt_feats, current_nc
+        self.text_embeddings.add(missing, txt_feats.float().cpu().numpy())
+
     def get_infer_bucket_file_list(self) -> list:
         """Get the list of required files for inference.
 
@@ -2,6 +2,7 @@
 # Han Cai, Junyan Li, Muyan Hu, Chuang Gan, Song Han
 # International Conference on Computer Vision (ICCV), 2023
 
+import inspect
 import io
 import os
 
@@ -14,7 +15,14 @@ __all__ = ["export_onnx"]
 
 
 def export_onnx(
-    model: nn.Module, export_path: str, sample_inputs: any, simplify=True, opset=11
+    model: nn.Module,
+    export_path: str,
+    sample_inputs: any,
+    simplify=True,
+    opset=11,
+    input_names: list[str] or None = None,
+    output_names: list[str] or None = None,
+    dynamic_axes: dict or None = None,
 ) -> None:
     """Export a model to a platform-specific onnx format.
 
@@ -24,12 +32,29 @@ def export_onnx(
         sample_inputs: Any.
         simplify: a flag to turn on onnx-simplifier
         opset: int
+        input_names: names of the graph inputs.
+        output_names: names of the graph outputs.
+        dynamic_axes: dynamic axes of the inputs and outputs, as in torch.onnx.export.
     """
     model.eval()
 
+    # newer torch versions default to the dynamo exporter, which does not support dynamic_axes the same way
+    export_kwargs = {}
+    if "dynamo" in inspect.signature(torch.onnx.export).parameters:
+        export_kwargs["dynamo"] = False
+
     buffer = io.BytesIO()
     with torch.no_grad():
-        torch.onnx.export(model, sample_inputs, buffer, opset_version=opset)
+        torch.onnx.export(
+            model,
+            sample_inputs,
+            buffer,
+            opset_version=opset,
+            input_names=input_names,
+            output_names=output_names,
+            dynamic_axes=dynamic_axes,
+            **export_kwargs,
+        )
         buffer.seek(0, 0)
         if simplify:
             onnx_model = onnx.load_model(buffer)
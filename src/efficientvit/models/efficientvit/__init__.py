@@ -5,4 +5,5 @@
 from .backbone import *
 from .cls import *
 from .sam import *
+from .sam_onnx import *
 from .seg import *
@@ -3,6 +3,11 @@
 # International Conference on Computer Vision (ICCV), 2023
 
 import copy
+import hashlib
+import os
+import threading
+import uuid
+from collections import OrderedDict
 
 import numpy as np
 import torch
@@ -31,7 +36,9 @@ __all__ = [
     "SamResize",
     "SamNeck",
     "EfficientViTSamImageEncoder",
+    "build_sam_transform",
     "EfficientViTSam",
+    "SamImageEmbeddingCache",
     "EfficientViTSamPredictor",
     "EfficientViTSamAutomaticMaskGenerator",
     "efficientvit_sam_l0",
@@ -192,6 +199,20 @@ class EfficientViTSamImageEncoder(nn.Module):
         return output
 
 
+def build_sam_transform(image_size: tuple[int, int]) -> transforms.Compose:
+    return transforms.Compose(
+        [
+            SamResize(image_size[1]),
+            transforms.ToTensor(),
+            transforms.Normalize(
+                mean=[123.675 / 255, 116.28 / 255, 103.53 / 255],
+                std=[58.395 / 255, 57.12 / 255, 57.375 / 255],
+            ),
+            SamPad(image_size[1]),
+        ]
+    )
+
+
 class EfficientViTSam(nn.Module):
     mask_threshold: float = 0.0
     image_format: str = "RGB"
@@ -210,17 +231,7 @@ class EfficientViTSam(nn.Module):
 
         self.image_size = image_size
 
-        self.transform = transforms.Compose(
-            [
-                SamResize(self.image_size[1]),
-                transforms.ToTensor(),
-                transforms.Normalize(
-                    mean=[123.675 / 255, 116.28 / 255, 103.53 / 255],
-                    std=[58.395 / 255, 57.12 / 255, 57.375 / 255],
-                ),
-                SamPad(self.image_size[1]),
-            ]
-        )
+        self.transform = build_sam_transform(self.image_size)
 
     def postprocess_masks(
         self,
@@ -241,9 +252,117 @@ class EfficientViTSam(nn.Module):
         return masks
 
 
+class SamImageEmbeddingCache:
+    """
+    LRU cache of image embeddings keyed by a hash of the image content, bounded by
+    `max_bytes` of device memory. With `spill_dir`, embeddings evicted from memory are
+    written as .npy files (bounded by `max_spill_bytes`) and memory-mapped back on lookup
+    instead of re-running the image encoder. `namespace` separates models sharing a spill_dir.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = 256 * 1024**2,
+        spill_dir: str or None = None,
+        max_spill_bytes: int = 4 * 1024**3,
+        namespace: str = "",
+    ) -> None:
+        self.max_bytes = max_bytes
+        self.spill_dir = spill_dir
+        self.max_spill_bytes = max_spill_bytes
+        self.namespace = namespace
+        self.entries = OrderedDict()
+        self.total_bytes = 0
+        self.spilled = OrderedDict()
+        self.lock = threading.Lock()
+        self.stats = {"hits": 0, "spill_hits": 0, "misses": 0}
+        if spill_dir is not None:
+            os.makedirs(spill_dir, exist_ok=True)
+            files = []
+            for name in os.listdir(spill_dir):
+                if name.startswith(".tmp-"):
+                    # half-written embedding of a crashed process
+                    os.remove(os.path.join(spill_dir, name))
+                elif name.endswith(".npy"):
+                    files.append(name)
+            files = sorted(files, key=lambda name: os.path.getmtime(os.path.join(spill_dir, name)))
+            for name in files:
+                self.spilled[name[: -len(".npy")]] = os.path.getsize(os.path.join(spill_dir, name))
+
+    def make_key(self, image: np.ndarray) -> str:
+        image = np.ascontiguousarray(image)
+        digest = hashlib.sha256(str((self.namespace, image.shape, image.dtype.str)).encode("utf-8"))
+        digest.update(image.data)
+        return digest.hexdigest()
+
+    def spill_path(self, key: str) -> str:
+        return os.path.join(self.spill_dir, f"{key}.npy")
+
+    def get(self, key: str, device: torch.device, dtype: torch.dtype or None = None) -> torch.Tensor or None:
+        with self.lock:
+            features = self.entries.get(key)
+            if features is not None:
+                self.entries.move_to_end(key)
+                self.stats["hits"] += 1
+                return features
+            if key not in self.spilled:
+                self.stats["misses"] += 1
+                return None
+            self.spilled.move_to_end(key)
+            self.stats["spill_hits"] += 1
+            # copy-on-write mapping, only the pages of this embedding are read
+            features = torch.from_numpy(np.load(self.spill_path(key), mmap_mode="c"))
+        features = features.to(device=device, dtype=dtype)
+        self.put(key, features)
+        return features
+
+    def put(self, key: str, features: torch.Tensor) -> None:
+        evicted = []
+        with self.lock:
+            if key in self.entries:
+                self.total_bytes -= self.num_bytes(self.entries.pop(key))
+            self.entries[key] = features
+            self.total_bytes += self.num_bytes(features)
+            while self.total_bytes > self.max_bytes and len(self.entries) > 1:
+                evicted_key, evicted_features = self.entries.popitem(last=False)
+                self.total_bytes -= self.num_bytes(evicted_features)
+                evicted.append((evicted_key, evicted_features))
+        if self.spill_dir is not None:
+            for evicted_key, evicted_features in evicted:
+                self.spill(evicted_key, evicted_features)
+
+    def spill(self, key: str, features: torch.Tensor) -> None:
+        if key in self.spilled:
+            return
+        if features.dtype == torch.bfloat16:
+            # numpy has no bfloat16, `get` casts back to the dtype of the model
+            features = features.float()
+        tmp_path = os.path.join(self.spill_dir, f".tmp-{uuid.uuid4().hex}.npy")
+        np.save(tmp_path, features.detach().cpu().numpy())
+        os.replace(tmp_path, self.spill_path(key))
+        with self.lock:
+            self.spilled[key] = os.path.getsize(self.spill_path(key))
+            while sum(self.spilled.values()) > self.max_spill_bytes and len(self.spilled) > 1:
+                evicted_key, _ = self.spilled.popitem(last=False)
+                if os.path.exists(self.spill_path(evicted_key)):
+                    os.remove(self.spill_path(evicted_key))
+
+    @staticmethod
+    def num_bytes(features: torch.Tensor) -> int:
+        return features.numel() * features.element_size()
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+            self.total_bytes = 0
+
+
 class EfficientViTSamPredictor:
-    def __init__(self, sam_model: EfficientViTSam) -> None:
+    def __init__(
+        self, sam_model: EfficientViTSam, embedding_cache: SamImageEmbeddingCache or None = None
+    ) -> None:
         self.model = sam_model
+        self.embedding_cache = embedding_cache
         self.reset_image()
 
     @property
@@ -254,6 +373,10 @@ class EfficientViTSamPredictor:
     def device(self):
         return get_device(self.model)
 
+    @property
+    def dtype(self):
+        return next(self.model.parameters()).dtype
+
     def reset_image(self) -> None:
         self.is_image_set = False
         self.features = None
@@ -272,6 +395,18 @@ class EfficientViTSamPredictor:
         boxes = self.apply_coords(boxes.reshape(-1, 2, 2))
         return boxes.reshape(-1, 4)
 
+    def apply_coords_torch(self, coords: torch.Tensor, im_size=None) -> torch.Tensor:
+        old_h, old_w = self.original_size
+        new_h, new_w = self.input_size
+        coords = coords.clone().to(torch.float)
+        coords[..., 0] = coords[..., 0] * (new_w / old_w)
+        coords[..., 1] = coords[..., 1] * (new_h / old_h)
+        return coords
+
+    def apply_boxes_torch(self, boxes: torch.Tensor, im_size=None) -> torch.Tensor:
+        boxes = self.apply_coords_torch(boxes.reshape(-1, 2, 2))
+        return boxes.reshape(-1, 4)
+
     @torch.inference_mode()
     def set_image(self, image: np.ndarray, image_format: str = "RGB") -> None:
         assert image_format in [
@@ -288,12 +423,21 @@ class EfficientViTSamPredictor:
             *self.original_size, long_side_length=self.model.image_size[0]
         )
 
-        torch_data = (
-            self.model.transform(image).unsqueeze(dim=0).to(get_device(self.model))
-        )
-        self.features = self.model.image_encoder(torch_data)
+        key = None
+        if self.embedding_cache is not None:
+            key = self.embedding_cache.make_key(image)
+            self.features = self.embedding_cache.get(key, self.device, dtype=self.dtype)
+
+        if self.features is None:
+            self.features = self.encode_image(image)
+            if self.embedding_cache is not None:
+                self.embedding_cache.put(key, self.features)
         self.is_image_set = True
 
+    def encode_image(self, image: np.ndarray) -> torch.Tensor:
+        torch_data = self.model.transform(image).unsqueeze(dim=0).to(self.device)
+        return self.model.image_encoder(torch_data)
+
     def predict(
         self,
         point_coords: np.ndarray or None = None,
@@ -340,7 +484,7 @@ class EfficientViTSamPredictor:
                 "An image must be set with .set_image(...) before mask prediction."
             )
 
-        device = get_device(self.model)
+        device = self.device
         # Transform input prompts
         coords_torch, labels_torch, box_torch, mask_input_torch = None, None, None, None
         if point_coords is not None:
@@ -377,6 +521,77 @@ class EfficientViTSamPredictor:
         low_res_masks = low_res_masks[0].detach().cpu().numpy()
         return masks, iou_predictions, low_res_masks
 
+    @torch.inference_mode()
+    def predict_batch(
+        self,
+        point_coords: np.ndarray or torch.Tensor or None = None,
+        point_labels: np.ndarray or torch.Tensor or None = None,
+        boxes: np.ndarray or torch.Tensor or None = None,
+        mask_input: np.ndarray or torch.Tensor or None = None,
+        multimask_output: bool = False,
+        return_logits: bool = False,
+        output_size: tuple[int, int] or None = None,
+    ) -> tuple[torch.Tensor, torch.Tensor, torch.Tensor]:
+        """
+        Predict masks for N prompts at once, using the currently set image.
+        Unlike `predict`, the prompts are decoded in one batch and the results
+        stay on the device of the model.
+
+        Arguments:
+          point_coords (np.ndarray, torch.Tensor or None): A NxKx2 array of K point
+            prompts for each of the N masks. Each point is in (X,Y) in pixels.
+          point_labels (np.ndarray, torch.Tensor or None): A NxK array of labels for
+            the point prompts. 1 indicates a foreground point and 0 indicates a
+            background point.
+          boxes (np.ndarray, torch.Tensor or None): A Nx4 array of box prompts, in
+            XYXY format.
+          mask_input (np.ndarray, torch.Tensor or None): A low resolution mask input
+            of form Nx1xHxW, where for SAM, H=W=256.
+          multimask_output (bool): If true, the model will return three masks per
+            prompt.
+          return_logits (bool): If true, returns un-thresholded masks logits
+            instead of a binary mask.
+          output_size (tuple(int, int) or None): The (H, W) of the returned masks,
+            e.g. the latent resolution of a diffusion model. Defaults to the
+            original image size.
+
+        Returns:
+          (torch.Tensor): The output masks in NxCxHxW format, where C is the
+            number of masks per prompt, and (H, W) is `output_size`.
+          (torch.Tensor): An array of shape NxC containing the model's
+            predictions for the quality of each mask.
+          (torch.Tensor): An array of shape NxCxHxW, where H=W=256. These low
+            resolution logits can be passed to a subsequent iteration as mask input.
+        """
+        if not self.is_image_set:
+            raise RuntimeError(
+                "An image must be set with .set_image(...) before mask prediction."
+            )
+
+        device = self.device
+        coords_torch, labels_torch, box_torch, mask_input_torch = None, None, None, None
+        if point_coords is not None:
+            assert (
+                point_labels is not None
+            ), "point_labels must be supplied if point_coords is supplied."
+            coords_torch = self.apply_coords_torch(torch.as_tensor(point_coords, device=device))
+            labels_torch = torch.as_tensor(point_labels, dtype=torch.int, device=device)
+        if boxes is not None:
+            box_torch = self.apply_boxes_torch(torch.as_tensor(boxes, device=device))
+        if mask_input is not None:
+            mask_input_torch = torch.as_tensor(mask_input, dtype=torch.float, device=device)
+
+        masks, iou_predictions, low_res_masks = self.predict_torch(
+            coords_torch,
+            labels_torch,
+            box_torch,
+            mask_input_torch,
+            multimask_output,
+            return_logits=return_logits,
+            output_size=output_size,
+        )
+        return masks, iou_predictions, low_res_masks
+
     @torch.inference_mode()
     def predict_torch(
         self,
@@ -386,6 +601,7 @@ class EfficientViTSamPredictor:
         mask_input: torch.Tensor or None = None,
         multimask_output: bool = True,
         return_logits: bool = False,
+        output_size: tuple[int, int] or None = None,
     ) -> tuple[torch.Tensor, torch.Tensor, torch.Tensor]:
         """
         Predict masks for the given input prompts, using the currently set image.
@@ -412,10 +628,12 @@ class EfficientViTSamPredictor:
             input prompts, multimask_output=False can give better results.
           return_logits (bool): If true, returns un-thresholded masks logits
             instead of a binary mask.
+          output_size (tuple(int, int) or None): The (H, W) of the returned masks.
+            Defaults to the original image size.
 
         Returns:
           (torch.Tensor): The output masks in BxCxHxW format, where C is the
-            number of masks, and (H, W) is the original image size.
+            number of masks, and (H, W) is `output_size`.
           (torch.Tensor): An array of shape BxC containing the model's
             predictions for the quality of each mask.
           (torch.Tensor): An array of shape BxCxHxW, where C is the number
@@ -450,7 +668,7 @@ class EfficientViTSamPredictor:
 
         # Upscale the masks to the original image resolution
         masks = self.model.postprocess_masks(
-            low_res_masks, self.input_size, self.original_size
+            low_res_masks, self.input_size, output_size or self.original_size
         )
 
         if not return_logits:
@@ -0,0 +1,296 @@
+# EfficientViT: Multi-Scale Linear Attention for High-Resolution Dense Prediction
+# Han Cai, Junyan Li, Muyan Hu, Chuang Gan, Song Han
+# International Conference on Computer Vision (ICCV), 2023
+
+import copy
+import json
+import os
+
+import numpy as np
+import torch
+import torch.nn as nn
+
+from src.efficientvit.models.efficientvit.sam import (EfficientViTSam,
+                                                  EfficientViTSamPredictor,
+                                                  SamImageEmbeddingCache,
+                                                  build_sam_transform)
+
+__all__ = [
+    "SamImageEncoderOnnxModel",
+    "SamPromptEncoderOnnxModel",
+    "SamMaskDecoderOnnxModel",
+    "export_sam_onnx",
+    "EfficientViTSamOnnx",
+    "EfficientViTSamOnnxPredictor",
+]
+
+
+SAM_ONNX_FILES = {
+    "image_encoder": "image_encoder.onnx",
+    "prompt_encoder": "prompt_encoder.onnx",
+    "mask_decoder": "mask_decoder.onnx",
+}
+# the graphs have a fixed image size, stored next to them so that they are not run with another one
+SAM_ONNX_CONFIG = "config.json"
+
+
+class SamImageEncoderOnnxModel(nn.Module):
+    def __init__(self, model: EfficientViTSam) -> None:
+        super().__init__()
+        self.image_encoder = model.image_encoder
+
+    def forward(self, image: torch.Tensor) -> torch.Tensor:
+        return self.image_encoder(image)
+
+
+class SamPromptEncoderOnnxModel(nn.Module):
+    """Box prompts only, so that the number of boxes can be a dynamic axis."""
+
+    def __init__(self, model: EfficientViTSam) -> None:
+        super().__init__()
+        self.prompt_encoder = model.prompt_encoder
+
+    def forward(self, boxes: torch.Tensor) -> tuple[torch.Tensor, torch.Tensor]:
+        sparse_embeddings = self.prompt_encoder._embed_boxes(boxes)
+        dense_embeddings = self.prompt_encoder.no_mask_embed.weight.reshape(1, -1, 1, 1).expand(
+            boxes.shape[0], -1, *self.prompt_encoder.image_embedding_size
+        )
+        return sparse_embeddings, dense_embeddings
+
+
+class SamMaskDecoderOnnxModel(nn.Module):
+    """
+    MaskDecoder.predict_masks for a single image and N prompts. The image embedding is
+    broadcast instead of repeat_interleave'd and the positional encoding is baked in.
+    Returns the logits and IoU predictions of all mask tokens, the caller picks the
+    single or multimask outputs.
+    """
+
+    def __init__(self, model: EfficientViTSam) -> None:
+        super().__init__()
+        self.mask_decoder = model.mask_decoder
+        self.register_buffer("image_pe", model.prompt_encoder.get_dense_pe().detach().clone())
+
+    def forward(
+        self,
+        image_embeddings: torch.Tensor,
+        sparse_prompt_embeddings: torch.Tensor,
+        dense_prompt_embeddings: torch.Tensor,
+    ) -> tuple[torch.Tensor, torch.Tensor]:
+        decoder = self.mask_decoder
+        num_prompts = sparse_prompt_embeddings.shape[0]
+
+        output_tokens = torch.cat([decoder.iou_token.weight, decoder.mask_tokens.weight], dim=0)
+        output_tokens = output_tokens.unsqueeze(0).expand(num_prompts, -1, -1)
+        tokens = torch.cat((output_tokens, sparse_prompt_embeddings), dim=1)
+
+        src = image_embeddings + dense_prompt_embeddings
+        pos_src = self.image_pe.expand(num_prompts, -1, -1, -1)
+        b, c, h, w = src.shape
+
+        hs, src = decoder.transformer(src, pos_src, tokens)
+        iou_token_out = hs[:, 0, :]
+        mask_tokens_out = hs[:, 1 : (1 + decoder.num_mask_tokens), :]
+
+        src = src.transpose(1, 2).reshape(b, c, h, w)
+        upscaled_embedding = decoder.output_upscaling(src)
+        hyper_in = torch.stack(
+            [
+                decoder.output_hypernetworks_mlps[i](mask_tokens_out[:, i, :])
+                for i in range(decoder.num_mask_tokens)
+            ],
+            dim=1,
+        )
+        b, c, h, w = upscaled_embedding.shape
+        masks = (hyper_in @ upscaled_embedding.reshape(b, c, h * w)).reshape(b, -1, h, w)
+        iou_predictions = decoder.iou_prediction_head(iou_token_out)
+        return masks, iou_predictions
+
+
+def export_sam_onnx(model: EfficientViTSam, export_dir: str, opset=17, simplify=False) -> dict[str, str]:
+    """
+    Export the image encoder, prompt encoder and mask decoder as three onnx graphs, along with
+    the image size of the model. The model is left untouched, a float32 CPU copy is exported.
+    """
+    from src.efficientvit.apps.utils.export import export_onnx
+
+    model = copy.deepcopy(model).cpu().float().eval()
+    embedding_size = model.prompt_encoder.image_embedding_size
+    image = torch.zeros(1, 3, model.image_size[1], model.image_size[1])
+    boxes = torch.tensor([[0.0, 0.0, 64.0, 64.0], [32.0, 32.0, 256.0, 256.0]])
+    image_embeddings = torch.zeros(1, model.prompt_encoder.embed_dim, *embedding_size)
+
+    paths = {name: os.path.join(export_dir, file_name) for name, file_name in SAM_ONNX_FILES.items()}
+    export_onnx(
+        SamImageEncoderOnnxModel(model),
+        paths["image_encoder"],
+        (image,),
+        simplify=simplify,
+        opset=opset,
+        input_names=["image"],
+        output_names=["image_embeddings"],
+    )
+
+    prompt_encoder = SamPromptEncoderOnnxModel(model)
+    export_onnx(
+        prompt_encoder,
+        paths["prompt_encoder"],
+        (boxes,),
+        simplify=simplify,
+        opset=opset,
+        input_names=["boxes"],
+        output_names=["sparse_prompt_embeddings", "dense_prompt_embeddings"],
+        dynamic_axes={
+            "boxes": {0: "num_prompts"},
+            "sparse_prompt_embeddings": {0: "num_prompts"},
+            "dense_prompt_embeddings": {0: "num_prompts"},
+        },
+    )
+
+    with torch.no_grad():
+        sparse_prompt_embeddings, dense_prompt_embeddings = prompt_encoder(boxes)
+    export_onnx(
+        SamMaskDecoderOnnxModel(model),
+        paths["mask_decoder"],
+        (image_embeddings, sparse_prompt_embeddings, dense_prompt_embeddings),
+        simplify=simplify,
+        opset=opset,
+        input_names=["image_embeddings", "sparse_prompt_embeddings", "dense_prompt_embeddings"],
+        output_names=["low_res_masks", "iou_predictions"],
+        dynamic_axes={
+            "sparse_prompt_embeddings": {0: "num_prompts"},
+            "dense_prompt_embeddings": {0: "num_prompts"},
+            "low_res_masks": {0: "num_prompts"},
+            "iou_predictions": {0: "num_prompts"},
+        },
+    )
+
+    paths["config"] = os.path.join(export_dir, SAM_ONNX_CONFIG)
+    with open(paths["config"], "w") as f:
+        json.dump({"image_size": list(model.image_size)}, f)
+    return paths
+
+
+class EfficientViTSamOnnx:
+    """
+    The three exported graphs of an EfficientViTSam, run with ONNX Runtime. The image size is
+    read from the export unless given; `providers` defaults to the CPU.
+    """
+
+    mask_threshold: float = EfficientViTSam.mask_threshold
+    image_format: str = EfficientViTSam.image_format
+    postprocess_masks = EfficientViTSam.postprocess_masks
+
+    def __init__(
+        self,
+        export_dir: str,
+        image_size: tuple[int, int] or None = None,
+        providers: list[str] or None = None,
+        num_threads: int or None = None,
+    ) -> None:
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        if num_threads is not None:
+            options.intra_op_num_threads = num_threads
+        providers = providers or ["CPUExecutionProvider"]
+        self.sessions = {
+            name: ort.InferenceSession(os.path.join(export_dir, file_name), options, providers=providers)
+            for name, file_name in SAM_ONNX_FILES.items()
+        }
+        if image_size is None:
+            with open(os.path.join(export_dir, SAM_ONNX_CONFIG)) as f:
+                image_size = json.load(f)["image_size"]
+        self.image_size = tuple(image_size)
+        self.transform = build_sam_transform(self.image_size)
+
+    @staticmethod
+    def is_exported(export_dir: str) -> bool:
+        file_names = [*SAM_ONNX_FILES.values(), SAM_ONNX_CONFIG]
+        return all(os.path.exists(os.path.join(export_dir, file_name)) for file_name in file_names)
+
+    def image_encoder(self, image: np.ndarray) -> np.ndarray:
+        return self.sessions["image_encoder"].run(None, {"image": image})[0]
+
+    def prompt_encoder(self, boxes: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        return tuple(self.sessions["prompt_encoder"].run(None, {"boxes": boxes}))
+
+    def mask_decoder(
+        self,
+        image_embeddings: np.ndarray,
+        sparse_prompt_embeddings: np.ndarray,
+        dense_prompt_embeddings: np.ndarray,
+    ) -> tuple[np.ndarray, np.ndarray]:
+        return tuple(
+            self.sessions["mask_decoder"].run(
+                None,
+                {
+                    "image_embeddings": image_embeddings,
+                    "sparse_prompt_embeddings": sparse_prompt_embeddings,
+                    "dense_prompt_embeddings": dense_prompt_embeddings,
+                },
+            )
+        )
+
+
+class EfficientViTSamOnnxPredictor(EfficientViTSamPredictor):
+    """
+    EfficientViTSamPredictor backed by EfficientViTSamOnnx, on the execution providers of its
+    sessions. Only box prompts are supported; results are CPU tensors.
+    """
+
+    def __init__(
+        self, sam_model: EfficientViTSamOnnx, embedding_cache: SamImageEmbeddingCache or None = None
+    ) -> None:
+        super().__init__(sam_model, embedding_cache)
+
+    @property
+    def device(self):
+        return torch.device("cpu")
+
+    @property
+    def dtype(self):
+        return torch.float32
+
+    def encode_image(self, image: np.ndarray) -> torch.Tensor:
+        image = self.model.transform(image).unsqueeze(dim=0).numpy()
+        return torch.from_numpy(self.model.image_encoder(image))
+
+    @torch.inference_mode()
+    def predict_torch(
+        self,
+        point_coords: torch.Tensor or None = None,
+        point_labels: torch.Tensor or None = None,
+        boxes: torch.Tensor or None = None,
+        mask_input: torch.Tensor or None = None,
+        multimask_output: bool = True,
+        return_logits: bool = False,
+        output_size: tuple[int, int] or None = None,
+    ) -> tuple[torch.Tensor, torch.Tensor, torch.Tensor]:
+        if not self.is_image_set:
+            raise RuntimeError(
+                "An image must be set with .set_image(...) before mask prediction."
+            )
+        if point_coords is not None or mask_input is not None or boxes is None:
+            raise NotImplementedError("The onnx backend only supports box prompts.")
+
+        sparse_embeddings, dense_embeddings = self.model.prompt_encoder(
+            boxes.detach().cpu().numpy().astype(np.float32)
+        )
+        low_res_masks, iou_predictions = self.model.mask_decoder(
+            self.features.numpy(), sparse_embeddings, dense_embeddings
+        )
+
+        # same selection as MaskDecoder.forward
+        mask_slice = slice(1, None) if multimask_output else slice(0, 1)
+        low_res_masks = torch.from_numpy(low_res_masks[:, mask_slice])
+        iou_predictions = torch.from_numpy(iou_predictions[:, mask_slice])
+
+        masks = self.model.postprocess_masks(
+            low_res_masks, self.input_size, output_size or self.original_size
+        )
+
+        if not return_logits:
+            masks = masks > self.model.mask_threshold
+
+        return masks, iou_predictions, low_res_masks
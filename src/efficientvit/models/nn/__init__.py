@@ -4,5 +4,6 @@
 
 from .act import *
 from .drop import *
+from .fuse import *
 from .norm import *
 from .ops import *
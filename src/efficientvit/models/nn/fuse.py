@@ -0,0 +1,90 @@
+# EfficientViT: Multi-Scale Linear Attention for High-Resolution Dense Prediction
+# Han Cai, Junyan Li, Muyan Hu, Chuang Gan, Song Han
+# International Conference on Computer Vision (ICCV), 2023
+
+import copy
+
+import torch
+import torch.nn as nn
+
+from src.efficientvit.models.nn.ops import (ConvLayer, DAGBlock, IdentityLayer,
+                                        OpSequential)
+
+__all__ = ["fuse_conv_bn", "fuse_for_inference"]
+
+
+@torch.no_grad()
+def fuse_conv_bn(conv: nn.Conv2d, bn: nn.BatchNorm2d) -> nn.Conv2d:
+    fused = nn.Conv2d(
+        conv.in_channels,
+        conv.out_channels,
+        kernel_size=conv.kernel_size,
+        stride=conv.stride,
+        padding=conv.padding,
+        dilation=conv.dilation,
+        groups=conv.groups,
+        bias=True,
+        padding_mode=conv.padding_mode,
+    ).to(device=conv.weight.device, dtype=conv.weight.dtype)
+
+    # compute the folded parameters in float32, BN statistics of fp16 models lose precision otherwise
+    scale = torch.rsqrt(bn.running_var.float() + bn.eps)
+    shift = -bn.running_mean.float() * scale
+    if bn.affine:
+        scale = scale * bn.weight.float()
+        shift = shift * bn.weight.float() + bn.bias.float()
+    fused.weight.copy_(conv.weight.float() * scale.view(-1, 1, 1, 1))
+    if conv.bias is not None:
+        shift = shift + conv.bias.float() * scale
+    fused.bias.copy_(shift)
+    return fused
+
+
+def flatten_ops(op_list: list[nn.Module]) -> list[nn.Module]:
+    flat_list = []
+    for op in op_list:
+        if isinstance(op, OpSequential):
+            flat_list.extend(flatten_ops(op.op_list))
+        elif not isinstance(op, IdentityLayer):
+            flat_list.append(op)
+    return flat_list
+
+
+def fuse_module(module: nn.Module) -> nn.Module:
+    if isinstance(module, ConvLayer):
+        if isinstance(module.norm, nn.BatchNorm2d) and module.norm.track_running_stats:
+            module.conv = fuse_conv_bn(module.conv, module.norm)
+            module.norm = None
+        return module
+
+    if isinstance(module, OpSequential):
+        op_list = [fuse_module(op) for op in flatten_ops(module.op_list)]
+        if len(op_list) == 1:
+            return op_list[0]
+        module.op_list = nn.ModuleList(op_list)
+        return module
+
+    if isinstance(module, DAGBlock):
+        # the graph keeps its dict interface, only the ops it walks are flattened
+        module.input_ops = nn.ModuleList([fuse_module(op) for op in module.input_ops])
+        if module.post_input is not None:
+            module.post_input = fuse_module(module.post_input)
+        module.middle = fuse_module(module.middle)
+        module.output_ops = nn.ModuleList([fuse_module(op) for op in module.output_ops])
+        return module
+
+    for name, child in module.named_children():
+        setattr(module, name, fuse_module(child))
+    return module
+
+
+def fuse_for_inference(model: nn.Module, inplace=False) -> nn.Module:
+    """
+    Returns an equivalent inference-only model: BatchNorm layers are folded into the
+    convolutions of ConvLayer, nested OpSequential are flattened and IdentityLayer ops
+    are removed from them. The model is put in eval mode; training the result is not supported.
+    """
+    if not inplace:
+        model = copy.deepcopy(model)
+    model.eval()
+    return fuse_module(model)
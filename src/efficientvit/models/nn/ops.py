@@ -440,6 +440,50 @@ class LiteMLA(nn.Module):
         out = torch.reshape(out, (B, -1, H, W))
         return out
 
+    @autocast(enabled=False)
+    def relu_linear_att_inference(self, qkv: torch.Tensor) -> torch.Tensor:
+        # same attention as relu_linear_att, computed in the channel-first layout of qkv: no transposes,
+        # and the normalizer comes from the sum of k instead of a ones column padded to v
+        B, _, H, W = list(qkv.size())
+
+        qkv = torch.reshape(
+            qkv,
+            (
+                B,
+                -1,
+                3 * self.dim,
+                H * W,
+            ),
+        )
+        q, k, v = (
+            qkv[:, :, 0 : self.dim],
+            qkv[:, :, self.dim : 2 * self.dim],
+            qkv[:, :, 2 * self.dim :],
+        )
+
+        # lightweight linear attention
+        q = self.kernel_func(q)
+        k = self.kernel_func(k)
+
+        eps = self.eps
+        if qkv.dtype != torch.float32:
+            # average instead of sum over the H*W tokens to stay in the fp16 range, the scale cancels out
+            k.mul_(1.0 / (H * W))
+            eps = eps / (H * W)
+
+        # linear matmul
+        kv = torch.matmul(v, k.transpose(-1, -2))
+        out = torch.matmul(kv, q)
+        normalizer = torch.matmul(k.sum(dim=-1, keepdim=True).transpose(-1, -2), q)
+        if qkv.dtype == torch.float16:
+            # eps underflows in fp16, an all-zero query would give 0 / 0
+            out = (out.float() / (normalizer.float() + eps)).to(qkv.dtype)
+        else:
+            out = out / (normalizer + eps)
+
+        out = torch.reshape(out, (B, -1, H, W))
+        return out
+
     def forward(self, x: torch.Tensor) -> torch.Tensor:
         # generate multi-scale q, k, v
         qkv = self.qkv(x)
@@ -448,7 +492,11 @@ class LiteMLA(nn.Module):
             multi_scale_qkv.append(op(qkv))
         multi_scale_qkv = torch.cat(multi_scale_qkv, dim=1)
 
-        out = self.relu_linear_att(multi_scale_qkv)
+        if self.training or multi_scale_qkv.dtype == torch.float32:
+            out = self.relu_linear_att(multi_scale_qkv)
+        else:
+            # fp16/bf16 inference: skips the fp32 upcast and the padded copy of v of relu_linear_att
+            out = self.relu_linear_att_inference(multi_scale_qkv)
         out = self.proj(out)
 
         return out
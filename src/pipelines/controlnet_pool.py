@@ -0,0 +1,125 @@
+import itertools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import torch
+from diffusers import ControlNetModel
+
+
+class ControlNetPool:
+    '''
+    Registry of ControlNet variants that loads each checkpoint once and hands the pipeline
+    a reference to the resident model, instead of calling `ControlNetModel.from_pretrained`
+    every time the condition type changes.
+
+    With `offload=False` every loaded ControlNet stays on `device`. With `offload=True` only the
+    active one lives on `device` and every model keeps its weights in pinned CPU buffers. Swapping
+    in copies those buffers to the device on a side CUDA stream, so the host does not wait for the
+    transfer and the copy overlaps with the work queued before the ControlNet is first used.
+    The weights are never written, so swapping out only points the model back at its pinned
+    buffers, without a device to host copy.
+    '''
+    def __init__(self, device, dtype=torch.float16, offload=False):
+        self.device = torch.device(device)
+        self.dtype = dtype
+        self.offload = offload and self.device.type == "cuda"
+        self.checkpoints = {}
+        self.models = {}
+        self.loading = {}
+        self.active = None
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.stream = torch.cuda.Stream(self.device) if self.offload else None
+        self.ready_events = {}
+        self.host_tensors = {}
+        self.stats = {"loads": 0, "hits": 0, "prefetches": 0, "transfers": 0}
+
+    def register(self, name, checkpoint, **from_pretrained_kwargs):
+        self.checkpoints[name] = (checkpoint, from_pretrained_kwargs)
+
+    def add(self, name, controlnet):
+        # register a ControlNet that has already been loaded, e.g. the one the pipeline was built with
+        with self.lock:
+            self.models[name] = controlnet
+            if controlnet.device.type == self.device.type:
+                self.active = name
+            elif self.offload:
+                self.pin_memory(name, controlnet)
+
+    def load(self, name):
+        checkpoint, from_pretrained_kwargs = self.checkpoints[name]
+        controlnet = ControlNetModel.from_pretrained(checkpoint, torch_dtype=self.dtype, **from_pretrained_kwargs)
+        controlnet.eval()
+        if self.offload:
+            self.pin_memory(name, controlnet)
+        else:
+            controlnet.to(self.device)
+        with self.lock:
+            self.models[name] = controlnet
+            self.stats["loads"] += 1
+        return controlnet
+
+    def prefetch(self, name):
+        # start reading the checkpoint in the background, `get` joins the pending load
+        with self.lock:
+            if name not in self.checkpoints or name in self.models or name in self.loading:
+                return
+            self.loading[name] = self.executor.submit(self.load, name)
+            self.stats["prefetches"] += 1
+
+    def get(self, name):
+        with self.lock:
+            future = self.loading.pop(name, None)
+        if future is not None:
+            future.result()
+        with self.lock:
+            controlnet = self.models.get(name)
+            if controlnet is not None:
+                self.stats["hits"] += 1
+        if controlnet is None:
+            controlnet = self.load(name)
+
+        if self.offload and self.active != name:
+            self.swap_in(name)
+        self.active = name
+        if name in self.ready_events:
+            torch.cuda.current_stream(self.device).wait_event(self.ready_events.pop(name))
+        return controlnet
+
+    def swap_in(self, name):
+        # the side stream must not overwrite weights that queued kernels still read
+        self.stream.wait_stream(torch.cuda.current_stream(self.device))
+        with torch.cuda.stream(self.stream):
+            if self.active is not None:
+                self.swap_out(self.active)
+            for tensor, host in zip(self.tensors(self.models[name]), self.host_tensors[name]):
+                tensor.data = host.to(self.device, non_blocking=True)
+            event = torch.cuda.Event()
+            event.record(self.stream)
+        self.ready_events[name] = event
+        self.stats["transfers"] += 1
+
+    def swap_out(self, name):
+        # runs on the side stream, after the work queued on the current stream
+        tensors = self.tensors(self.models[name])
+        if name not in self.host_tensors:
+            # a model added while on the device is copied out once, into new pinned buffers
+            host_tensors = [torch.empty(tensor.shape, dtype=tensor.dtype, pin_memory=True) for tensor in tensors]
+            for host, tensor in zip(host_tensors, tensors):
+                host.copy_(tensor.data, non_blocking=True)
+            self.host_tensors[name] = host_tensors
+        for tensor, host in zip(tensors, self.host_tensors[name]):
+            # keep the device memory from being reused before the side stream is done with it
+            tensor.data.record_stream(self.stream)
+            tensor.data = host
+
+    @staticmethod
+    def tensors(model):
+        return list(itertools.chain(model.parameters(), model.buffers()))
+
+    def pin_memory(self, name, model):
+        for tensor in self.tensors(model):
+            if not tensor.data.is_pinned():
+                tensor.data = tensor.data.cpu().pin_memory()
+        self.host_tensors[name] = [tensor.data for tensor in self.tensors(model)]
+        return model
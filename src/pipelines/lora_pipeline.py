@@ -1,4 +1,6 @@
 import inspect
+from contextlib import contextmanager, nullcontext
+from functools import partial
 from typing import Any, Callable, Dict, List, Optional, Tuple, Union
 
 import numpy as np
@@ -42,6 +44,7 @@ from diffusers.utils import (
 from diffusers.utils.torch_utils import is_compiled_module, is_torch_version, randn_tensor
 from diffusers.pipelines.pipeline_utils import DiffusionPipeline
 from diffusers.pipelines.stable_diffusion_xl.pipeline_output import StableDiffusionXLPipelineOutput
+from peft.tuners.tuners_utils import BaseTunerLayer
 
 
 if is_invisible_watermark_available():
@@ -56,6 +59,8 @@ from torch import einsum
 import math
 from torchvision.utils import save_image
 
+from src.pipelines.region_concepts import composite_region_noise, region_composite_weights, run_region_and_base
+
 logger = logging.get_logger(__name__)  # pylint: disable=invalid-name
 
 class RegionControlNet_AttnProcessor:
@@ -107,15 +112,32 @@ class RegionControlNet_AttnProcessor:
         key = attn.to_k(encoder_hidden_states, *args)
         value = attn.to_v(encoder_hidden_states, *args)
 
-        query = attn.head_to_batch_dim(query)
-        key = attn.head_to_batch_dim(key)
-        value = attn.head_to_batch_dim(value)
+        if self.controller.edits_attention(is_cross, query.shape[1], self.place_in_unet):
+            query = attn.head_to_batch_dim(query)
+            key = attn.head_to_batch_dim(key)
+            value = attn.head_to_batch_dim(value)
 
-        attention_probs = attn.get_attention_scores(query, key, attention_mask)
-        attention_probs = self.controller(attention_probs, is_cross, self.place_in_unet)
-        hidden_states = torch.bmm(attention_probs, value)
+            attention_probs = attn.get_attention_scores(query, key, attention_mask)
+            attention_probs = self.controller(attention_probs, is_cross, self.place_in_unet)
+            hidden_states = torch.bmm(attention_probs, value)
 
-        hidden_states = attn.batch_to_head_dim(hidden_states)
+            hidden_states = attn.batch_to_head_dim(hidden_states)
+        else:
+            # the controller leaves this layer untouched at this step, so the attention probabilities
+            # are never materialized and the fused kernel of scaled_dot_product_attention is used
+            head_dim = key.shape[-1] // attn.heads
+            query = query.view(batch_size, -1, attn.heads, head_dim).transpose(1, 2)
+            key = key.view(batch_size, -1, attn.heads, head_dim).transpose(1, 2)
+            value = value.view(batch_size, -1, attn.heads, head_dim).transpose(1, 2)
+            if attention_mask is not None:
+                attention_mask = attention_mask.view(batch_size, attn.heads, -1, attention_mask.shape[-1])
+
+            hidden_states = F.scaled_dot_product_attention(
+                query, key, value, attn_mask=attention_mask, dropout_p=0.0, is_causal=False
+            )
+            hidden_states = hidden_states.transpose(1, 2).reshape(batch_size, -1, attn.heads * head_dim)
+            hidden_states = hidden_states.to(query.dtype)
+            self.controller.skip()
 
         # linear proj
         hidden_states = attn.to_out[0](hidden_states, *args)
@@ -151,6 +173,60 @@ def revise_regionally_controlnet_forward(unet, controller):
     print(f'Number of attention layer registered {cross_attention_idx}')
     controller.num_att_layers = cross_attention_idx*2
 
+
+class MultiAdapterLoraRouter:
+    '''
+    Per-row LoRA routing for a PEFT-patched UNet: every contiguous block of rows in a batch
+    runs through its own set of adapters, so all region concepts can share one UNet forward
+    instead of calling `set_adapters` between serial passes.
+    '''
+    def __init__(self, model):
+        self.lora_layers = [module for module in model.modules()
+                            if isinstance(module, BaseTunerLayer) and hasattr(module, "lora_A")]
+        self.plans = {}
+
+    def snapshot(self):
+        # record the adapters (and their scaling) currently activated through `set_adapters`
+        snapshot = {}
+        for layer in self.lora_layers:
+            if layer.merged:
+                raise ValueError("MultiAdapterLoraRouter can not route merged LoRA layers, unmerge them first.")
+            snapshot[layer] = [(name, layer.scaling[name]) for name in layer.active_adapters if name in layer.lora_A]
+        return snapshot
+
+    def prepare(self, snapshots, rows_per_route, lora_scale=1.0):
+        # snapshots[k] is applied to rows [k * rows_per_route, (k + 1) * rows_per_route)
+        self.plans = {}
+        for layer in self.lora_layers:
+            plan = []
+            for k, snapshot in enumerate(snapshots):
+                adapters = [(layer.lora_A[name], layer.lora_B[name], layer.lora_dropout[name], scaling * lora_scale)
+                            for name, scaling in snapshot[layer]]
+                if len(adapters) > 0:
+                    plan.append((slice(k * rows_per_route, (k + 1) * rows_per_route), adapters))
+            self.plans[layer] = plan
+
+    @staticmethod
+    def routed_forward(layer, plan, x, *args, **kwargs):
+        result = layer.base_layer(x, *args, **kwargs)
+        if layer.disable_adapters:
+            return result
+        for rows, adapters in plan:
+            x_rows = x[rows]
+            for lora_A, lora_B, dropout, scaling in adapters:
+                result[rows] += lora_B(lora_A(dropout(x_rows.to(lora_A.weight.dtype)))) * scaling
+        return result
+
+    @contextmanager
+    def route(self):
+        for layer, plan in self.plans.items():
+            layer.forward = partial(self.routed_forward, layer, plan)
+        try:
+            yield
+        finally:
+            for layer in self.plans:
+                layer.__dict__.pop("forward", None)
+
 class LoraMultiConceptPipeline(StableDiffusionXLControlNetPipeline):
     # leave controlnet out on purpose because it iterates with unet
     model_cpu_offload_seq = "text_encoder->text_encoder_2->image_encoder->unet->vae"
@@ -207,6 +283,7 @@ class LoraMultiConceptPipeline(StableDiffusionXLControlNetPipeline):
             self.watermark = None
 
         self.register_to_config(force_zeros_for_empty_prompt=force_zeros_for_empty_prompt)
+        self._divergence_latents = None
 
     @torch.no_grad()
     def __call__(
@@ -251,6 +328,13 @@ class LoraMultiConceptPipeline(StableDiffusionXLControlNetPipeline):
         region_masks=None,
         lora_list=None,
         styleL=None,
+        style_adapter="style",
+        batched_concepts=False,
+        prompt_cache=None,
+        overlap_concepts=False,
+        divergence_step: int = 16,
+        resume_from_latents: Optional[torch.FloatTensor] = None,
+        start_step: Optional[int] = None,
         **kwargs,
     ):
         callback = kwargs.pop("callback", None)
@@ -288,7 +372,11 @@ class LoraMultiConceptPipeline(StableDiffusionXLControlNetPipeline):
         self._cross_attention_kwargs = cross_attention_kwargs
 
         # 2. Define call parameters
-        batch_size = 2
+        # the global prompt holds the two copies (layout and edited) of every request in the batch
+        num_requests = len(prompt[0]) // 2 if isinstance(prompt[0], list) else 1
+        batch_size = 2 * num_requests
+        if controller is not None:
+            controller.num_requests = num_requests
 
         device = self._execution_device
 
@@ -309,45 +397,75 @@ class LoraMultiConceptPipeline(StableDiffusionXLControlNetPipeline):
 
         global_prompt = prompt[0]
         global_negative_prompt = negative_prompt
-        region_prompts = [pt[0] for pt in prompt[1]]
-        region_negative_prompts = [pt[1] for pt in prompt[1]]
-
-        (
-            prompt_embeds,
-            negative_prompt_embeds,
-            pooled_prompt_embeds,
-            negative_pooled_prompt_embeds,
-        ) = self.encode_prompt(
-            global_prompt,
-            prompt_2,
-            device,
-            num_images_per_prompt,
-            self.do_classifier_free_guidance,
-            global_negative_prompt,
-            negative_prompt_2,
-            prompt_embeds=prompt_embeds,
-            negative_prompt_embeds=negative_prompt_embeds,
-            pooled_prompt_embeds=pooled_prompt_embeds,
-            negative_pooled_prompt_embeds=negative_pooled_prompt_embeds,
-            lora_scale=text_encoder_lora_scale,
-            clip_skip=self.clip_skip,
-        )
+        # a region prompt is shared by every request of the batch or given as one prompt per request
+        region_prompts = [pt[0] if isinstance(pt[0], list) else [pt[0]] * num_requests for pt in prompt[1]]
+        region_negative_prompts = [pt[1] if isinstance(pt[1], list) else [pt[1]] * num_requests for pt in prompt[1]]
+
+        if prompt_cache is not None and prompt_embeds is None:
+            (
+                prompt_embeds,
+                negative_prompt_embeds,
+                pooled_prompt_embeds,
+                negative_pooled_prompt_embeds,
+            ) = prompt_cache.encode(
+                self,
+                prompt=global_prompt,
+                prompt_2=prompt_2,
+                device=device,
+                num_images_per_prompt=num_images_per_prompt,
+                do_classifier_free_guidance=self.do_classifier_free_guidance,
+                negative_prompt=global_negative_prompt,
+                negative_prompt_2=negative_prompt_2,
+                lora_scale=text_encoder_lora_scale,
+                clip_skip=self.clip_skip,
+            )
+        else:
+            (
+                prompt_embeds,
+                negative_prompt_embeds,
+                pooled_prompt_embeds,
+                negative_pooled_prompt_embeds,
+            ) = self.encode_prompt(
+                global_prompt,
+                prompt_2,
+                device,
+                num_images_per_prompt,
+                self.do_classifier_free_guidance,
+                global_negative_prompt,
+                negative_prompt_2,
+                prompt_embeds=prompt_embeds,
+                negative_prompt_embeds=negative_prompt_embeds,
+                pooled_prompt_embeds=pooled_prompt_embeds,
+                negative_pooled_prompt_embeds=negative_pooled_prompt_embeds,
+                lora_scale=text_encoder_lora_scale,
+                clip_skip=self.clip_skip,
+            )
 
         region_prompt_embeds_list = []
         region_add_text_embeds_list = []
+        region_adapter_snapshots = []
+        if stage == 2 and batched_concepts:
+            concept_router = MultiAdapterLoraRouter(concept_models.unet)
         for lora_param, region_prompt, region_negative_prompt in zip(lora_list, region_prompts, region_negative_prompts):
             if styleL:
-                concept_models.set_adapters([lora_param, "style"], adapter_weights=[0.7, 0.5])
+                concept_models.set_adapters([lora_param, style_adapter], adapter_weights=[0.7, 0.5])
             else:
                 concept_models.set_adapters(lora_param)
-            region_prompt_embeds, region_negative_prompt_embeds, region_pooled_prompt_embeds, region_negative_pooled_prompt_embeds = concept_models.encode_prompt(
+            if stage == 2 and batched_concepts:
+                region_adapter_snapshots.append(concept_router.snapshot())
+            encode_prompt = concept_models.encode_prompt if prompt_cache is None else partial(prompt_cache.encode, concept_models)
+            region_prompt_embeds, region_negative_prompt_embeds, region_pooled_prompt_embeds, region_negative_pooled_prompt_embeds = encode_prompt(
                 prompt=region_prompt, device=concept_models._execution_device, num_images_per_prompt=1, do_classifier_free_guidance=True, negative_prompt=region_negative_prompt, lora_scale=text_encoder_lora_scale
             )
             region_prompt_embeds_list.append(torch.concat([region_negative_prompt_embeds, region_prompt_embeds], dim=0).to(concept_models._execution_device))
             region_add_text_embeds_list.append(torch.concat([region_negative_pooled_prompt_embeds, region_pooled_prompt_embeds], dim=0).to(concept_models._execution_device))
 
         if stage==2:
-            mask_list = [mask.float().to(dtype=prompt_embeds.dtype, device=device) if mask is not None else None for mask in region_masks]
+            mask_list = []
+            for region_mask in region_masks:
+                if not isinstance(region_mask, (list, tuple)):
+                    region_mask = [region_mask] * num_requests
+                mask_list.append([mask.float().to(dtype=prompt_embeds.dtype, device=device) if mask is not None else None for mask in region_mask])
 
         # 4. Prepare image
         if isinstance(controlnet, ControlNetModel) and image is not None:
@@ -393,20 +511,29 @@ class LoraMultiConceptPipeline(StableDiffusionXLControlNetPipeline):
         self._num_timesteps = len(timesteps)
 
         # 6. Prepare latent variables
-        num_channels_latents = self.unet.config.in_channels
-        latents = self.prepare_latents(
-            batch_size//2 * num_images_per_prompt,
-            num_channels_latents,
-            height,
-            width,
-            prompt_embeds.dtype,
-            device,
-            generator,
-            latents,
-        )
+        if resume_from_latents is not None:
+            # stage 1 and stage 2 share every step before `divergence_step`, so start from the stage-1 snapshot
+            start_step = divergence_step if start_step is None else start_step
+            latents = resume_from_latents.to(device=device, dtype=prompt_embeds.dtype)
+            if controller is not None:
+                controller.cur_step = start_step
+        else:
+            start_step = 0
+            num_channels_latents = self.unet.config.in_channels
+            latents = self.prepare_latents(
+                batch_size//2 * num_images_per_prompt,
+                num_channels_latents,
+                height,
+                width,
+                prompt_embeds.dtype,
+                device,
+                generator,
+                latents,
+            )
 
-        # 6.1 repeat latent
-        latents = torch.cat([latents, latents.clone()])
+            # 6.1 repeat latent, both copies of a request start from the same noise
+            latents = latents.repeat_interleave(2, dim=0)
+        self._divergence_latents = None
 
         timestep_cond = None
         if self.unet.config.time_cond_proj_dim is not None:
@@ -416,7 +543,9 @@ class LoraMultiConceptPipeline(StableDiffusionXLControlNetPipeline):
             ).to(device=device, dtype=latents.dtype)
 
         # 7. Prepare extra step kwargs. TODO: Logic should ideally just be moved out of the pipeline
-        extra_step_kwargs = self.prepare_extra_step_kwargs(generator, eta)
+        # per-request generators are shared by the two copies of the request
+        step_generator = [g for g in generator for _ in range(2)] if isinstance(generator, list) else generator
+        extra_step_kwargs = self.prepare_extra_step_kwargs(step_generator, eta)
 
         # 7.1 Create tensor stating which controlnets to keep
         controlnet_keep = []
@@ -451,7 +580,7 @@ class LoraMultiConceptPipeline(StableDiffusionXLControlNetPipeline):
         add_time_ids_list = []
         for _ in lora_list:
             region_add_time_ids = concept_models._get_add_time_ids(original_size, crops_coords_top_left, target_size, dtype=prompt_embeds.dtype, text_encoder_projection_dim=text_encoder_projection_dim)
-            add_time_ids_list.append(torch.concat([region_add_time_ids, region_add_time_ids], dim=0).to(concept_models._execution_device))
+            add_time_ids_list.append(region_add_time_ids.repeat(2 * num_requests, 1).to(concept_models._execution_device))
 
         if negative_original_size is not None and negative_target_size is not None:
             negative_add_time_ids = self._get_add_time_ids(
@@ -473,6 +602,24 @@ class LoraMultiConceptPipeline(StableDiffusionXLControlNetPipeline):
         add_text_embeds = add_text_embeds.to(device)
         add_time_ids = add_time_ids.to(device).repeat(batch_size * num_images_per_prompt, 1)
 
+        # 7.3 Precompute the region weights at latent resolution
+        if stage == 2:
+            active_regions, composite_weights = region_composite_weights(mask_list, latents, num_requests)
+
+        # 7.4 Stack the region concepts into a single batched UNet call
+        if stage == 2 and batched_concepts:
+            batched_region_prompt_embeds = torch.cat([region_prompt_embeds_list[idx] for idx in active_regions])
+            batched_region_added_cond_kwargs = {
+                "text_embeds": torch.cat([region_add_text_embeds_list[idx] for idx in active_regions]),
+                "time_ids": torch.cat([add_time_ids_list[idx] for idx in active_regions]),
+            }
+            concept_router.prepare([region_adapter_snapshots[idx] for idx in active_regions], rows_per_route=2 * num_requests, lora_scale=0.8)
+
+        # 7.5 Side stream for the region concepts
+        concept_stream = None
+        if stage == 2 and overlap_concepts and concept_models._execution_device.type == "cuda":
+            concept_stream = torch.cuda.Stream(concept_models._execution_device)
+
         # 8. Denoising loop
         num_warmup_steps = len(timesteps) - num_inference_steps * self.scheduler.order
         is_unet_compiled = is_compiled_module(self.unet)
@@ -481,8 +628,10 @@ class LoraMultiConceptPipeline(StableDiffusionXLControlNetPipeline):
         # hyper-parameters
         scale_range = np.linspace(1, 0.5, len(self.scheduler.timesteps))
 
-        with self.progress_bar(total=num_inference_steps) as progress_bar:
-            for i, t in enumerate(timesteps):
+        with self.progress_bar(total=num_inference_steps - start_step) as progress_bar:
+            for i, t in enumerate(timesteps[start_step:], start=start_step):
+                if stage == 1 and i == divergence_step:
+                    self._divergence_latents = latents.clone()
                 # Relevant thread:
                 # https://dev-discuss.pytorch.org/t/cudagraphs-in-pytorch-2-0/1428
                 if (is_unet_compiled and is_controlnet_compiled) and is_torch_higher_equal_2_1:
@@ -493,119 +642,121 @@ class LoraMultiConceptPipeline(StableDiffusionXLControlNetPipeline):
 
                 added_cond_kwargs = {"text_embeds": add_text_embeds, "time_ids": add_time_ids}
 
-                # controlnet(s) inference
-                if guess_mode and self.do_classifier_free_guidance:
-                    # Infer ControlNet only for the conditional batch.
-                    control_model_input = latents
-                    control_model_input = self.scheduler.scale_model_input(control_model_input, t)
-                    controlnet_prompt_embeds = prompt_embeds.chunk(2)[1]
-                    controlnet_added_cond_kwargs = {
-                        "text_embeds": add_text_embeds.chunk(2)[1],
-                        "time_ids": add_time_ids.chunk(2)[1],
-                    }
-                else:
-                    control_model_input = latent_model_input
-                    controlnet_prompt_embeds = prompt_embeds
-                    controlnet_added_cond_kwargs = added_cond_kwargs
-
-                if isinstance(controlnet_keep[i], list):
-                    cond_scale = [c * s for c, s in zip(controlnet_conditioning_scale, controlnet_keep[i])]
-                else:
-                    controlnet_cond_scale = controlnet_conditioning_scale
-                    if isinstance(controlnet_cond_scale, list):
-                        controlnet_cond_scale = controlnet_cond_scale[0]
-                    cond_scale = controlnet_cond_scale * controlnet_keep[i]
-
-                if image is not None:
-                    down_block_res_samples, mid_block_res_sample = self.controlnet(
-                        control_model_input,
-                        t,
-                        encoder_hidden_states=controlnet_prompt_embeds,
-                        controlnet_cond=image,
-                        conditioning_scale=cond_scale,
-                        guess_mode=guess_mode,
-                        added_cond_kwargs=controlnet_added_cond_kwargs,
-                        return_dict=False,
-                    )
-
-                    if guess_mode and self.do_classifier_free_guidance:
-                        # Infered ControlNet only for the conditional batch.
-                        # To apply the output of ControlNet to both the unconditional and conditional batches,
-                        # add 0 to the unconditional batch to keep it unchanged.
-                        down_block_res_samples = [torch.cat([torch.zeros_like(d), d]) for d in down_block_res_samples]
-                        mid_block_res_sample = torch.cat([torch.zeros_like(mid_block_res_sample), mid_block_res_sample])
-
-                else:
-                    down_block_res_samples = None
-                    mid_block_res_sample = None
-
-
-
-                # predict the noise residual
-                if image is not None:
-                    noise_pred = self.unet(
-                        latent_model_input,
-                        t,
-                        encoder_hidden_states=prompt_embeds,
-                        timestep_cond=timestep_cond,
-                        cross_attention_kwargs=self.cross_attention_kwargs,
-                        down_block_additional_residuals=down_block_res_samples,
-                        mid_block_additional_residual=mid_block_res_sample,
-                        added_cond_kwargs=added_cond_kwargs,
-                        return_dict=False,
-                    )[0]
-                else:
-                    noise_pred = self.unet(
-                        latent_model_input,
-                        t,
-                        encoder_hidden_states=prompt_embeds,
-                        timestep_cond=timestep_cond,
-                        cross_attention_kwargs=self.cross_attention_kwargs,
-                        added_cond_kwargs=added_cond_kwargs,
-                        return_dict=False,
-                    )[0]
-
-                if i > 15 and stage == 2:
-                    region_mask = self.get_region_mask(mask_list, noise_pred.shape[2], noise_pred.shape[3])
-                    edit_noise = torch.concat([noise_pred[1:2], noise_pred[3:4]], dim=0)
-                    new_noise_pred = torch.zeros_like(edit_noise)
-                    new_noise_pred[:, :, region_mask == 0] = edit_noise[:, :, region_mask == 0]
-                    replace_ratio = 1.0
-                    new_noise_pred[:, :, region_mask != 0] = (1 - replace_ratio) * edit_noise[:, :, region_mask != 0]
-
-                    for region_prompt_embeds, region_add_text_embeds, region_add_time_ids, concept_mask, region_prompt, lora_param in zip(region_prompt_embeds_list, region_add_text_embeds_list, add_time_ids_list, mask_list, region_prompts, lora_list):
-                        if concept_mask is not None:
-                            concept_mask = F.interpolate(concept_mask.unsqueeze(0).unsqueeze(0),
-                                                         size=(noise_pred.shape[2], noise_pred.shape[3]),
-                                                         mode='nearest').squeeze().to(dtype=noise_pred.dtype, device=concept_models._execution_device)
-
-
-                            region_latent_model_input = latent_model_input[3:4].clone().to(concept_models._execution_device)
-
-                            region_latent_model_input = torch.cat([region_latent_model_input] * 2)
-                            region_added_cond_kwargs = {"text_embeds": region_add_text_embeds,
-                                                        "time_ids": region_add_time_ids}
+                def region_forward():
+                    # conditional rows of the edited copies
+                    region_latent_model_input = latent_model_input[batch_size + 1::2].to(concept_models._execution_device)
+                    if batched_concepts:
+                        region_latent_model_input = torch.cat([region_latent_model_input] * (2 * len(active_regions)))
+                        with concept_router.route():
+                            region_noise_pred = concept_models.unet(
+                                region_latent_model_input,
+                                t,
+                                encoder_hidden_states=batched_region_prompt_embeds,
+                                added_cond_kwargs=batched_region_added_cond_kwargs,
+                                return_dict=False,
+                            )[0]
+                    else:
+                        region_latent_model_input = torch.cat([region_latent_model_input] * 2)
+                        region_noise_pred = []
+                        for idx in active_regions:
+                            region_added_cond_kwargs = {"text_embeds": region_add_text_embeds_list[idx],
+                                                        "time_ids": add_time_ids_list[idx]}
                             if styleL:
-                                concept_models.set_adapters([lora_param, "style"], adapter_weights=[0.7, 0.5])
+                                concept_models.set_adapters([lora_list[idx], style_adapter], adapter_weights=[0.7, 0.5])
                             else:
-                                concept_models.set_adapters(lora_param)
-                            region_noise_pred = concept_models.unet(
+                                concept_models.set_adapters(lora_list[idx])
+                            region_noise_pred.append(concept_models.unet(
                                 region_latent_model_input,
                                 t,
-                                encoder_hidden_states=region_prompt_embeds,
+                                encoder_hidden_states=region_prompt_embeds_list[idx],
                                 cross_attention_kwargs={'scale': 0.8},
                                 added_cond_kwargs=region_added_cond_kwargs,
                                 return_dict=False,
-                            )[0]
-
-                            new_noise_pred = new_noise_pred.to(concept_models._execution_device)
-                            new_noise_pred[:, :, concept_mask==1] += replace_ratio * (region_noise_pred[:, :, concept_mask==1] / (concept_mask.reshape(1, 1, *concept_mask.shape)[:, :, concept_mask==1].to(region_noise_pred.device)))
-
-
-                    new_noise_pred = new_noise_pred.to(noise_pred.device)
-                    noise_pred[1, :, :, :] = new_noise_pred[0]
-                    noise_pred[3, :, :, :] = new_noise_pred[1]
+                            )[0])
+                        region_noise_pred = torch.cat(region_noise_pred)
+                    return region_noise_pred
 
+                def base_forward():
+                    # controlnet(s) inference
+                    if guess_mode and self.do_classifier_free_guidance:
+                        # Infer ControlNet only for the conditional batch.
+                        control_model_input = latents
+                        control_model_input = self.scheduler.scale_model_input(control_model_input, t)
+                        controlnet_prompt_embeds = prompt_embeds.chunk(2)[1]
+                        controlnet_added_cond_kwargs = {
+                            "text_embeds": add_text_embeds.chunk(2)[1],
+                            "time_ids": add_time_ids.chunk(2)[1],
+                        }
+                    else:
+                        control_model_input = latent_model_input
+                        controlnet_prompt_embeds = prompt_embeds
+                        controlnet_added_cond_kwargs = added_cond_kwargs
+
+                    if isinstance(controlnet_keep[i], list):
+                        cond_scale = [c * s for c, s in zip(controlnet_conditioning_scale, controlnet_keep[i])]
+                    else:
+                        controlnet_cond_scale = controlnet_conditioning_scale
+                        if isinstance(controlnet_cond_scale, list):
+                            controlnet_cond_scale = controlnet_cond_scale[0]
+                        cond_scale = controlnet_cond_scale * controlnet_keep[i]
+
+                    if image is not None:
+                        down_block_res_samples, mid_block_res_sample = self.controlnet(
+                            control_model_input,
+                            t,
+                            encoder_hidden_states=controlnet_prompt_embeds,
+                            controlnet_cond=image,
+                            conditioning_scale=cond_scale,
+                            guess_mode=guess_mode,
+                            added_cond_kwargs=controlnet_added_cond_kwargs,
+                            return_dict=False,
+                        )
+
+                        if guess_mode and self.do_classifier_free_guidance:
+                            # Infered ControlNet only for the conditional batch.
+                            # To apply the output of ControlNet to both the unconditional and conditional batches,
+                            # add 0 to the unconditional batch to keep it unchanged.
+                            down_block_res_samples = [torch.cat([torch.zeros_like(d), d]) for d in down_block_res_samples]
+                            mid_block_res_sample = torch.cat([torch.zeros_like(mid_block_res_sample), mid_block_res_sample])
+
+                    else:
+                        down_block_res_samples = None
+                        mid_block_res_sample = None
+
+                    # predict the noise residual
+                    if image is not None:
+                        noise_pred = self.unet(
+                            latent_model_input,
+                            t,
+                            encoder_hidden_states=prompt_embeds,
+                            timestep_cond=timestep_cond,
+                            cross_attention_kwargs=self.cross_attention_kwargs,
+                            down_block_additional_residuals=down_block_res_samples,
+                            mid_block_additional_residual=mid_block_res_sample,
+                            added_cond_kwargs=added_cond_kwargs,
+                            return_dict=False,
+                        )[0]
+                    else:
+                        noise_pred = self.unet(
+                            latent_model_input,
+                            t,
+                            encoder_hidden_states=prompt_embeds,
+                            timestep_cond=timestep_cond,
+                            cross_attention_kwargs=self.cross_attention_kwargs,
+                            added_cond_kwargs=added_cond_kwargs,
+                            return_dict=False,
+                        )[0]
+                    return noise_pred
+
+                if i >= divergence_step and stage == 2 and len(active_regions) > 0:
+                    # region concepts only depend on the latents of this step: they are launched before the base
+                    # ControlNet/UNet so that they run next to it on the concept device or side stream
+                    noise_pred, region_noise_pred = run_region_and_base(
+                        region_forward, base_forward, device, concept_stream, shared_input=latent_model_input
+                    )
+                    composite_region_noise(noise_pred, region_noise_pred, composite_weights, num_requests)
+                else:
+                    noise_pred = base_forward()
 
                 if self.do_classifier_free_guidance:
                     noise_pred_uncond, noise_pred_text = noise_pred.chunk(2)
@@ -668,14 +819,10 @@ class LoraMultiConceptPipeline(StableDiffusionXLControlNetPipeline):
 
         return StableDiffusionXLPipelineOutput(images=image)
 
+    @property
+    def divergence_latents(self):
+        # latents of the last stage-1 call at `divergence_step`, to be passed as `resume_from_latents` to stage 2
+        return self._divergence_latents
+
     def check_image(self, image, prompt, prompt_embeds):
         pass
-
-    def get_region_mask(self, mask_list, feat_height, feat_width):
-        exclusive_mask = torch.zeros((feat_height, feat_width))
-        for mask in mask_list:
-            if mask is not None:
-                mask = F.interpolate(mask.unsqueeze(0).unsqueeze(0), size=(feat_height, feat_width),
-                                     mode='nearest').squeeze().to(dtype=exclusive_mask.dtype, device=exclusive_mask.device)
-                exclusive_mask = ((mask == 1) | (exclusive_mask == 1)).to(dtype=mask.dtype)
-        return exclusive_mask
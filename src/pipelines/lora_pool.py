@@ -0,0 +1,112 @@
+import os
+import threading
+from collections import OrderedDict
+
+from safetensors.torch import load_file
+
+
+# the style LoRA and the two character LoRAs of one request are active together
+ADAPTERS_PER_REQUEST = 3
+
+
+def lora_adapter_name(lora_path, prefix=""):
+    return prefix + os.path.basename(lora_path).split('.')[0]
+
+
+class LoraResidencyManager:
+    '''
+    Keeps LoRA adapters resident across requests instead of unloading every adapter and
+    re-reading the safetensors files on each call. Adapters live in two LRU tiers:
+        * injected into a pipeline, at most `max_resident_adapters` per pipeline. Switching
+          between resident adapters is a `set_adapters` call; the least recently used one is
+          removed with `delete_adapters` when the pipeline is full.
+        * decoded state dicts on CPU keyed by file path, bounded by `max_cpu_bytes`, so that an
+          evicted adapter is injected again without touching the disk.
+    With `fuse_style=True` the style LoRA of the base pipeline (the only adapter active there)
+    is fused into its weights and stays fused while consecutive requests use the same style.
+    '''
+    def __init__(self, max_resident_adapters=8, max_cpu_bytes=4 * 1024 ** 3, fuse_style=False, style_scale=0.8):
+        if max_resident_adapters < ADAPTERS_PER_REQUEST:
+            raise ValueError(
+                f"max_resident_adapters must be at least {ADAPTERS_PER_REQUEST} (style + 2 characters), "
+                f"got {max_resident_adapters}"
+            )
+        self.max_resident_adapters = max_resident_adapters
+        self.max_cpu_bytes = max_cpu_bytes
+        self.fuse_style = fuse_style
+        self.style_scale = style_scale
+        self.resident = {}
+        self.fused = {}
+        self.state_dicts = OrderedDict()
+        self.lock = threading.Lock()
+        self.stats = {"disk_loads": 0, "cpu_hits": 0, "resident_hits": 0, "evictions": 0}
+
+    def get_state_dict(self, lora_path):
+        if lora_path in self.state_dicts:
+            self.state_dicts.move_to_end(lora_path)
+            self.stats["cpu_hits"] += 1
+            return self.state_dicts[lora_path][0]
+
+        state_dict = load_file(lora_path, device="cpu")
+        num_bytes = sum(tensor.numel() * tensor.element_size() for tensor in state_dict.values())
+        self.stats["disk_loads"] += 1
+        self.state_dicts[lora_path] = (state_dict, num_bytes)
+        while sum(item[1] for item in self.state_dicts.values()) > self.max_cpu_bytes and len(self.state_dicts) > 1:
+            self.state_dicts.popitem(last=False)
+        return state_dict
+
+    def load(self, pipe, lora_path, adapter_name):
+        with self.lock:
+            resident = self.resident.setdefault(pipe, OrderedDict())
+            if adapter_name in resident:
+                resident.move_to_end(adapter_name)
+                self.stats["resident_hits"] += 1
+                return adapter_name
+
+            if len(resident) >= self.max_resident_adapters:
+                self.unfuse(pipe)
+                evicted, _ = resident.popitem(last=False)
+                pipe.delete_adapters(evicted)
+                self.stats["evictions"] += 1
+
+            # diffusers pops keys while converting non-diffusers checkpoints, hand it a shallow copy
+            state_dict = dict(self.get_state_dict(lora_path))
+            pipe.load_lora_weights(state_dict, adapter_name=adapter_name)
+            resident[adapter_name] = lora_path
+            return adapter_name
+
+    def activate_style(self, pipe, style_path):
+        '''
+        Activates the style LoRA on a pipeline that uses no other adapter, or disables LoRA when
+        `style_path` is None.
+        '''
+        if style_path is None:
+            self.unfuse(pipe)
+            if len(self.resident.get(pipe, {})) > 0:
+                pipe.disable_lora()
+            return None
+
+        adapter_name = lora_adapter_name(style_path, prefix="style_")
+        if self.fused.get(pipe) == adapter_name:
+            self.resident[pipe].move_to_end(adapter_name)
+            self.stats["resident_hits"] += 1
+            return adapter_name
+
+        self.unfuse(pipe)
+        self.load(pipe, style_path, adapter_name)
+        pipe.enable_lora()
+        pipe.set_adapters(adapter_name)
+        if self.fuse_style:
+            pipe.fuse_lora(lora_scale=self.style_scale)
+            self.fused[pipe] = adapter_name
+        return adapter_name
+
+    def unfuse(self, pipe):
+        if self.fused.pop(pipe, None) is not None:
+            pipe.unfuse_lora()
+
+    def clear(self, pipe):
+        with self.lock:
+            self.unfuse(pipe)
+            pipe.unload_lora_weights()
+            self.resident.pop(pipe, None)
@@ -0,0 +1,120 @@
+import hashlib
+import threading
+import weakref
+from collections import OrderedDict
+
+import torch
+from peft.tuners.tuners_utils import BaseTunerLayer
+
+# digests of the LoRA weights of one layer, keyed by its lora_A module: reloading an adapter
+# creates new modules, so a reload under an existing name is a miss here and is hashed again
+_lora_weight_digests = weakref.WeakKeyDictionary()
+
+
+def lora_weight_digest(lora_A, lora_B):
+    digest = _lora_weight_digests.get(lora_A)
+    if digest is None:
+        sha = hashlib.sha256()
+        for module in (lora_A, lora_B):
+            weight = module.weight.detach()
+            sha.update(str((tuple(weight.shape), weight.dtype)).encode("utf-8"))
+            # through uint8 since numpy has no bfloat16
+            sha.update(weight.contiguous().view(torch.uint8).cpu().numpy().tobytes())
+        digest = _lora_weight_digests[lora_A] = sha.hexdigest()
+    return digest
+
+
+def text_encoder_lora_key(pipe):
+    '''
+    Identifies the LoRA state that shapes the outputs of the text encoders of `pipe`: for every
+    LoRA layer the active adapters with their scaling and a digest of their weights, whether
+    they are disabled and whether they are merged, folded into one digest per text encoder.
+    Text encoders without LoRA layers contribute nothing, so a LoRA that only patches the UNet
+    does not split the cache.
+    '''
+    key = []
+    for text_encoder in [getattr(pipe, "text_encoder", None), getattr(pipe, "text_encoder_2", None)]:
+        if text_encoder is None:
+            continue
+        sha = None
+        for module in text_encoder.modules():
+            if not isinstance(module, BaseTunerLayer) or not hasattr(module, "lora_A"):
+                continue
+            sha = sha or hashlib.sha256()
+            adapters = tuple(
+                (name, module.scaling.get(name), lora_weight_digest(module.lora_A[name], module.lora_B[name]))
+                for name in module.active_adapters if name in module.lora_A
+            )
+            sha.update(repr((adapters, module.disable_adapters, tuple(module.merged_adapters))).encode("utf-8"))
+        if sha is not None:
+            key.append(sha.hexdigest())
+    return tuple(key)
+
+
+class PromptEmbeddingCache:
+    '''
+    LRU cache of the outputs of `encode_prompt` kept on the execution device and bounded by
+    `max_bytes`. Entries are keyed on the prompt texts, the text encoder LoRA state, the LoRA
+    scale and clip skip, so stage 1, stage 2 and repeated requests skip the dual-CLIP passes.
+    An adapter reloaded under an existing name with other weights gets a new key.
+    '''
+    def __init__(self, max_bytes=256 * 1024 ** 2):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.total_bytes = 0
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(pipe, prompt, negative_prompt, lora_scale, clip_skip, **extra):
+        # prompts may be given as lists of strings, which are not hashable
+        prompt = tuple(prompt) if isinstance(prompt, list) else prompt
+        negative_prompt = tuple(negative_prompt) if isinstance(negative_prompt, list) else negative_prompt
+        extra = {k: tuple(v) if isinstance(v, list) else v for k, v in extra.items()}
+        return (id(pipe), prompt, negative_prompt, text_encoder_lora_key(pipe), lora_scale, clip_skip,
+                tuple(sorted(extra.items())))
+
+    @staticmethod
+    def num_bytes(value):
+        return sum(tensor.numel() * tensor.element_size() for tensor in value if tensor is not None)
+
+    def get(self, key):
+        with self.lock:
+            value = self.entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        value = tuple(value)
+        with self.lock:
+            if key in self.entries:
+                self.total_bytes -= self.num_bytes(self.entries.pop(key))
+            self.entries[key] = value
+            self.total_bytes += self.num_bytes(value)
+            while self.total_bytes > self.max_bytes and len(self.entries) > 1:
+                _, evicted = self.entries.popitem(last=False)
+                self.total_bytes -= self.num_bytes(evicted)
+        return value
+
+    def encode(self, pipe, prompt, negative_prompt=None, lora_scale=None, clip_skip=None, **encode_kwargs):
+        key = self.make_key(
+            pipe, prompt, negative_prompt, lora_scale, clip_skip,
+            **{k: v for k, v in encode_kwargs.items() if not k.endswith("_embeds")},
+        )
+        value = self.get(key)
+        if value is None:
+            value = self.put(key, pipe.encode_prompt(
+                prompt=prompt, negative_prompt=negative_prompt, lora_scale=lora_scale, clip_skip=clip_skip,
+                **encode_kwargs,
+            ))
+        return value
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.total_bytes = 0
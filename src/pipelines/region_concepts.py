@@ -0,0 +1,58 @@
+from contextlib import nullcontext
+
+import torch
+import torch.nn.functional as F
+
+
+def region_composite_weights(mask_list, latents, num_requests):
+    '''
+    Latent-resolution weights of the stage-2 composite. `mask_list[idx][n]` is the mask of region
+    `idx` in request `n` (None when not detected). Returns the regions with at least one mask and
+    a (1 + num_active_regions, num_requests, h, w) tensor: the base prediction is kept outside of
+    every region, overlapping regions add up.
+    '''
+    active_regions = [idx for idx, masks in enumerate(mask_list) if any(mask is not None for mask in masks)]
+    region_weights = latents.new_zeros((len(active_regions), num_requests, *latents.shape[-2:]))
+    for k, idx in enumerate(active_regions):
+        for n, mask in enumerate(mask_list[idx]):
+            if mask is not None:
+                region_weights[k, n] = F.interpolate(mask[None, None], size=latents.shape[-2:], mode='nearest')[0, 0] == 1
+    composite_weights = torch.cat([1 - region_weights.sum(0, keepdim=True).clamp(max=1), region_weights])
+    return active_regions, composite_weights
+
+
+def run_region_and_base(region_forward, base_forward, device, concept_stream=None, shared_input=None):
+    '''
+    One denoising step of stage 2: launches the region concept forward first, on `concept_stream`
+    when given, then the base ControlNet/UNet forward on the current stream, so that the two
+    overlap. `shared_input` is a tensor of the current stream read by the region forward.
+    Returns the base and the region noise predictions, the latter on the device of the former.
+    '''
+    if concept_stream is not None:
+        concept_stream.wait_stream(torch.cuda.current_stream(device))
+        if shared_input is not None and shared_input.device == concept_stream.device:
+            shared_input.record_stream(concept_stream)
+    with torch.cuda.stream(concept_stream) if concept_stream is not None else nullcontext():
+        region_noise_pred = region_forward()
+
+    noise_pred = base_forward()
+
+    if concept_stream is not None:
+        with torch.cuda.stream(concept_stream):
+            region_noise_pred = region_noise_pred.to(noise_pred.device)
+        torch.cuda.current_stream(device).wait_stream(concept_stream)
+        region_noise_pred.record_stream(torch.cuda.current_stream(device))
+    return noise_pred, region_noise_pred.to(noise_pred.device)
+
+
+def composite_region_noise(noise_pred, region_noise_pred, composite_weights, num_requests):
+    '''
+    Composites the region predictions into the odd rows of `noise_pred` in place. The odd rows hold
+    the unconditional and conditional prediction of the edited copies, `region_noise_pred` the
+    [uncond, cond] prediction of every active region, as (num_regions * 2 * num_requests, c, h, w).
+    '''
+    num_regions = composite_weights.shape[0] - 1
+    region_noise_pred = region_noise_pred.view(num_regions, 2, num_requests, *noise_pred.shape[1:])
+    composite_noise = torch.cat([noise_pred[1::2].view(1, 2, num_requests, *noise_pred.shape[1:]), region_noise_pred])
+    noise_pred[1::2] = torch.einsum('rbnchw,rnhw->bnchw', composite_noise, composite_weights).flatten(0, 1)
+    return noise_pred
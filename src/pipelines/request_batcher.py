@@ -0,0 +1,84 @@
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+
+class RequestBatcher:
+    '''
+    Micro-batching scheduler in front of a batched handler. Concurrent callers `submit` a
+    request under a group key and a single worker thread hands the requests that share a key
+    to `handler(requests)` in one call, which returns one result per request. A group is
+    dispatched as soon as it holds `max_batch` requests or its oldest request has waited
+    `max_wait` seconds; groups are served in the order their oldest request arrived. If a
+    batch raises, its requests are retried one at a time so that only the failing ones fail.
+    The handler runs on the worker thread, not in the context of the callers: a decorator or
+    context manager around a caller (e.g. a device lease) does not apply to it.
+    '''
+    def __init__(self, handler, max_batch=4, max_wait=0.05):
+        self.handler = handler
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.pending = OrderedDict()
+        self.deadlines = {}
+        self.condition = threading.Condition()
+        self.stats = {"requests": 0, "batches": 0, "failed_batches": 0}
+        self.worker = threading.Thread(target=self.run, daemon=True)
+        self.worker.start()
+
+    def submit(self, key, request):
+        future = Future()
+        with self.condition:
+            if key not in self.pending:
+                self.pending[key] = []
+                self.deadlines[key] = time.monotonic() + self.max_wait
+            self.pending[key].append((request, future))
+            self.stats["requests"] += 1
+            self.condition.notify()
+        return future
+
+    def __call__(self, key, request):
+        return self.submit(key, request).result()
+
+    def next_batch(self):
+        with self.condition:
+            while True:
+                now = time.monotonic()
+                for key, items in self.pending.items():
+                    if len(items) >= self.max_batch or self.deadlines[key] <= now:
+                        batch = items[:self.max_batch]
+                        if len(items) > self.max_batch:
+                            # the leftover requests have already waited, they go out with the next batch
+                            self.pending[key] = items[self.max_batch:]
+                            self.deadlines[key] = now
+                        else:
+                            del self.pending[key]
+                            del self.deadlines[key]
+                        self.stats["batches"] += 1
+                        return batch
+                timeout = min(self.deadlines.values()) - now if len(self.deadlines) > 0 else None
+                self.condition.wait(timeout)
+
+    def run(self):
+        while True:
+            batch = self.next_batch()
+            try:
+                results = self.handler([request for request, _ in batch])
+            except Exception as e:
+                if len(batch) == 1:
+                    batch[0][1].set_exception(e)
+                    continue
+                self.stats["failed_batches"] += 1
+                self.run_one_by_one(batch)
+                continue
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
+
+    def run_one_by_one(self, batch):
+        for request, future in batch:
+            try:
+                result = self.handler([request])[0]
+            except Exception as e:
+                future.set_exception(e)
+            else:
+                future.set_result(result)
@@ -0,0 +1,169 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+import numpy as np
+import torch
+from PIL import Image
+
+TMP_PREFIX = ".tmp-"
+# an in-progress write of another process is younger than this
+STALE_TMP_SECONDS = 60 * 60
+
+
+def hash_image(image):
+    if image is None:
+        return None
+    if isinstance(image, Image.Image):
+        image = np.asarray(image)
+    image = np.ascontiguousarray(image)
+    digest = hashlib.sha256(str((image.shape, image.dtype.str)).encode("utf-8"))
+    digest.update(image.data)
+    return digest.hexdigest()
+
+
+class Stage1Cache:
+    '''
+    Content-addressed on-disk cache of the stage-1 results of a request: the decoded layout
+    images, the predicted region masks and, optionally, the latents at the step where stage 2
+    diverges from stage 1. Entries are evicted in LRU order once `max_bytes` is exceeded and
+    their tensors are memory-mapped back on lookup.
+
+    Layout of an entry:
+        <cache_dir>/<key>/meta.json
+        <cache_dir>/<key>/image_{i}.png
+        <cache_dir>/<key>/mask_{i}.npy      (missing when the region was not detected)
+        <cache_dir>/<key>/latents.npy       (optional)
+    '''
+    def __init__(self, cache_dir, max_bytes=8 * 1024 ** 3):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(cache_dir, exist_ok=True)
+        self.load_index()
+
+    @staticmethod
+    def make_key(prompt, negative_prompt, seed, resolution, condition, condition_image, lora_paths, style, **extra):
+        fields = {
+            "prompt": prompt,
+            "negative_prompt": negative_prompt,
+            "seed": int(seed),
+            "resolution": list(resolution),
+            "condition": condition,
+            "condition_image": hash_image(condition_image),
+            "lora_paths": list(lora_paths),
+            "style": style,
+        }
+        fields.update(extra)
+        return hashlib.sha256(json.dumps(fields, sort_keys=True).encode("utf-8")).hexdigest()
+
+    @property
+    def total_bytes(self):
+        return sum(self.entries.values())
+
+    def load_index(self):
+        entries = []
+        for key in os.listdir(self.cache_dir):
+            entry_dir = os.path.join(self.cache_dir, key)
+            if key.startswith(TMP_PREFIX):
+                # may be a live write of another process, only remove it once it is stale
+                try:
+                    if time.time() - os.path.getmtime(entry_dir) > STALE_TMP_SECONDS:
+                        shutil.rmtree(entry_dir, ignore_errors=True)
+                except OSError:
+                    pass
+                continue
+            if not os.path.isdir(entry_dir):
+                continue
+            meta_path = os.path.join(entry_dir, "meta.json")
+            if os.path.exists(meta_path):
+                entries.append((os.path.getmtime(meta_path), key, self.entry_bytes(key)))
+            else:
+                # entries are renamed into place complete, this one is left over from an eviction
+                shutil.rmtree(entry_dir, ignore_errors=True)
+        for _, key, num_bytes in sorted(entries):
+            self.entries[key] = num_bytes
+
+    def entry_bytes(self, key):
+        entry_dir = os.path.join(self.cache_dir, key)
+        return sum(os.path.getsize(os.path.join(entry_dir, name)) for name in os.listdir(entry_dir))
+
+    def get(self, key, device=None):
+        with self.lock:
+            if key not in self.entries:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            entry_dir = os.path.join(self.cache_dir, key)
+            with open(os.path.join(entry_dir, "meta.json")) as f:
+                meta = json.load(f)
+            os.utime(os.path.join(entry_dir, "meta.json"))
+
+            images = []
+            for i in range(meta["num_images"]):
+                with Image.open(os.path.join(entry_dir, f"image_{i}.png")) as image:
+                    images.append(image.convert("RGB"))
+            masks = [self.load_tensor(os.path.join(entry_dir, f"mask_{i}.npy"), device) if i in meta["masks"] else None
+                     for i in range(meta["num_masks"])]
+            latents = None
+            if meta["latents_step"] is not None:
+                latents = self.load_tensor(os.path.join(entry_dir, "latents.npy"), device)
+        return {"images": images, "masks": masks, "latents": latents, "latents_step": meta["latents_step"]}
+
+    @staticmethod
+    def load_tensor(path, device=None):
+        # copy-on-write mapping: pages are only read from disk when the tensor is touched
+        tensor = torch.from_numpy(np.load(path, mmap_mode="c"))
+        if device is not None:
+            tensor = tensor.to(device)
+        return tensor
+
+    def put(self, key, images, masks, latents=None, latents_step=None):
+        tmp_dir = os.path.join(self.cache_dir, f"{TMP_PREFIX}{uuid.uuid4().hex}")
+        os.makedirs(tmp_dir)
+        for i, image in enumerate(images):
+            image.save(os.path.join(tmp_dir, f"image_{i}.png"))
+        for i, mask in enumerate(masks):
+            if mask is not None:
+                np.save(os.path.join(tmp_dir, f"mask_{i}.npy"), mask.detach().cpu().numpy())
+        if latents is not None:
+            np.save(os.path.join(tmp_dir, "latents.npy"), latents.detach().cpu().numpy())
+        meta = {
+            "num_images": len(images),
+            "num_masks": len(masks),
+            "masks": [i for i, mask in enumerate(masks) if mask is not None],
+            "latents_step": latents_step if latents is not None else None,
+        }
+        with open(os.path.join(tmp_dir, "meta.json"), "w") as f:
+            json.dump(meta, f)
+
+        entry_dir = os.path.join(self.cache_dir, key)
+        with self.lock:
+            if key in self.entries:
+                shutil.rmtree(entry_dir, ignore_errors=True)
+                del self.entries[key]
+            os.replace(tmp_dir, entry_dir)
+            self.entries[key] = self.entry_bytes(key)
+            self.evict()
+
+    def evict(self):
+        total_bytes = self.total_bytes
+        while total_bytes > self.max_bytes and len(self.entries) > 1:
+            key, num_bytes = self.entries.popitem(last=False)
+            shutil.rmtree(os.path.join(self.cache_dir, key), ignore_errors=True)
+            total_bytes -= num_bytes
+
+    def clear(self):
+        with self.lock:
+            for key in self.entries:
+                shutil.rmtree(os.path.join(self.cache_dir, key), ignore_errors=True)
+            self.entries.clear()
@@ -25,6 +25,11 @@ class AttentionControl(abc.ABC):
     def forward(self, attn, is_cross: bool, place_in_unet: str):
         raise NotImplementedError
 
+    def edits_attention(self, is_cross: bool, num_queries: int, place_in_unet: str):
+        # whether `forward` needs the attention probabilities of the current layer and step,
+        # otherwise the attention processor may compute the layer fused and call `skip` instead
+        return True
+
     def __call__(self, attn, is_cross: bool, place_in_unet: str):
         if self.cur_att_layer >= self.num_uncond_att_layers:
             if self.low_resource:
@@ -32,12 +37,15 @@ class AttentionControl(abc.ABC):
             else:
                 h = attn.shape[0]
                 attn[h // 2:] = self.forward(attn[h // 2:], is_cross, place_in_unet)
+        self.skip()
+        return attn
+
+    def skip(self):
         self.cur_att_layer += 1
         if self.cur_att_layer == self.num_att_layers + self.num_uncond_att_layers:
             self.cur_att_layer = 0
             self.cur_step += 1
             self.between_steps()
-        return attn
 
     def reset(self):
         self.cur_step = 0
@@ -58,9 +66,46 @@ class AttentionStore(AttentionControl):
         return {"down_cross": [], "mid_cross": [], "up_cross": [],
                 "down_self": [], "mid_self": [], "up_self": []}
 
+    def edits_attention(self, is_cross: bool, num_queries: int, place_in_unet: str):
+        return is_cross and self.maps_tokens(num_queries)
+
+    def set_token_maps(self, token_indices, size, num_tokens=77):
+        # token_indices[n][s]: prompt positions of subject s in request n, their cross-attention
+        # is averaged over heads, layers and steps at the `size` (h, w) resolution; `num_tokens`
+        # is the text encoder sequence length, the tokenizer's model_max_length
+        num_subjects = len(token_indices[0])
+        self.token_selector = torch.zeros(len(token_indices), num_tokens, num_subjects)
+        for n, request_indices in enumerate(token_indices):
+            for s, indices in enumerate(request_indices):
+                if len(indices) > 0:
+                    self.token_selector[n, list(indices), s] = 1 / len(indices)
+        self.token_map_size = size
+        self.token_maps = None
+        self.num_token_map_layers = 0
+
+    def maps_tokens(self, num_queries):
+        return self.token_selector is not None and num_queries == self.token_map_size[0] * self.token_map_size[1]
+
+    def get_token_maps(self):
+        # (num_requests, num_subjects, h, w), None if no layer was recorded
+        if self.token_maps is None:
+            return None
+        return (self.token_maps / self.num_token_map_layers).reshape(*self.token_maps.shape[:2], *self.token_map_size)
+
     def forward(self, attn, is_cross: bool, place_in_unet: str):
         key = f"{place_in_unet}_{'cross' if is_cross else 'self'}"
         # if attn.shape[1] <= att_size * 64:
+        if is_cross and self.maps_tokens(attn.shape[1]):
+            self.token_selector = self.token_selector.to(device=attn.device, dtype=attn.dtype)
+            h = attn.shape[0] // (self.num_requests * self.batch_size)
+            # first copy of every request, the one the stage-1 image is taken from
+            attn_base = attn.reshape(self.num_requests, self.batch_size, h, *attn.shape[1:])[:, 0]
+            token_maps = torch.einsum('nhqk,nks->nsq', attn_base, self.token_selector).float() / h
+            if self.token_maps is None:
+                self.token_maps = token_maps
+            else:
+                self.token_maps += token_maps
+            self.num_token_map_layers += 1
         return attn
 
     def between_steps(self):
@@ -84,12 +129,18 @@ class AttentionStore(AttentionControl):
         super(AttentionStore, self).reset()
         self.step_store = self.get_empty_store()
         self.attention_store = {}
+        self.token_selector = None
+        self.token_maps = None
 
     def __init__(self, width, height, low_resolution=False, save_global_store=False):
         super(AttentionStore, self).__init__(low_resolution, width, height)
         self.step_store = self.get_empty_store()
         self.attention_store = {}
         self.save_global_store = save_global_store
+        self.num_requests = 1
+        self.batch_size = 1
+        self.token_selector = None
+        self.token_maps = None
 
 class AttentionControlEdit(AttentionStore, abc.ABC):
     def __init__(self, prompts, num_steps: int,
@@ -97,9 +148,12 @@ class AttentionControlEdit(AttentionStore, abc.ABC):
                  self_replace_steps: Union[float, Tuple[float, float]],
                  local_blend=None, width=None, height=None, tokenizer=None, device=None):
         super(AttentionControlEdit, self).__init__(width, height)
+        # several requests may be denoised in one batch, each with its own `batch_size` prompts
         self.batch_size = len(prompts)
-        self.cross_replace_alpha = p2p_utils.get_time_words_attention_alpha(prompts, num_steps, cross_replace_steps,
-                                                                            tokenizer).to(device)
+        cross_replace_alpha = p2p_utils.get_time_words_attention_alpha(prompts, num_steps, cross_replace_steps, tokenizer)
+        # steps where some word is replaced, computed on CPU so that the check does not sync the device
+        self.cross_replace_active = (cross_replace_alpha != 0).flatten(1).any(1).tolist()
+        self.cross_replace_alpha = cross_replace_alpha.to(device)
         if type(self_replace_steps) is float:
             self_replace_steps = 0, self_replace_steps
         self.num_self_replace = int(num_steps * self_replace_steps[0]), int(num_steps * self_replace_steps[1])
@@ -111,9 +165,15 @@ class AttentionControlEdit(AttentionStore, abc.ABC):
             x_t = self.local_blend(x_t, self.attention_store)
         return x_t
 
+    def edits_attention(self, is_cross: bool, num_queries: int, place_in_unet: str):
+        if is_cross:
+            return self.cross_replace_active[self.cur_step] or self.maps_tokens(num_queries)
+        # self-attention above the width x height resolution is left untouched by `replace_self_attention`
+        return self.num_self_replace[0] <= self.cur_step < self.num_self_replace[1] and num_queries <= self.width * self.height
+
     def replace_self_attention(self, attn_base, att_replace):
-        if att_replace.shape[2] <= self.width * self.height:
-            return attn_base.unsqueeze(0).expand(att_replace.shape[0], *attn_base.shape)
+        if att_replace.shape[-2] <= self.width * self.height:
+            return attn_base.unsqueeze(1).expand(*att_replace.shape)
         else:
             return att_replace
 
@@ -124,17 +184,17 @@ class AttentionControlEdit(AttentionStore, abc.ABC):
     def forward(self, attn, is_cross: bool, place_in_unet: str):
         super(AttentionControlEdit, self).forward(attn, is_cross, place_in_unet)
         if is_cross or (self.num_self_replace[0] <= self.cur_step < self.num_self_replace[1]):
-            h = attn.shape[0] // (self.batch_size)
-            attn = attn.reshape(self.batch_size, h, *attn.shape[1:])
-            attn_base, attn_repalce = attn[0], attn[1:]
+            h = attn.shape[0] // (self.num_requests * self.batch_size)
+            attn = attn.reshape(self.num_requests, self.batch_size, h, *attn.shape[1:])
+            attn_base, attn_repalce = attn[:, 0], attn[:, 1:]
             if is_cross:
                 alpha_words = self.cross_replace_alpha[self.cur_step]
                 attn_repalce_new = self.replace_cross_attention(attn_base, attn_repalce) * alpha_words + (
                             1 - alpha_words) * attn_repalce
-                attn[1:] = attn_repalce_new
+                attn[:, 1:] = attn_repalce_new
             else:
-                attn[1:] = self.replace_self_attention(attn_base, attn_repalce)
-            attn = attn.reshape(self.batch_size * h, *attn.shape[2:])
+                attn[:, 1:] = self.replace_self_attention(attn_base, attn_repalce)
+            attn = attn.reshape(self.num_requests * self.batch_size * h, *attn.shape[3:])
         return attn
 
 class AttentionReplace(AttentionControlEdit):
@@ -144,5 +204,5 @@ class AttentionReplace(AttentionControlEdit):
         self.mapper = seq_aligner.get_replacement_mapper(prompts, tokenizer).to(dtype=dtype, device=device)
 
     def replace_cross_attention(self, attn_base, att_replace):
-        return torch.einsum('hpw,bwn->bhpn', attn_base, self.mapper)
+        return torch.einsum('ghpw,bwn->gbhpn', attn_base, self.mapper)
 
@@ -0,0 +1,22 @@
+import pytest
+
+
+@pytest.fixture(scope="module")
+def sam_model():
+    torch = pytest.importorskip("torch")
+    pytest.importorskip("segment_anything")
+    from src.efficientvit.models.efficientvit.backbone import efficientvit_backbone_l0
+    from src.efficientvit.models.efficientvit.sam import (
+        EfficientViTSamImageEncoder, SamNeck, build_efficientvit_sam)
+
+    torch.manual_seed(0)
+    neck = SamNeck(
+        fid_list=["stage4", "stage3", "stage2"],
+        in_channel_list=[512, 256, 128],
+        head_width=256,
+        head_depth=4,
+        expand_ratio=1,
+        middle_op="fmb",
+    )
+    # an untrained EfficientViT-SAM-L0, image size (1024, 512)
+    return build_efficientvit_sam(EfficientViTSamImageEncoder(efficientvit_backbone_l0(), neck), 512).eval()
@@ -0,0 +1,210 @@
+import asyncio
+
+import cv2
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+
+from inference.core.cache import serializers
+from inference.core.entities.requests.inference import (
+    InferenceRequestImage,
+    ObjectDetectionInferenceRequest,
+)
+from inference.core.entities.responses.inference import (
+    InferenceResponseImage,
+    ObjectDetectionInferenceResponse,
+)
+from inference.core.exceptions import InvalidNumpyInput
+from inference.core.interfaces.http.http_api import HttpInterface, binary_request_image
+from inference.core.managers import base as managers_base
+from inference.core.managers.base import ModelManager
+from inference.core.registries.base import ModelRegistry
+from inference.core.utils.image_utils import (
+    load_image,
+    load_image_from_encoded_bytes,
+    load_image_from_raw_buffer,
+    simplejpeg,
+)
+
+
+def random_image(height=48, width=64, seed=0):
+    return np.random.default_rng(seed).integers(0, 256, (height, width, 3), dtype=np.uint8)
+
+
+@pytest.mark.parametrize("shape", ["48,64,3", "48x64x3", (48, 64, 3), [48, 64, 1]])
+def test_raw_buffer_shapes(shape):
+    channels = shape[-1] if not isinstance(shape, str) else 3
+    pixels = random_image()[:, :, :channels]
+    image = load_image_from_raw_buffer(pixels.tobytes(), shape=shape)
+    assert image.shape == (48, 64, channels)
+    assert image.dtype == np.uint8
+    np.testing.assert_array_equal(image, pixels)
+
+
+def test_raw_buffer_wraps_the_data_without_a_copy():
+    data = bytearray(random_image().tobytes())
+    image = load_image_from_raw_buffer(data, shape="48,64,3")
+    assert np.shares_memory(image, np.frombuffer(data, dtype=np.uint8))
+    # immutable bodies give read-only images
+    assert not load_image_from_raw_buffer(bytes(data), shape="48,64,3").flags.writeable
+
+
+def test_raw_buffer_dtype():
+    pixels = np.random.default_rng(0).random((8, 8, 3), dtype=np.float32)
+    image = load_image_from_raw_buffer(pixels.tobytes(), shape="8,8,3", dtype="float32")
+    assert image.dtype == np.float32
+    np.testing.assert_array_equal(image, pixels)
+
+
+@pytest.mark.parametrize(
+    "shape, dtype, size",
+    [
+        ("48,64", "uint8", 48 * 64 * 3),  # channels missing, 64 channels
+        ("48,64,4", "uint8", 48 * 64 * 4),  # RGBA
+        ("48,64,x3", "uint8", 48 * 64 * 3),
+        ("", "uint8", 0),
+        ("0,64,3", "uint8", 0),
+        ("-48,-64,3", "uint8", 48 * 64 * 3),
+        ("48,64,3", "uint8", 48 * 64 * 3 - 1),  # truncated body
+        ("48,64,3", "float32", 48 * 64 * 3),  # size of uint8 pixels
+        ("48,64,3", "uint99", 48 * 64 * 3),
+    ],
+)
+def test_raw_buffer_rejects_invalid_input(shape, dtype, size):
+    with pytest.raises(InvalidNumpyInput):
+        load_image_from_raw_buffer(bytes(size), shape=shape, dtype=dtype)
+
+
+@pytest.mark.skipif(simplejpeg is None, reason="simplejpeg is not installed")
+@pytest.mark.parametrize("reuse_decode_buffer", [False, True])
+def test_jpeg_decoding_matches_opencv(reuse_decode_buffer):
+    image = cv2.GaussianBlur(random_image(120, 160), (9, 9), 0)
+    jpeg = cv2.imencode(".jpg", image)[1].tobytes()
+    expected = cv2.imdecode(np.frombuffer(jpeg, dtype=np.uint8), cv2.IMREAD_COLOR)
+    decoded = load_image_from_encoded_bytes(jpeg, reuse_decode_buffer=reuse_decode_buffer)
+    assert decoded.shape == expected.shape
+    # both are libjpeg-turbo, only the IDCT implementation may differ
+    assert np.abs(decoded.astype(int) - expected.astype(int)).max() <= 2
+
+
+def test_binary_request_image_types():
+    pixels = random_image()
+    raw = binary_request_image(pixels.tobytes(), {"X-Image-Shape": "48,64,3"})
+    assert raw.type == "numpy_object"
+    np.testing.assert_array_equal(raw.value, pixels)
+    png = cv2.imencode(".png", pixels)[1].tobytes()
+    encoded = binary_request_image(png, {})
+    assert encoded.type == "bytes" and encoded.value is png
+
+
+class StandInModelManager:
+    """Answers the legacy route with the size of the image it loaded."""
+
+    num_errors = 0
+
+    def add_model(self, *args, **kwargs):
+        pass
+
+    def get_task_type(self, *args, **kwargs):
+        return "object-detection"
+
+    async def infer_from_request(self, model_id, request, **kwargs):
+        image, _ = load_image(request.image)
+        return ObjectDetectionInferenceResponse(
+            predictions=[],
+            image=InferenceResponseImage(width=image.shape[1], height=image.shape[0]),
+        )
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    # the landing page is a build artefact that HttpInterface mounts from the working directory
+    (tmp_path / "inference" / "landing" / "out").mkdir(parents=True)
+    monkeypatch.chdir(tmp_path)
+    return TestClient(HttpInterface(StandInModelManager()).app)
+
+
+def test_octet_stream_route_with_raw_pixels(client):
+    response = client.post(
+        "/dataset/1?api_key=key",
+        content=random_image().tobytes(),
+        headers={"Content-Type": "application/octet-stream", "X-Image-Shape": "48,64,3"},
+    )
+    assert response.status_code == 200
+    assert response.json()["image"] == {"width": 64, "height": 48}
+
+
+def test_octet_stream_route_with_an_encoded_image(client):
+    response = client.post(
+        "/dataset/1?api_key=key",
+        content=cv2.imencode(".png", random_image(30, 40))[1].tobytes(),
+        headers={"Content-Type": "application/octet-stream"},
+    )
+    assert response.status_code == 200
+    assert response.json()["image"] == {"width": 40, "height": 30}
+
+
+def test_octet_stream_route_rejects_a_mismatched_shape(client):
+    response = client.post(
+        "/dataset/1?api_key=key",
+        content=random_image().tobytes(),
+        headers={"Content-Type": "application/octet-stream", "X-Image-Shape": "64,64,3"},
+    )
+    assert response.status_code == 400
+
+
+def test_multipart_route(client):
+    response = client.post(
+        "/dataset/1?api_key=key",
+        files={"file": ("image", random_image().tobytes(), "application/octet-stream")},
+    )
+    # without the shape header the part is taken as an encoded image
+    assert response.status_code == 400
+    response = client.post(
+        "/dataset/1?api_key=key",
+        files={"file": ("image.png", cv2.imencode(".png", random_image())[1].tobytes(), "image/png")},
+    )
+    assert response.status_code == 200
+    assert response.json()["image"] == {"width": 64, "height": 48}
+
+
+class StandInModel:
+    def __init__(self, model_id, api_key):
+        pass
+
+    def can_batch_request(self, request):
+        return False
+
+    def infer_from_request(self, request):
+        image, _ = load_image(request.image)
+        return ObjectDetectionInferenceResponse(
+            predictions=[],
+            image=InferenceResponseImage(width=image.shape[1], height=image.shape[0]),
+        )
+
+
+@pytest.mark.parametrize("binary_image_type", ["numpy_object", "bytes"])
+def test_binary_images_are_cachable_without_tiny_cache(binary_image_type, monkeypatch):
+    monkeypatch.setattr(serializers, "TINY_CACHE", False)
+    cached = []
+
+    def to_cachable_inference_item(request, response):
+        cached.append(serializers.to_cachable_inference_item(request, response))
+        return cached[-1]
+
+    monkeypatch.setattr(managers_base, "to_cachable_inference_item", to_cachable_inference_item)
+    manager = ModelManager(ModelRegistry({"stand-in/1": StandInModel}))
+    manager.add_model("stand-in/1", "key")
+    pixels = random_image()
+    value = pixels if binary_image_type == "numpy_object" else cv2.imencode(".png", pixels)[1].tobytes()
+    request = ObjectDetectionInferenceRequest(
+        model_id="stand-in/1",
+        api_key="key",
+        image=InferenceRequestImage(type=binary_image_type, value=value),
+    )
+
+    response = asyncio.run(manager.infer_from_request("stand-in/1", request))
+    assert response.image.width == 64
+    assert len(cached) == 1
+    assert isinstance(cached[0]["request"]["image"]["value"], str)
+    manager._executor.remove("stand-in/1")
@@ -0,0 +1,159 @@
+import numpy as np
+import pytest
+
+from inference.core.entities.responses.detections import DetectionsInferenceResponse
+from inference.core.entities.responses.inference import (
+    InferenceResponseImage,
+    InstanceSegmentationInferenceResponse,
+    InstanceSegmentationPrediction,
+    Keypoint,
+    KeypointsDetectionInferenceResponse,
+    KeypointsPrediction,
+    ObjectDetectionInferenceResponse,
+    ObjectDetectionPrediction,
+    Point,
+)
+from inference.core.exceptions import ModelArtefactError
+
+CLASS_NAMES = ["person", "car", "dog"]
+KEYPOINTS_METADATA = {0: ["nose", "left_eye", "right_eye"], 1: ["front", "back"]}
+IMAGE = InferenceResponseImage(width=640, height=480)
+
+
+def random_predictions(rng, count, num_keypoints=0):
+    """Postprocessed rows: x1, y1, x2, y2, conf, class_conf, class_id, keypoints x num_keypoints * 3."""
+    xy1 = rng.uniform(0, 400, (count, 2))
+    rows = np.concatenate(
+        [
+            xy1,
+            xy1 + rng.uniform(5, 200, (count, 2)),
+            rng.uniform(0.25, 1, (count, 2)),
+            rng.integers(0, len(CLASS_NAMES), (count, 1)),
+            rng.uniform(0, 1, (count, 3 * num_keypoints)),
+        ],
+        axis=1,
+    )
+    return rows
+
+
+def box_fields(pred, detection_id):
+    # the fields the per-prediction pydantic responses were built from
+    return {
+        "x": (pred[0] + pred[2]) / 2,
+        "y": (pred[1] + pred[3]) / 2,
+        "width": pred[2] - pred[0],
+        "height": pred[3] - pred[1],
+        "confidence": pred[4],
+        "class": CLASS_NAMES[int(pred[6])],
+        "class_id": int(pred[6]),
+        "detection_id": detection_id,
+    }
+
+
+def reference_keypoints(keypoints, keypoints_class_id, keypoint_confidence_threshold):
+    keypoint_id2name = KEYPOINTS_METADATA[keypoints_class_id]
+    results = []
+    for keypoint_id in range(min(len(keypoints) // 3, len(keypoint_id2name))):
+        confidence = keypoints[3 * keypoint_id + 2]
+        if confidence < keypoint_confidence_threshold:
+            continue
+        results.append(
+            Keypoint(
+                x=keypoints[3 * keypoint_id],
+                y=keypoints[3 * keypoint_id + 1],
+                confidence=confidence,
+                class_id=keypoint_id,
+                class_name=keypoint_id2name[keypoint_id],
+            )
+        )
+    return results
+
+
+@pytest.mark.parametrize("count", [0, 1, 17])
+def test_object_detection_matches_pydantic_response(count):
+    rows = random_predictions(np.random.default_rng(count), count)
+    response = DetectionsInferenceResponse(
+        xyxy=rows[:, :4], confidence=rows[:, 4], class_id=rows[:, 6], class_names=CLASS_NAMES, image=IMAGE
+    )
+    reference = ObjectDetectionInferenceResponse(
+        predictions=[
+            ObjectDetectionPrediction(**box_fields(pred, detection_id))
+            for pred, detection_id in zip(rows, response.detection_ids)
+        ],
+        image=IMAGE,
+    )
+    assert response.dict(by_alias=True, exclude_none=True) == reference.dict(by_alias=True, exclude_none=True)
+    assert response.dict() == reference.dict()
+
+
+@pytest.mark.parametrize("count", [0, 1, 9])
+def test_instance_segmentation_matches_pydantic_response(count):
+    rng = np.random.default_rng(count)
+    rows = random_predictions(rng, count)
+    polygons = [rng.uniform(0, 640, (int(rng.integers(3, 12)), 2)) for _ in range(count)]
+    response = DetectionsInferenceResponse(
+        xyxy=rows[:, :4],
+        confidence=rows[:, 4],
+        class_id=rows[:, 6],
+        class_names=CLASS_NAMES,
+        image=IMAGE,
+        polygons=polygons,
+    )
+    reference = InstanceSegmentationInferenceResponse(
+        predictions=[
+            InstanceSegmentationPrediction(
+                **box_fields(pred, detection_id),
+                points=[Point(x=point[0], y=point[1]) for point in polygon],
+            )
+            for pred, polygon, detection_id in zip(rows, polygons, response.detection_ids)
+        ],
+        image=IMAGE,
+    )
+    assert response.dict(by_alias=True, exclude_none=True) == reference.dict(by_alias=True, exclude_none=True)
+    assert response.dict() == reference.dict()
+
+
+@pytest.mark.parametrize("keypoint_confidence_threshold", [0.0, 0.5])
+def test_keypoints_match_pydantic_response(keypoint_confidence_threshold):
+    rng = np.random.default_rng(0)
+    # padded to the largest keypoints class, as Ultralytics exports them
+    rows = random_predictions(rng, 12, num_keypoints=3)
+    keypoints_class_id = rng.integers(0, len(KEYPOINTS_METADATA), 12)
+    response = DetectionsInferenceResponse(
+        xyxy=rows[:, :4],
+        confidence=rows[:, 4],
+        class_id=rows[:, 6],
+        class_names=CLASS_NAMES,
+        image=IMAGE,
+        keypoints=rows[:, 7:].reshape(12, 3, 3),
+        keypoints_class_id=keypoints_class_id,
+        keypoints_metadata=KEYPOINTS_METADATA,
+        keypoint_confidence_threshold=keypoint_confidence_threshold,
+    )
+    reference = KeypointsDetectionInferenceResponse(
+        predictions=[
+            KeypointsPrediction(
+                **box_fields(pred, detection_id),
+                keypoints=reference_keypoints(pred[7:], int(class_id), keypoint_confidence_threshold),
+            )
+            for pred, class_id, detection_id in zip(rows, keypoints_class_id, response.detection_ids)
+        ],
+        image=IMAGE,
+    )
+    assert response.dict(by_alias=True, exclude_none=True) == reference.dict(by_alias=True, exclude_none=True)
+    assert response.dict() == reference.dict()
+
+
+def test_keypoints_without_metadata_are_a_model_artefact_error():
+    rows = random_predictions(np.random.default_rng(0), 2, num_keypoints=2)
+    response = DetectionsInferenceResponse(
+        xyxy=rows[:, :4],
+        confidence=rows[:, 4],
+        class_id=rows[:, 6],
+        class_names=CLASS_NAMES,
+        image=IMAGE,
+        keypoints=rows[:, 7:].reshape(2, 2, 3),
+        keypoints_class_id=np.zeros(2),
+    )
+    with pytest.raises(ModelArtefactError):
+        response.dict()
@@ -0,0 +1,92 @@
+import asyncio
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from inference.core.entities.requests.inference import ObjectDetectionInferenceRequest
+from inference.core.managers.batching import DynamicBatcher
+from inference.core.models.object_detection_base import (
+    ObjectDetectionBaseOnnxRoboflowInferenceModel,
+)
+
+
+class StandInDetectionModel(ObjectDetectionBaseOnnxRoboflowInferenceModel):
+    """Runs the batching logic of infer_from_requests with trivial pre/postprocessing."""
+
+    def __init__(self, failing_stage=None):
+        self.batching_enabled = True
+        self.failing_stage = failing_stage
+        self.predict_batch_sizes = []
+
+    def fails(self, stage, image):
+        return self.failing_stage == stage and image["value"] == "bad"
+
+    def preprocess(self, image, **kwargs):
+        if self.fails("preprocess", image):
+            raise ValueError("bad image")
+        value = len(self.predict_batch_sizes) + len(image["value"])
+        return np.full((1, 3, 4, 4), value, dtype=np.float32), [(4, 4)]
+
+    def predict(self, img_in, **kwargs):
+        if self.failing_stage == "predict":
+            raise RuntimeError("predict failed")
+        self.predict_batch_sizes.append(img_in.shape[0])
+        return (img_in.reshape(img_in.shape[0], -1)[:, :1],)
+
+    def postprocess(self, predictions, preprocess_return_metadata, confidence=None, **kwargs):
+        if self.failing_stage == "postprocess" and confidence == 0.9:
+            raise ValueError("bad postprocess")
+        return [SimpleNamespace(value=float(predictions[0][0, 0]), time=None)]
+
+
+def make_request(value, confidence=0.5):
+    return ObjectDetectionInferenceRequest(
+        model_id="stand-in/1",
+        image={"type": "url", "value": value},
+        confidence=confidence,
+    )
+
+
+@pytest.mark.parametrize("failing_stage", ["preprocess", "postprocess"])
+def test_infer_from_requests_isolates_a_failing_request(failing_stage):
+    model = StandInDetectionModel(failing_stage)
+    requests = [make_request("a"), make_request("bad", confidence=0.9), make_request("ccc")]
+    responses = model.infer_from_requests(requests)
+    assert isinstance(responses[1], ValueError)
+    assert responses[0].value == 1.0 and responses[2].value == 3.0
+    # the healthy requests still share one predict call
+    assert model.predict_batch_sizes == [3 if failing_stage == "postprocess" else 2]
+
+
+def test_infer_from_requests_fails_every_request_of_a_failing_predict():
+    model = StandInDetectionModel("predict")
+    responses = model.infer_from_requests([make_request("a"), make_request("b")])
+    assert all(isinstance(response, RuntimeError) for response in responses)
+
+
+def test_batcher_fails_only_the_request_whose_response_is_an_exception():
+    model = StandInDetectionModel("preprocess")
+    batcher = DynamicBatcher(max_batch_size=8, max_wait=0.05, max_queue_size=8, max_concurrent_batches=1)
+
+    async def run_batch(requests):
+        return model.infer_from_requests(requests)
+
+    async def main():
+        results = await asyncio.gather(
+            *[
+                batcher.infer_from_request("stand-in/1", make_request(value), run_batch)
+                for value in ("a", "bad", "ccc")
+            ],
+            return_exceptions=True,
+        )
+        # finished batches do not stay referenced
+        await asyncio.sleep(0)
+        assert len(batcher._batch_tasks) == 0
+        batcher.remove("stand-in/1")
+        return results
+
+    results = asyncio.run(main())
+    assert results[0].value == 1.0 and results[2].value == 3.0
+    assert isinstance(results[1], ValueError)
+    assert model.predict_batch_sizes == [2]
@@ -0,0 +1,69 @@
+import pytest
+
+torch = pytest.importorskip("torch")
+
+from src.efficientvit.models.efficientvit.backbone import (
+    efficientvit_backbone_b0, efficientvit_backbone_l0)
+from src.efficientvit.models.nn import ConvLayer, OpSequential
+from src.efficientvit.models.nn.fuse import fuse_for_inference
+
+
+def randomize_bn(model: torch.nn.Module) -> torch.nn.Module:
+    # fresh BatchNorm layers are identities in eval mode, which would make folding them trivially exact
+    for module in model.modules():
+        if isinstance(module, torch.nn.BatchNorm2d):
+            module.running_mean.uniform_(-0.5, 0.5)
+            module.running_var.uniform_(0.5, 2.0)
+            module.weight.data.uniform_(0.5, 1.5)
+            module.bias.data.uniform_(-0.5, 0.5)
+    return model
+
+
+@pytest.mark.parametrize("build_backbone", [efficientvit_backbone_b0, efficientvit_backbone_l0])
+def test_fused_backbone_matches_original(build_backbone):
+    torch.manual_seed(0)
+    model = randomize_bn(build_backbone()).eval()
+    fused = fuse_for_inference(model)
+    assert fused is not model
+
+    for module in fused.modules():
+        if isinstance(module, ConvLayer):
+            assert not isinstance(module.norm, torch.nn.BatchNorm2d)
+        if isinstance(module, OpSequential):
+            assert not any(isinstance(op, OpSequential) for op in module.op_list)
+
+    x = torch.randn(2, 3, 128, 160)
+    with torch.no_grad():
+        expected = model(x)
+        actual = fused(x)
+    assert actual.keys() == expected.keys()
+    for key in expected:
+        torch.testing.assert_close(actual[key], expected[key], rtol=1e-4, atol=1e-4, msg=key)
+
+
+def test_fuse_inplace_returns_the_same_model():
+    model = randomize_bn(efficientvit_backbone_b0())
+    assert fuse_for_inference(model, inplace=True) is model
+    assert not model.training
+
+
+def test_fused_sam_image_encoder_matches_original():
+    pytest.importorskip("segment_anything")
+    from src.efficientvit.models.efficientvit.sam import (
+        EfficientViTSamImageEncoder, SamNeck)
+
+    torch.manual_seed(0)
+    # the EfficientViT-SAM-L0 encoder, whose DAGBlock neck has its input and output ops fused too
+    neck = SamNeck(
+        fid_list=["stage4", "stage3", "stage2"],
+        in_channel_list=[512, 256, 128],
+        head_width=256,
+        head_depth=4,
+        expand_ratio=1,
+        middle_op="fmb",
+    )
+    encoder = randomize_bn(EfficientViTSamImageEncoder(efficientvit_backbone_l0(), neck)).eval()
+    fused = fuse_for_inference(encoder)
+    x = torch.randn(1, 3, 512, 512)
+    with torch.no_grad():
+        torch.testing.assert_close(fused(x), encoder(x), rtol=1e-4, atol=1e-4)
@@ -0,0 +1,72 @@
+import pytest
+
+torch = pytest.importorskip("torch")
+
+from src.efficientvit.models.nn.ops import LiteMLA
+
+
+def build_qkv(att: LiteMLA, batch=2, size=(16, 24), dtype=torch.float32):
+    channels = att.aggreg[0][0].in_channels * (1 + len(att.aggreg))
+    qkv = torch.randn(batch, channels, *size)
+    # a few all-negative queries so that the normalizer of some tokens is 0 after the relu
+    qkv[:, : att.dim, :2] = -1
+    return qkv.to(dtype)
+
+
+@pytest.mark.parametrize("size", [(16, 24), (64, 64)])
+def test_relu_linear_att_inference_matches_reference_fp32(size):
+    torch.manual_seed(0)
+    att = LiteMLA(64, 64, dim=16).eval()
+    qkv = build_qkv(att, size=size)
+    expected = att.relu_linear_att(qkv)
+    actual = att.relu_linear_att_inference(qkv.clone())
+    assert actual.shape == expected.shape and actual.dtype == torch.float32
+    torch.testing.assert_close(actual, expected, rtol=1e-4, atol=1e-5)
+
+
+@pytest.mark.parametrize("size", [(16, 24), (64, 64)])
+def test_relu_linear_att_inference_matches_reference_fp16(size):
+    torch.manual_seed(0)
+    att = LiteMLA(64, 64, dim=16).eval()
+    qkv = build_qkv(att, size=size, dtype=torch.float16)
+    # the reference computes in fp32 regardless of the input dtype
+    expected = att.relu_linear_att(qkv)
+    actual = att.relu_linear_att_inference(qkv.clone())
+    assert actual.dtype == torch.float16
+    assert torch.isfinite(actual).all()
+    torch.testing.assert_close(actual.float(), expected, rtol=2e-2, atol=2e-2)
+
+
+def test_fp32_eval_forward_keeps_the_reference_attention(monkeypatch):
+    torch.manual_seed(0)
+    att = LiteMLA(32, 32, dim=8).eval()
+    x = torch.randn(1, 32, 12, 12)
+    with torch.no_grad():
+        qkv = att.qkv(x)
+        multi_scale_qkv = torch.cat([qkv] + [op(qkv) for op in att.aggreg], dim=1)
+        expected = att.proj(att.relu_linear_att(multi_scale_qkv))
+        monkeypatch.setattr(att, "relu_linear_att_inference", None)
+        actual = att(x)
+    torch.testing.assert_close(actual, expected, rtol=0, atol=0)
+
+
+@pytest.mark.parametrize("dtype", [torch.float16, torch.bfloat16])
+def test_half_precision_eval_forward_uses_the_inference_attention(monkeypatch, dtype):
+    torch.manual_seed(0)
+    att = LiteMLA(32, 32, dim=8).eval()
+    x = torch.randn(1, 32, 12, 12)
+    with torch.no_grad():
+        expected = att(x)
+        att.to(dtype)
+        calls = []
+        relu_linear_att_inference = att.relu_linear_att_inference
+
+        def recording_inference(qkv):
+            calls.append(qkv.dtype)
+            return relu_linear_att_inference(qkv)
+
+        monkeypatch.setattr(att, "relu_linear_att_inference", recording_inference)
+        actual = att(x.to(dtype))
+    assert calls == [dtype]
+    assert actual.dtype == dtype
+    torch.testing.assert_close(actual.float(), expected, rtol=5e-2, atol=5e-2)
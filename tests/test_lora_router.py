@@ -0,0 +1,101 @@
+import pytest
+
+torch = pytest.importorskip("torch")
+peft = pytest.importorskip("peft")
+pytest.importorskip("diffusers")
+
+from diffusers.utils.peft_utils import (
+    scale_lora_layers,
+    set_weights_and_activate_adapters,
+    unscale_lora_layers,
+)
+from peft import LoraConfig, inject_adapter_in_model
+
+from src.pipelines.lora_pipeline import MultiAdapterLoraRouter
+
+
+class TinyUNet(torch.nn.Module):
+    """A Conv2d and a Linear, the two layer types LoRA patches in the UNet."""
+
+    def __init__(self):
+        super().__init__()
+        self.conv = torch.nn.Conv2d(4, 6, 3, padding=1)
+        self.proj = torch.nn.Linear(6, 4)
+
+    def forward(self, x):
+        h = self.conv(x)
+        return self.proj(h.permute(0, 2, 3, 1)).permute(0, 3, 1, 2)
+
+
+def build_model():
+    torch.manual_seed(0)
+    model = TinyUNet()
+    for name, r in (("concept", 2), ("style", 4)):
+        # init_lora_weights=False keeps lora_B random, so that every adapter changes the output
+        config = LoraConfig(r=r, lora_alpha=2 * r, target_modules=["conv", "proj"], init_lora_weights=False)
+        model = inject_adapter_in_model(config, model, adapter_name=name)
+    return model.eval()
+
+
+def serial_forward(model, x, adapter_names, weights, lora_scale):
+    # what the unbatched stage 2 does for every region: set_adapters, then a forward with cross_attention_kwargs scale
+    set_weights_and_activate_adapters(model, adapter_names, weights)
+    scale_lora_layers(model, lora_scale)
+    try:
+        return model(x)
+    finally:
+        unscale_lora_layers(model, lora_scale)
+
+
+ROUTES = [(["concept"], [1.0]), (["concept", "style"], [0.7, 0.5]), (["style"], [1.0])]
+
+
+@torch.no_grad()
+def test_routed_rows_match_their_serial_adapters():
+    model = build_model()
+    router = MultiAdapterLoraRouter(model)
+    assert len(router.lora_layers) == 2
+
+    rows_per_route = 2
+    x = torch.randn(rows_per_route, 4, 5, 5)
+    snapshots, expected = [], []
+    for adapter_names, weights in ROUTES:
+        set_weights_and_activate_adapters(model, adapter_names, weights)
+        snapshots.append(router.snapshot())
+        expected.append(serial_forward(model, x, adapter_names, weights, lora_scale=0.8))
+
+    router.prepare(snapshots, rows_per_route=rows_per_route, lora_scale=0.8)
+    with router.route():
+        actual = model(torch.cat([x] * len(ROUTES)))
+
+    for k, expected_rows in enumerate(expected):
+        torch.testing.assert_close(actual[k * rows_per_route : (k + 1) * rows_per_route], expected_rows)
+    # the adapters differ, so the routes must not all give the same rows
+    assert not torch.allclose(expected[0], expected[2])
+
+
+@torch.no_grad()
+def test_route_restores_the_original_forward():
+    model = build_model()
+    router = MultiAdapterLoraRouter(model)
+    set_weights_and_activate_adapters(model, ["concept"], [1.0])
+    router.prepare([router.snapshot()], rows_per_route=1)
+    x = torch.randn(1, 4, 5, 5)
+    before = model(x)
+
+    with pytest.raises(RuntimeError, match="body failed"):
+        with router.route():
+            assert all("forward" in layer.__dict__ for layer in router.lora_layers)
+            raise RuntimeError("body failed")
+
+    assert all("forward" not in layer.__dict__ for layer in router.lora_layers)
+    torch.testing.assert_close(model(x), before)
+
+
+def test_merged_layers_are_rejected():
+    model = build_model()
+    router = MultiAdapterLoraRouter(model)
+    set_weights_and_activate_adapters(model, ["concept"], [1.0])
+    router.lora_layers[0].merge()
+    with pytest.raises(ValueError):
+        router.snapshot()
@@ -0,0 +1,82 @@
+import asyncio
+import threading
+
+import pytest
+
+from inference.core.exceptions import InferenceQueueFull
+from inference.core.managers.executors import ModelExecutor
+
+
+class BlockingModel:
+    """A model whose calls wait until `release` is set."""
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.started = threading.Semaphore(0)
+
+    def infer_from_request(self, request):
+        self.started.release()
+        assert self.release.wait(timeout=10)
+        return f"response to {request}"
+
+
+async def wait_started(model, count):
+    for _ in range(count):
+        assert await asyncio.to_thread(model.started.acquire, timeout=10)
+
+
+def test_calls_beyond_workers_plus_queue_size_are_rejected():
+    model = BlockingModel()
+    executor = ModelExecutor(model_registry=None, executor_type="thread", workers=1, queue_size=1)
+
+    async def main():
+        running = [
+            asyncio.create_task(executor.infer_from_request("m/1", model, request))
+            for request in ("a", "b")
+        ]
+        await wait_started(model, 1)
+        with pytest.raises(InferenceQueueFull):
+            await executor.infer_from_request("m/1", model, "c")
+        # other models have their own slots
+        other = BlockingModel()
+        other.release.set()
+        assert await executor.infer_from_request("m/2", other, "d") == "response to d"
+
+        model.release.set()
+        assert await asyncio.gather(*running) == ["response to a", "response to b"]
+        # the slots are free again once the calls finished
+        assert await executor.infer_from_request("m/1", model, "e") == "response to e"
+
+    asyncio.run(main())
+    executor.remove("m/1")
+    executor.remove("m/2")
+
+
+def test_cancelled_call_holds_its_slot_until_the_model_call_finishes():
+    model = BlockingModel()
+    executor = ModelExecutor(model_registry=None, executor_type="thread", workers=1, queue_size=0)
+
+    async def main():
+        task = asyncio.create_task(executor.infer_from_request("m/1", model, "a"))
+        await wait_started(model, 1)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        # the worker is still busy with the cancelled call
+        with pytest.raises(InferenceQueueFull):
+            await executor.infer_from_request("m/1", model, "b")
+
+        model.release.set()
+        for _ in range(100):
+            try:
+                return await executor.infer_from_request("m/1", model, "c")
+            except InferenceQueueFull:
+                await asyncio.sleep(0.01)
+
+    assert asyncio.run(main()) == "response to c"
+    executor.remove("m/1")
+
+
+def test_unknown_executor_type_is_rejected():
+    with pytest.raises(ValueError):
+        ModelExecutor(model_registry=None, executor_type="greenlet")
@@ -0,0 +1,103 @@
+import numpy as np
+import pytest
+
+from inference.core.nms import non_max_suppression_fast, w_np_non_max_suppression
+
+
+def reference_w_np_non_max_suppression(
+    prediction, conf_thresh, iou_thresh, class_agnostic, max_detections, num_masks, box_format
+):
+    """The per-image, per-class loop w_np_non_max_suppression used to be."""
+    num_classes = prediction.shape[2] - 5 - num_masks
+    if box_format == "xywh":
+        corners = np.zeros(prediction.shape)
+        corners[:, :, 0] = prediction[:, :, 0] - prediction[:, :, 2] / 2
+        corners[:, :, 1] = prediction[:, :, 1] - prediction[:, :, 3] / 2
+        corners[:, :, 2] = prediction[:, :, 0] + prediction[:, :, 2] / 2
+        corners[:, :, 3] = prediction[:, :, 1] + prediction[:, :, 3] / 2
+        prediction[:, :, :4] = corners[:, :, :4]
+
+    batch_predictions = []
+    for image_pred in prediction:
+        filtered_predictions = []
+        image_pred = image_pred[image_pred[:, 4] >= conf_thresh]
+        if image_pred.shape[0] == 0:
+            batch_predictions.append(filtered_predictions)
+            continue
+        class_scores = image_pred[:, 5 : num_classes + 5]
+        detections = np.concatenate(
+            [
+                image_pred[:, :5],
+                class_scores.max(1, keepdims=True),
+                class_scores.argmax(1)[:, None],
+                image_pred[:, 5 + num_classes :],
+            ],
+            axis=1,
+        )
+        class_groups = [detections] if class_agnostic else [
+            detections[detections[:, 6] == c] for c in np.unique(detections[:, 6])
+        ]
+        for class_detections in class_groups:
+            class_detections = sorted(class_detections, key=lambda row: row[4], reverse=True)
+            filtered_predictions.extend(non_max_suppression_fast(np.array(class_detections), iou_thresh))
+        filtered_predictions = sorted(filtered_predictions, key=lambda row: row[4], reverse=True)
+        batch_predictions.append(filtered_predictions[:max_detections])
+    return batch_predictions
+
+
+def random_prediction(rng, batch_size, num_candidates, num_classes, num_masks):
+    prediction = np.empty((batch_size, num_candidates, 5 + num_classes + num_masks))
+    # clustered boxes, so that a good share of them overlap
+    centers = rng.uniform(0, 640, (batch_size, num_candidates // 10 + 1, 2))
+    cluster = rng.integers(0, centers.shape[1], (batch_size, num_candidates))
+    prediction[:, :, :2] = np.take_along_axis(centers, cluster[..., None], axis=1) + rng.normal(
+        0, 8, (batch_size, num_candidates, 2)
+    )
+    prediction[:, :, 2:4] = rng.uniform(10, 120, (batch_size, num_candidates, 2))
+    prediction[:, :, 4] = rng.uniform(0, 1, (batch_size, num_candidates))
+    prediction[:, :, 5:] = rng.uniform(0, 1, (batch_size, num_candidates, num_classes + num_masks))
+    return prediction
+
+
+@pytest.mark.parametrize("seed", range(6))
+@pytest.mark.parametrize("class_agnostic", [False, True])
+@pytest.mark.parametrize("box_format", ["xywh", "xyxy"])
+def test_matches_the_per_class_loop(seed, class_agnostic, box_format):
+    rng = np.random.default_rng(seed)
+    batch_size = int(rng.integers(1, 4))
+    num_classes = int(rng.choice([1, 3, 80]))
+    num_masks = int(rng.choice([0, 4]))
+    max_detections = int(rng.choice([5, 300]))
+    prediction = random_prediction(rng, batch_size, 400, num_classes, num_masks)
+    if seed == 0:
+        # an image without candidates
+        prediction[0, :, 4] = 0
+
+    kwargs = dict(
+        conf_thresh=0.25,
+        iou_thresh=0.45,
+        class_agnostic=class_agnostic,
+        max_detections=max_detections,
+        num_masks=num_masks,
+        box_format=box_format,
+    )
+    expected = reference_w_np_non_max_suppression(prediction.copy(), **kwargs)
+    actual = w_np_non_max_suppression(prediction.copy(), max_candidate_detections=None, **kwargs)
+
+    assert len(actual) == batch_size
+    for actual_image, expected_image in zip(actual, expected):
+        assert len(actual_image) == len(expected_image)
+        if len(expected_image) > 0:
+            np.testing.assert_allclose(np.stack(actual_image), np.stack(expected_image))
+
+
+def test_max_candidate_detections_keeps_the_most_confident_candidates_per_image():
+    rng = np.random.default_rng(0)
+    prediction = random_prediction(rng, 2, 500, 3, 0)
+    top = np.argsort(-prediction[:, :, 4], axis=1)[:, :50]
+    expected = w_np_non_max_suppression(
+        np.take_along_axis(prediction, top[..., None], axis=1), max_candidate_detections=None
+    )
+    actual = w_np_non_max_suppression(prediction.copy(), max_candidate_detections=50)
+    for actual_image, expected_image in zip(actual, expected):
+        np.testing.assert_allclose(np.stack(actual_image), np.stack(expected_image))
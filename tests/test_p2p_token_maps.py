@@ -0,0 +1,50 @@
+import pytest
+
+torch = pytest.importorskip("torch")
+
+from src.prompt_attention.p2p_attention import AttentionStore
+
+
+def test_token_maps_of_a_non_square_resolution():
+    torch.manual_seed(0)
+    # 1440x728 after the VAE and two stride-2 convolutions, not 1440 // 32 x 728 // 32
+    size, num_tokens, heads = (45, 23), 16, 2
+    controller = AttentionStore(width=728, height=1440)
+    controller.set_token_maps([[[1], [3, 4]]], size=size, num_tokens=num_tokens)
+    assert controller.token_selector.shape == (1, num_tokens, 2)
+
+    attn = torch.rand(heads, size[0] * size[1], num_tokens).softmax(-1)
+    assert controller.maps_tokens(attn.shape[1])
+    controller.forward(attn, is_cross=True, place_in_unet="down")
+
+    token_maps = controller.get_token_maps()
+    assert token_maps.shape == (1, 2, *size)
+    expected_man = attn[:, :, 1].mean(0).reshape(size)
+    expected_woman = attn[:, :, 3:5].mean(-1).mean(0).reshape(size)
+    torch.testing.assert_close(token_maps[0, 0], expected_man)
+    torch.testing.assert_close(token_maps[0, 1], expected_woman)
+
+
+def test_only_the_token_maps_are_kept_across_steps():
+    torch.manual_seed(0)
+    size, num_tokens, heads = (4, 6), 16, 2
+    controller = AttentionStore(width=48, height=32)
+    controller.num_att_layers = 3
+    controller.set_token_maps([[[1], [3, 4]]], size=size, num_tokens=num_tokens)
+
+    # a self-attention, a cross-attention at the token map resolution and one below it, every step
+    layers = [(False, size[0] * size[1], size[0] * size[1]), (True, size[0] * size[1], num_tokens), (True, 6, num_tokens)]
+    for step in range(20):
+        for is_cross, num_queries, num_keys in layers:
+            if controller.edits_attention(is_cross, num_queries, "up"):
+                controller(torch.rand(heads, num_queries, num_keys).softmax(-1), is_cross, "up")
+            else:
+                controller.skip()
+        assert controller.cur_step == step + 1
+        # no per-layer attention is held, only one (num_requests, num_subjects, h * w) sum
+        assert all(len(maps) == 0 for maps in controller.attention_store.values())
+        assert controller.token_maps.shape == (1, 2, size[0] * size[1])
+        assert controller.num_token_map_layers == step + 1
+
+    assert not controller.edits_attention(False, size[0] * size[1], "up")
+    assert not controller.edits_attention(True, 6, "up")
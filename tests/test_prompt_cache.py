@@ -0,0 +1,118 @@
+import pytest
+
+torch = pytest.importorskip("torch")
+pytest.importorskip("peft")
+pytest.importorskip("diffusers")
+
+from diffusers.utils.peft_utils import set_weights_and_activate_adapters
+from peft import LoraConfig, inject_adapter_in_model
+from peft.tuners.tuners_utils import BaseTunerLayer
+
+from src.pipelines.prompt_cache import PromptEmbeddingCache, text_encoder_lora_key
+
+
+class StandInTextEncoder(torch.nn.Module):
+    def __init__(self):
+        super().__init__()
+        self.embed = torch.nn.Embedding(128, 8)
+        self.proj = torch.nn.Linear(8, 8)
+
+    def forward(self, tokens):
+        return self.proj(self.embed(tokens))
+
+
+class StandInPipeline:
+    '''Encodes prompts with one LoRA-patched text encoder and counts the passes.'''
+
+    def __init__(self):
+        torch.manual_seed(0)
+        self.text_encoder = StandInTextEncoder().eval()
+        self.unet = torch.nn.Sequential()
+        self.unet.proj = torch.nn.Linear(8, 8)
+        self.num_encodes = 0
+
+    def load_lora(self, adapter_name, seed, module=None):
+        torch.manual_seed(seed)
+        config = LoraConfig(r=2, target_modules=["proj"], init_lora_weights=False)
+        inject_adapter_in_model(config, module or self.text_encoder, adapter_name=adapter_name)
+
+    def delete_lora(self, adapter_name):
+        for module in self.text_encoder.modules():
+            if isinstance(module, BaseTunerLayer):
+                module.delete_adapter(adapter_name)
+
+    def set_adapters(self, adapter_names, weights):
+        set_weights_and_activate_adapters(self.text_encoder, adapter_names, weights)
+
+    @torch.no_grad()
+    def encode_prompt(self, prompt, negative_prompt=None, lora_scale=None, clip_skip=None):
+        self.num_encodes += 1
+        tokens = torch.tensor([ord(c) % 128 for c in prompt])
+        return self.text_encoder(tokens), None
+
+
+def test_repeated_prompts_hit():
+    pipe = StandInPipeline()
+    pipe.load_lora("cat", seed=1)
+    pipe.set_adapters(["cat"], [1.0])
+    cache = PromptEmbeddingCache()
+
+    first = cache.encode(pipe, "a cat")
+    second = cache.encode(pipe, "a cat")
+    assert pipe.num_encodes == 1
+    assert second[0] is first[0]
+    cache.encode(pipe, "a dog")
+    cache.encode(pipe, "a cat", lora_scale=0.5)
+    assert pipe.num_encodes == 3
+    assert (cache.hits, cache.misses) == (1, 3)
+
+
+def test_switching_adapters_misses():
+    pipe = StandInPipeline()
+    pipe.load_lora("cat", seed=1)
+    pipe.load_lora("dog", seed=2)
+    cache = PromptEmbeddingCache()
+
+    keys = []
+    for adapter_names, weights in ((["cat"], [1.0]), (["dog"], [1.0]), (["cat", "dog"], [1.0, 1.0]),
+                                   (["cat", "dog"], [1.0, 0.5])):
+        pipe.set_adapters(adapter_names, weights)
+        keys.append(text_encoder_lora_key(pipe))
+        cache.encode(pipe, "a cat")
+    assert len(set(keys)) == 4
+    assert pipe.num_encodes == 4
+
+    pipe.set_adapters(["cat"], [1.0])
+    cache.encode(pipe, "a cat")
+    assert pipe.num_encodes == 4
+
+
+def test_adapter_reloaded_under_the_same_name_misses():
+    pipe = StandInPipeline()
+    pipe.load_lora("character", seed=1)
+    pipe.set_adapters(["character"], [1.0])
+    cache = PromptEmbeddingCache()
+    before = cache.encode(pipe, "a character")
+
+    # another LoRA file whose basename maps to the same adapter name
+    pipe.delete_lora("character")
+    pipe.load_lora("character", seed=2)
+    pipe.set_adapters(["character"], [1.0])
+    after = cache.encode(pipe, "a character")
+    assert pipe.num_encodes == 2
+    assert not torch.allclose(before[0], after[0])
+
+    # the same file loaded again encodes to the same embeddings and may share the entry
+    pipe.delete_lora("character")
+    pipe.load_lora("character", seed=2)
+    pipe.set_adapters(["character"], [1.0])
+    cache.encode(pipe, "a character")
+    assert pipe.num_encodes == 2
+
+
+def test_unet_only_lora_does_not_split_the_cache():
+    pipe = StandInPipeline()
+    assert text_encoder_lora_key(pipe) == ()
+    pipe.load_lora("style", seed=1, module=pipe.unet)
+    assert isinstance(pipe.unet.proj, BaseTunerLayer)
+    assert text_encoder_lora_key(pipe) == ()
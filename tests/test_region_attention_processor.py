@@ -0,0 +1,92 @@
+import pytest
+
+torch = pytest.importorskip("torch")
+pytest.importorskip("diffusers")
+
+from diffusers.models.attention_processor import Attention
+
+from src.pipelines.lora_pipeline import RegionControlNet_AttnProcessor
+from src.prompt_attention.p2p_attention import AttentionControl
+
+
+class RecordingControl(AttentionControl):
+    """Leaves the attention probabilities unchanged, and edits every layer or none."""
+
+    def __init__(self, edits, num_att_layers):
+        super().__init__()
+        self.edits = edits
+        self.num_att_layers = num_att_layers
+        self.forward_calls = 0
+        self.steps_ended = 0
+
+    def edits_attention(self, is_cross, num_queries, place_in_unet):
+        return self.edits
+
+    def forward(self, attn, is_cross, place_in_unet):
+        self.forward_calls += 1
+        return attn
+
+    def between_steps(self):
+        self.steps_ended += 1
+
+
+def build_attention(cross_attention_dim=None):
+    torch.manual_seed(0)
+    return Attention(query_dim=32, cross_attention_dim=cross_attention_dim, heads=4, dim_head=8).eval()
+
+
+def additive_mask(batch_size, key_length):
+    # the layout diffusers takes: (batch, 1, key_length), with masked keys far below zero
+    mask = torch.zeros(batch_size, 1, key_length)
+    mask[0, :, key_length // 2 :] = -10000.0
+    mask[1, :, : key_length // 4] = -10000.0
+    return mask
+
+
+@pytest.mark.parametrize("with_mask", [False, True])
+@pytest.mark.parametrize("is_cross", [False, True])
+@torch.no_grad()
+def test_fused_path_matches_materialized_probabilities(is_cross, with_mask):
+    attn = build_attention(cross_attention_dim=16 if is_cross else None)
+    # 4D input, as the transformer blocks of the UNet get it
+    hidden_states = torch.randn(2, 32, 4, 6)
+    encoder_hidden_states = torch.randn(2, 7, 16) if is_cross else None
+    key_length = 7 if is_cross else 24
+    attention_mask = additive_mask(2, key_length) if with_mask else None
+
+    outputs = []
+    for edits in (True, False):
+        controller = RecordingControl(edits, num_att_layers=2)
+        attn.set_processor(RegionControlNet_AttnProcessor(controller=controller, place_in_unet="down"))
+        outputs.append(attn(hidden_states, encoder_hidden_states=encoder_hidden_states, attention_mask=attention_mask))
+        assert controller.forward_calls == (1 if edits else 0)
+    materialized, fused = outputs
+
+    assert fused.shape == hidden_states.shape
+    torch.testing.assert_close(fused, materialized, rtol=1e-5, atol=1e-5)
+
+
+@torch.no_grad()
+def test_skipped_layers_advance_the_controller_like_edited_ones():
+    self_attn = build_attention()
+    cross_attn = build_attention(cross_attention_dim=16)
+    hidden_states = torch.randn(2, 24, 32)
+    encoder_hidden_states = torch.randn(2, 7, 16)
+
+    counters = []
+    for edits in (True, False):
+        # two attention layers per step, so seven calls are three steps and one layer
+        controller = RecordingControl(edits, num_att_layers=2)
+        self_attn.set_processor(RegionControlNet_AttnProcessor(controller=controller, place_in_unet="up"))
+        cross_attn.set_processor(RegionControlNet_AttnProcessor(controller=controller, place_in_unet="up"))
+        trace = []
+        for _ in range(3):
+            self_attn(hidden_states)
+            trace.append((controller.cur_step, controller.cur_att_layer))
+            cross_attn(hidden_states, encoder_hidden_states=encoder_hidden_states)
+            trace.append((controller.cur_step, controller.cur_att_layer))
+        self_attn(hidden_states)
+        counters.append((trace, controller.cur_step, controller.cur_att_layer, controller.steps_ended))
+
+    assert counters[0] == counters[1]
+    assert counters[1][1:] == (3, 1, 3)
@@ -0,0 +1,111 @@
+import pytest
+
+torch = pytest.importorskip("torch")
+
+from src.pipelines.region_concepts import (
+    composite_region_noise,
+    region_composite_weights,
+    run_region_and_base,
+)
+
+
+class StandInUNet(torch.nn.Module):
+    """A tiny CPU UNet stand-in that records when it runs."""
+
+    def __init__(self, name, log, channels=4):
+        super().__init__()
+        self.name = name
+        self.log = log
+        self.conv = torch.nn.Conv2d(channels, channels, 3, padding=1)
+        self.samples = []
+
+    def forward(self, sample, t):
+        self.log.append((self.name, int(t)))
+        self.samples.append(sample)
+        return self.conv(sample) * (1 + t / 1000)
+
+
+def half_masks(num_requests, size=(32, 32)):
+    left = torch.zeros(size)
+    left[:, : size[1] // 2] = 1
+    right = 1 - left
+    # region 0 is the left half of every request, region 1 the right half of request 0 only
+    return [[left] * num_requests, [right] + [None] * (num_requests - 1)]
+
+
+def reference_composite(noise_pred, region_noise_pred, composite_weights, num_requests):
+    expected = noise_pred.clone()
+    num_regions = composite_weights.shape[0] - 1
+    region_noise_pred = region_noise_pred.view(num_regions, 2, num_requests, *noise_pred.shape[1:])
+    for b in range(2):
+        for n in range(num_requests):
+            row = 1 + 2 * (b * num_requests + n)
+            value = noise_pred[row] * composite_weights[0, n]
+            for r in range(num_regions):
+                value = value + region_noise_pred[r, b, n] * composite_weights[1 + r, n]
+            expected[row] = value
+    return expected
+
+
+def test_region_composite_weights_partition_the_latents():
+    latents = torch.zeros(2, 4, 8, 8)
+    active_regions, weights = region_composite_weights(half_masks(2) + [[None, None]], latents, num_requests=2)
+    assert active_regions == [0, 1]
+    assert weights.shape == (3, 2, 8, 8)
+    # request 0 is fully covered by the two regions, request 1 keeps the base prediction on the right
+    assert torch.equal(weights[0, 0], torch.zeros(8, 8))
+    assert torch.equal(weights[0, 1, :, 4:], torch.ones(8, 4))
+    assert torch.equal(weights.sum(0), torch.ones(2, 8, 8))
+
+
+def test_composite_matches_per_row_reference():
+    torch.manual_seed(0)
+    num_requests, num_regions = 2, 2
+    latents = torch.zeros(num_requests, 4, 8, 8)
+    _, weights = region_composite_weights(half_masks(num_requests), latents, num_requests)
+    # [uncond, cond] x [original, edited copy] x requests, edited copies on the odd rows
+    noise_pred = torch.randn(4 * num_requests, 4, 8, 8)
+    region_noise_pred = torch.randn(num_regions * 2 * num_requests, 4, 8, 8)
+    expected = reference_composite(noise_pred, region_noise_pred, weights, num_requests)
+    composite_region_noise(noise_pred, region_noise_pred, weights, num_requests)
+    torch.testing.assert_close(noise_pred, expected)
+
+
+def test_region_pass_is_launched_before_base_pass_every_step():
+    torch.manual_seed(0)
+    log = []
+    base_unet = StandInUNet("base", log)
+    concept_unet = StandInUNet("concept", log)
+    num_requests = 2
+    # the pipeline's batch_size: every request keeps an original and an edited copy
+    batch_size = 2 * num_requests
+    latents = torch.randn(batch_size, 4, 8, 8)
+    active_regions, weights = region_composite_weights(half_masks(num_requests), latents, num_requests)
+
+    with torch.no_grad():
+        for t in (900, 500, 100):
+            latent_model_input = torch.cat([latents] * 2)
+            # the cond half of the edited copies, as in the pipeline's latent_model_input[batch_size + 1::2]
+            region_input = latent_model_input[batch_size + 1 :: 2]
+            noise_pred, region_noise_pred = run_region_and_base(
+                lambda: concept_unet(torch.cat([region_input] * (2 * len(active_regions))), t),
+                lambda: base_unet(latent_model_input, t),
+                device=torch.device("cpu"),
+                shared_input=latent_model_input,
+            )
+            expected = reference_composite(noise_pred, region_noise_pred, weights, num_requests)
+            composite_region_noise(noise_pred, region_noise_pred, weights, num_requests)
+            torch.testing.assert_close(noise_pred, expected)
+            # every region runs on the edited copies of the cond half, rows 5 and 7 here, and on nothing else
+            edited_cond_rows = latent_model_input[[batch_size + 1 + 2 * n for n in range(num_requests)]]
+            torch.testing.assert_close(
+                concept_unet.samples[-1], torch.cat([edited_cond_rows] * (2 * len(active_regions)))
+            )
+            assert edited_cond_rows.shape[0] == num_requests
+            latents = latents - 0.1 * noise_pred.chunk(2)[1]
+
+    assert log == [
+        ("concept", 900), ("base", 900),
+        ("concept", 500), ("base", 500),
+        ("concept", 100), ("base", 100),
+    ]
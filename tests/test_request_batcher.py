@@ -0,0 +1,68 @@
+import threading
+
+import pytest
+
+from src.pipelines.request_batcher import RequestBatcher
+
+
+class RecordingHandler:
+    """Doubles every request, fails the batches that hold a negative one."""
+
+    def __init__(self):
+        self.batches = []
+        self.threads = set()
+
+    def __call__(self, requests):
+        self.batches.append(list(requests))
+        self.threads.add(threading.current_thread())
+        bad = [request for request in requests if request < 0]
+        if len(bad) > 0:
+            raise ValueError(f"bad request {bad[0]}")
+        return [2 * request for request in requests]
+
+
+def submit_all(batcher, items):
+    # submitted under the condition, so that the worker sees them as one group
+    with batcher.condition:
+        return [batcher.submit(key, request) for key, request in items]
+
+
+def test_requests_sharing_a_key_are_batched():
+    handler = RecordingHandler()
+    batcher = RequestBatcher(handler, max_batch=3, max_wait=0.2)
+    futures = submit_all(batcher, [("a", 1), ("b", 10), ("a", 2), ("a", 3), ("a", 4)])
+
+    assert [future.result(timeout=5) for future in futures] == [2, 20, 4, 6, 8]
+    assert handler.batches[0] == [1, 2, 3]
+    assert sorted(map(sorted, handler.batches)) == [[1, 2, 3], [4], [10]]
+    assert batcher.stats == {"requests": 5, "batches": 3, "failed_batches": 0}
+
+
+def test_a_failing_request_does_not_fail_its_batch():
+    handler = RecordingHandler()
+    batcher = RequestBatcher(handler, max_batch=4, max_wait=10)
+    futures = submit_all(batcher, [("a", 1), ("a", -1), ("a", 3), ("a", 4)])
+
+    assert futures[0].result(timeout=5) == 2
+    with pytest.raises(ValueError, match="bad request -1"):
+        futures[1].result(timeout=5)
+    assert [future.result(timeout=5) for future in futures[2:]] == [6, 8]
+    # the batch, then every request alone
+    assert handler.batches == [[1, -1, 3, 4], [1], [-1], [3], [4]]
+    assert batcher.stats["failed_batches"] == 1
+
+
+def test_a_failing_single_request_is_not_retried():
+    handler = RecordingHandler()
+    batcher = RequestBatcher(handler, max_batch=4, max_wait=0.01)
+    with pytest.raises(ValueError):
+        batcher("a", -1)
+    assert handler.batches == [[-1]]
+    assert batcher("a", 5) == 10
+
+
+def test_the_handler_runs_on_the_worker_thread():
+    handler = RecordingHandler()
+    batcher = RequestBatcher(handler, max_batch=2, max_wait=0.01)
+    assert batcher("a", 1) == 2
+    assert handler.threads == {batcher.worker}
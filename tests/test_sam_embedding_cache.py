@@ -0,0 +1,119 @@
+import io
+import os
+
+import pytest
+
+torch = pytest.importorskip("torch")
+pytest.importorskip("segment_anything")
+
+import numpy as np
+
+from src.efficientvit.models.efficientvit import sam
+from src.efficientvit.models.efficientvit.sam import SamImageEmbeddingCache
+
+CPU = torch.device("cpu")
+
+
+def embedding(value, dtype=torch.float32):
+    # 4 KiB in float32
+    return torch.full((1, 4, 16, 16), float(value), dtype=dtype)
+
+
+def test_memory_eviction_is_lru():
+    cache = SamImageEmbeddingCache(max_bytes=2 * 4096)
+    cache.put("a", embedding(0))
+    cache.put("b", embedding(1))
+    # touching "a" makes "b" the least recently used entry
+    assert cache.get("a", CPU) is not None
+    cache.put("c", embedding(2))
+
+    assert list(cache.entries) == ["a", "c"]
+    assert cache.total_bytes == 2 * 4096
+    assert cache.get("b", CPU) is None
+    assert cache.stats == {"hits": 1, "spill_hits": 0, "misses": 1}
+
+
+def test_evicted_entries_round_trip_through_the_spill_dir(tmp_path):
+    cache = SamImageEmbeddingCache(max_bytes=4096, spill_dir=str(tmp_path))
+    cache.put("a", embedding(1, dtype=torch.bfloat16))
+    cache.put("b", embedding(2))
+
+    assert list(cache.entries) == ["b"]
+    assert os.listdir(tmp_path) == ["a.npy"]
+    features = cache.get("a", CPU, dtype=torch.bfloat16)
+    assert features.dtype == torch.bfloat16
+    assert torch.equal(features, embedding(1, dtype=torch.bfloat16))
+    assert cache.stats["spill_hits"] == 1
+    # back in memory, where it pushes out "b"
+    assert list(cache.entries) == ["a"]
+    assert sorted(os.listdir(tmp_path)) == ["a.npy", "b.npy"]
+
+    # another process sharing the spill dir finds both, with stale temp files removed
+    (tmp_path / ".tmp-crashed.npy").write_bytes(b"")
+    reopened = SamImageEmbeddingCache(max_bytes=4096, spill_dir=str(tmp_path))
+    assert list(reopened.spilled) == ["a", "b"]
+    assert not (tmp_path / ".tmp-crashed.npy").exists()
+    assert torch.equal(reopened.get("b", CPU), embedding(2))
+
+
+def test_spilled_entries_are_loaded_copy_on_write(tmp_path, monkeypatch):
+    cache = SamImageEmbeddingCache(max_bytes=4096, spill_dir=str(tmp_path))
+    cache.put("a", embedding(1))
+    cache.put("b", embedding(2))
+
+    mmap_modes = []
+    np_load = np.load
+
+    def recording_load(path, mmap_mode=None, **kwargs):
+        mmap_modes.append(mmap_mode)
+        return np_load(path, mmap_mode=mmap_mode, **kwargs)
+
+    monkeypatch.setattr(sam.np, "load", recording_load)
+    cache.get("a", CPU).zero_()
+    assert mmap_modes == ["c"]
+    assert np.array_equal(np_load(tmp_path / "a.npy"), embedding(1).numpy())
+
+
+def test_spill_dir_is_bounded(tmp_path):
+    buffer = io.BytesIO()
+    np.save(buffer, embedding(0).numpy())
+    spill_bytes = buffer.getbuffer().nbytes
+    cache = SamImageEmbeddingCache(max_bytes=4096, spill_dir=str(tmp_path), max_spill_bytes=2 * spill_bytes)
+    for key in "abcd":
+        cache.put(key, embedding(ord(key)))
+
+    # "d" is in memory, "a" was the first spilled entry to go
+    assert list(cache.entries) == ["d"]
+    assert list(cache.spilled) == ["b", "c"]
+    assert sorted(os.listdir(tmp_path)) == ["b.npy", "c.npy"]
+    assert cache.get("a", CPU) is None
+
+
+def test_key_depends_on_the_image_and_the_namespace():
+    image = np.zeros((32, 48, 3), dtype=np.uint8)
+    cache = SamImageEmbeddingCache(namespace="xl1")
+    key = cache.make_key(image)
+    assert cache.make_key(image.copy()) == key
+
+    changed = image.copy()
+    changed[0, 0, 0] = 1
+    assert cache.make_key(changed) != key
+    # same bytes, other layout
+    assert cache.make_key(image.reshape(48, 32, 3)) != key
+    assert SamImageEmbeddingCache(namespace="l0").make_key(image) != key
+
+    cache.put(key, embedding(0))
+    assert cache.get(cache.make_key(changed), CPU) is None
+    assert cache.get(SamImageEmbeddingCache(namespace="l0").make_key(image), CPU) is None
+    assert cache.get(key, CPU) is not None
+
+
+def test_other_namespace_misses_in_a_shared_spill_dir(tmp_path):
+    image = np.zeros((32, 48, 3), dtype=np.uint8)
+    xl1 = SamImageEmbeddingCache(max_bytes=4096, spill_dir=str(tmp_path), namespace="xl1")
+    xl1.put(xl1.make_key(image), embedding(1))
+    xl1.put("other", embedding(2))
+
+    l0 = SamImageEmbeddingCache(max_bytes=4096, spill_dir=str(tmp_path), namespace="l0")
+    assert l0.get(l0.make_key(image), CPU) is None
+    assert torch.equal(l0.get(xl1.make_key(image), CPU), embedding(1))
@@ -0,0 +1,61 @@
+import copy
+
+import pytest
+
+torch = pytest.importorskip("torch")
+pytest.importorskip("onnxruntime")
+pytest.importorskip("segment_anything")
+
+import numpy as np
+
+from src.efficientvit.models.efficientvit.sam import EfficientViTSamPredictor
+from src.efficientvit.models.efficientvit.sam_onnx import (
+    EfficientViTSamOnnx, EfficientViTSamOnnxPredictor, export_sam_onnx)
+
+
+@pytest.fixture(scope="module")
+def export_dir(sam_model, tmp_path_factory):
+    export_dir = str(tmp_path_factory.mktemp("sam_onnx"))
+    export_sam_onnx(sam_model, export_dir)
+    return export_dir
+
+
+def test_export_leaves_the_model_untouched(sam_model, tmp_path):
+    model = copy.deepcopy(sam_model).half().train()
+    export_sam_onnx(model, str(tmp_path))
+    assert EfficientViTSamOnnx.is_exported(str(tmp_path))
+    assert model.training
+    assert all(parameter.dtype == torch.float16 for parameter in model.parameters())
+
+
+def test_image_size_is_read_from_the_export(sam_model, export_dir):
+    assert EfficientViTSamOnnx(export_dir).image_size == sam_model.image_size
+
+
+@pytest.mark.parametrize("multimask_output", [False, True])
+def test_onnx_masks_match_torch(sam_model, export_dir, multimask_output):
+    rng = np.random.default_rng(0)
+    image = rng.integers(0, 256, (300, 420, 3), dtype=np.uint8)
+    boxes = torch.tensor([[10.0, 20.0, 200.0, 180.0], [150.0, 40.0, 400.0, 290.0]])
+
+    results = []
+    for predictor in (
+        EfficientViTSamPredictor(sam_model),
+        EfficientViTSamOnnxPredictor(EfficientViTSamOnnx(export_dir)),
+    ):
+        predictor.set_image(image)
+        results.append(
+            predictor.predict_torch(
+                boxes=predictor.apply_boxes_torch(boxes),
+                multimask_output=multimask_output,
+                return_logits=True,
+            )
+        )
+    (torch_masks, torch_iou, torch_low_res), (onnx_masks, onnx_iou, onnx_low_res) = results
+
+    assert onnx_masks.shape == torch_masks.shape == (2, 3 if multimask_output else 1, 300, 420)
+    torch.testing.assert_close(onnx_low_res, torch_low_res.cpu(), rtol=1e-3, atol=1e-3)
+    torch.testing.assert_close(onnx_iou, torch_iou.cpu(), rtol=1e-3, atol=1e-3)
+    torch_binary = torch_masks.cpu() > sam_model.mask_threshold
+    onnx_binary = onnx_masks > sam_model.mask_threshold
+    assert (torch_binary == onnx_binary).float().mean() > 0.999
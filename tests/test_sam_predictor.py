@@ -0,0 +1,67 @@
+import pytest
+
+torch = pytest.importorskip("torch")
+pytest.importorskip("segment_anything")
+
+import numpy as np
+
+from src.efficientvit.models.efficientvit.sam import EfficientViTSamPredictor
+
+# landscape, portrait and smaller than the encoder input
+IMAGE_SIZES = [(300, 420), (512, 256), (200, 200)]
+
+
+def random_prompts(rng, image_size, num_prompts=3):
+    h, w = image_size
+    x0 = rng.uniform(0, w / 2, num_prompts)
+    y0 = rng.uniform(0, h / 2, num_prompts)
+    boxes = np.stack([x0, y0, x0 + rng.uniform(10, w / 2, num_prompts), y0 + rng.uniform(10, h / 2, num_prompts)], 1)
+    point_coords = np.stack([(boxes[:, 0] + boxes[:, 2]) / 2, (boxes[:, 1] + boxes[:, 3]) / 2], 1)[:, None]
+    point_labels = np.ones((num_prompts, 1), dtype=np.int64)
+    return boxes.astype(np.float32), point_coords.astype(np.float32), point_labels
+
+
+@pytest.mark.parametrize("multimask_output", [False, True])
+def test_batched_masks_match_per_prompt_predict(sam_model, multimask_output):
+    rng = np.random.default_rng(0)
+    predictor = EfficientViTSamPredictor(sam_model)
+    for image_size in IMAGE_SIZES:
+        image = rng.integers(0, 256, (*image_size, 3), dtype=np.uint8)
+        boxes, point_coords, point_labels = random_prompts(rng, image_size)
+        predictor.set_image(image)
+
+        masks, iou, low_res = predictor.predict_batch(
+            point_coords=point_coords, point_labels=point_labels, boxes=boxes,
+            multimask_output=multimask_output, return_logits=True,
+        )
+        num_masks = 3 if multimask_output else 1
+        assert masks.shape == (len(boxes), num_masks, *image_size)
+        for i in range(len(boxes)):
+            expected_masks, expected_iou, expected_low_res = predictor.predict(
+                point_coords=point_coords[i], point_labels=point_labels[i], box=boxes[i],
+                multimask_output=multimask_output, return_logits=True,
+            )
+            torch.testing.assert_close(masks[i], torch.from_numpy(expected_masks), rtol=1e-4, atol=1e-4)
+            torch.testing.assert_close(iou[i], torch.from_numpy(expected_iou), rtol=1e-4, atol=1e-4)
+            torch.testing.assert_close(low_res[i], torch.from_numpy(expected_low_res), rtol=1e-4, atol=1e-4)
+
+
+@pytest.mark.parametrize("output_size", [(64, 96), (128, 64)])
+def test_batched_masks_at_output_size(sam_model, output_size):
+    rng = np.random.default_rng(1)
+    predictor = EfficientViTSamPredictor(sam_model)
+    for image_size in IMAGE_SIZES:
+        image = rng.integers(0, 256, (*image_size, 3), dtype=np.uint8)
+        boxes, _, _ = random_prompts(rng, image_size)
+        predictor.set_image(image)
+
+        logits, _, _ = predictor.predict_batch(boxes=boxes, return_logits=True, output_size=output_size)
+        masks, _, _ = predictor.predict_batch(boxes=boxes, output_size=output_size)
+        assert logits.shape == masks.shape == (len(boxes), 1, *output_size)
+        assert masks.dtype == torch.bool
+        assert torch.equal(masks, logits > sam_model.mask_threshold)
+        for i in range(len(boxes)):
+            _, _, low_res = predictor.predict(box=boxes[i], multimask_output=False, return_logits=True)
+            # the per-image path resized to output_size instead of the image size
+            expected = sam_model.postprocess_masks(torch.from_numpy(low_res)[None], predictor.input_size, output_size)
+            torch.testing.assert_close(logits[i], expected[0], rtol=1e-4, atol=1e-4)
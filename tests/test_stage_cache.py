@@ -0,0 +1,159 @@
+import os
+import time
+
+import pytest
+
+torch = pytest.importorskip("torch")
+np = pytest.importorskip("numpy")
+from PIL import Image
+
+from src.pipelines import stage_cache
+from src.pipelines.stage_cache import STALE_TMP_SECONDS, TMP_PREFIX, Stage1Cache
+
+KEY_FIELDS = dict(
+    prompt="a cat and a dog",
+    negative_prompt="",
+    seed=42,
+    resolution=(1024, 1024),
+    condition="None",
+    condition_image=None,
+    lora_paths=["loras/cat.safetensors"],
+    style="None",
+)
+
+
+def put_entry(cache, key, value=0.0, latents=False):
+    images = [Image.new("RGB", (8, 8), color=(int(value) % 256, 0, 0))]
+    masks = [torch.full((64, 64), value), None]
+    cache.put(key, images, masks, latents=torch.full((1, 4, 8, 8), value) if latents else None, latents_step=10)
+
+
+def test_round_trip(tmp_path):
+    cache = Stage1Cache(str(tmp_path))
+    assert cache.get("a") is None
+    put_entry(cache, "a", value=3.0, latents=True)
+
+    entry = cache.get("a")
+    assert entry["images"][0].getpixel((0, 0)) == (3, 0, 0)
+    assert torch.equal(entry["masks"][0], torch.full((64, 64), 3.0))
+    assert entry["masks"][1] is None
+    assert torch.equal(entry["latents"], torch.full((1, 4, 8, 8), 3.0))
+    assert entry["latents_step"] == 10
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_lru_eviction(tmp_path):
+    cache = Stage1Cache(str(tmp_path))
+    put_entry(cache, "a")
+    entry_bytes = cache.total_bytes
+    cache.max_bytes = 2 * entry_bytes + entry_bytes // 2
+    put_entry(cache, "b")
+    # touching "a" makes "b" the least recently used entry
+    assert cache.get("a") is not None
+    put_entry(cache, "c")
+
+    assert list(cache.entries) == ["a", "c"]
+    assert not os.path.exists(tmp_path / "b")
+    assert cache.get("b") is None
+    assert cache.total_bytes <= cache.max_bytes
+    # the index is rebuilt from disk in the same order
+    assert list(Stage1Cache(str(tmp_path), max_bytes=cache.max_bytes).entries) == ["a", "c"]
+
+
+def test_entries_are_renamed_into_place_complete(tmp_path, monkeypatch):
+    replaced = []
+    os_replace = os.replace
+
+    def recording_replace(src, dst):
+        replaced.append((os.path.basename(src), os.path.basename(dst), sorted(os.listdir(src))))
+        assert not os.path.exists(dst)
+        os_replace(src, dst)
+
+    monkeypatch.setattr(stage_cache.os, "replace", recording_replace)
+    cache = Stage1Cache(str(tmp_path))
+    put_entry(cache, "a", latents=True)
+
+    [(src, dst, files)] = replaced
+    assert src.startswith(TMP_PREFIX) and dst == "a"
+    assert files == ["image_0.png", "latents.npy", "mask_0.npy", "meta.json"]
+    assert os.listdir(tmp_path) == ["a"]
+
+
+def test_failed_write_leaves_no_entry(tmp_path, monkeypatch):
+    cache = Stage1Cache(str(tmp_path))
+
+    def failing_save(*args, **kwargs):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(stage_cache.np, "save", failing_save)
+    with pytest.raises(OSError):
+        put_entry(cache, "a")
+    assert "a" not in cache.entries
+    assert not os.path.exists(tmp_path / "a")
+    assert cache.get("a") is None
+
+
+def test_stale_temp_dirs_are_cleaned_up(tmp_path):
+    stale = tmp_path / f"{TMP_PREFIX}stale"
+    live = tmp_path / f"{TMP_PREFIX}live"
+    evicted = tmp_path / "evicted"
+    for path in (stale, live, evicted):
+        path.mkdir()
+        (path / "mask_0.npy").write_bytes(b"0" * 16)
+    old = time.time() - STALE_TMP_SECONDS - 60
+    os.utime(stale, (old, old))
+
+    cache = Stage1Cache(str(tmp_path))
+    # a young temp dir may be another process writing, a dir without meta.json is a half-evicted entry
+    assert not stale.exists()
+    assert live.exists()
+    assert not evicted.exists()
+    assert len(cache.entries) == 0
+
+
+def test_tensors_are_loaded_copy_on_write(tmp_path, monkeypatch):
+    cache = Stage1Cache(str(tmp_path))
+    put_entry(cache, "a", value=1.0, latents=True)
+
+    mmap_modes = []
+    np_load = np.load
+
+    def recording_load(path, mmap_mode=None, **kwargs):
+        mmap_modes.append(mmap_mode)
+        return np_load(path, mmap_mode=mmap_mode, **kwargs)
+
+    monkeypatch.setattr(stage_cache.np, "load", recording_load)
+    entry = cache.get("a")
+    assert mmap_modes == ["c", "c"]
+
+    # writes to the returned tensors stay private to the process
+    entry["masks"][0].add_(1)
+    entry["latents"].zero_()
+    reloaded = cache.get("a")
+    assert torch.equal(reloaded["masks"][0], torch.full((64, 64), 1.0))
+    assert torch.equal(reloaded["latents"], torch.full((1, 4, 8, 8), 1.0))
+
+
+@pytest.mark.parametrize(
+    "field, value",
+    [
+        ("seed", 43),
+        ("prompt", "a cat and a fox"),
+        ("negative_prompt", "blurry"),
+        ("resolution", (1024, 768)),
+        ("lora_paths", ["loras/dog.safetensors"]),
+        ("style", "Cinematic"),
+        ("condition_image", Image.new("RGB", (8, 8))),
+    ],
+)
+def test_key_changes_with_every_field(field, value):
+    key = Stage1Cache.make_key(**KEY_FIELDS)
+    assert Stage1Cache.make_key(**KEY_FIELDS) == key
+    assert Stage1Cache.make_key(**{**KEY_FIELDS, field: value}) != key
+
+
+def test_key_changes_with_the_condition_image_content():
+    black = dict(KEY_FIELDS, condition_image=Image.new("RGB", (8, 8)))
+    white = dict(KEY_FIELDS, condition_image=Image.new("RGB", (8, 8), color=(255, 255, 255)))
+    assert Stage1Cache.make_key(**black) != Stage1Cache.make_key(**white)
+    assert Stage1Cache.make_key(**KEY_FIELDS, num_inference_steps=30) != Stage1Cache.make_key(**KEY_FIELDS)
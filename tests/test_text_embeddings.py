@@ -0,0 +1,89 @@
+import multiprocessing
+import os
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+# the yolo_world package imports ultralytics
+pytest.importorskip("ultralytics")
+
+from inference.models.yolo_world.text_embeddings import TextEmbeddingStore
+
+DIM = 16
+
+
+def fake_embeddings(class_names):
+    # what the text encoder returns for a class, the same in every process
+    return np.stack(
+        [np.random.default_rng(zlib.crc32(name.encode("utf-8"))).standard_normal(DIM) for name in class_names]
+    ).astype(np.float32)
+
+
+def add_classes(cache_dir, class_names, start):
+    start.wait()
+    store = TextEmbeddingStore(cache_dir)
+    for i in range(0, len(class_names), 3):
+        batch = class_names[i : i + 3]
+        store.add(batch, fake_embeddings(batch))
+
+
+def test_round_trip(tmp_path):
+    store = TextEmbeddingStore(str(tmp_path))
+    assert store.get(["cat"]) is None
+    assert store.missing(["cat", "dog", "cat"]) == ["cat", "dog"]
+
+    store.add(["cat", "dog"], fake_embeddings(["cat", "dog"]))
+    assert "cat" in store and len(store) == 2
+    np.testing.assert_array_equal(store.get(["dog", "cat", "dog"]), fake_embeddings(["dog", "cat", "dog"]))
+    assert store.get(["dog", "bird"]) is None
+
+    # a stored class keeps its first embedding
+    store.add(["cat", "bird"], np.zeros((2, DIM)))
+    np.testing.assert_array_equal(store.get(["cat"]), fake_embeddings(["cat"]))
+
+    reopened = TextEmbeddingStore(str(tmp_path))
+    assert reopened.missing(["cat", "dog", "bird", "fish"]) == ["fish"]
+    np.testing.assert_array_equal(reopened.get(["cat", "dog", "bird"])[:2], fake_embeddings(["cat", "dog"]))
+    assert reopened.get(["cat"]).dtype == np.float32
+
+
+def test_class_names_are_not_paths(tmp_path):
+    store = TextEmbeddingStore(str(tmp_path / "store"))
+    names = ["../escape", "a/b", "traffic light", ""]
+    store.add(names, fake_embeddings(names))
+    assert os.listdir(tmp_path) == ["store"]
+    np.testing.assert_array_equal(TextEmbeddingStore(str(tmp_path / "store")).get(names), fake_embeddings(names))
+
+
+def test_concurrent_adds_from_threads(tmp_path):
+    class_names = [f"class {i}" for i in range(40)]
+    # overlapping class lists on separate instances, as several models of one server would
+    slices = [class_names[i : i + 20] for i in range(0, 40, 5)]
+    start = threading.Barrier(len(slices))
+    with ThreadPoolExecutor(len(slices)) as pool:
+        list(pool.map(lambda names: add_classes(str(tmp_path), names, start), slices))
+
+    store = TextEmbeddingStore(str(tmp_path))
+    assert len(store) == len(class_names)
+    np.testing.assert_array_equal(store.get(class_names), fake_embeddings(class_names))
+
+
+def test_concurrent_adds_from_processes(tmp_path):
+    class_names = [f"class {i}" for i in range(40)]
+    slices = [class_names[i : i + 20] for i in range(0, 40, 5)]
+    context = multiprocessing.get_context("fork")
+    start = context.Barrier(len(slices))
+    processes = [context.Process(target=add_classes, args=(str(tmp_path), names, start)) for names in slices]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(timeout=60)
+        assert process.exitcode == 0
+
+    store = TextEmbeddingStore(str(tmp_path))
+    assert len(store) == len(class_names)
+    assert not any(name.startswith(".tmp-") for name in os.listdir(tmp_path))
+    np.testing.assert_array_equal(store.get(class_names), fake_embeddings(class_names))
@@ -0,0 +1,111 @@
+import zlib
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+torch = pytest.importorskip("torch")
+pytest.importorskip("ultralytics")
+
+from inference.models.yolo_world.text_embeddings import TextEmbeddingStore
+from inference.models.yolo_world.yolo_world import YOLOWorld
+
+DIM = 8
+
+
+def fake_txt_feats(class_names):
+    return torch.from_numpy(
+        np.stack(
+            [np.random.default_rng(zlib.crc32(c.encode("utf-8"))).standard_normal(DIM) for c in class_names]
+        ).astype(np.float32)
+    )
+
+
+class StandInWorldModel:
+    """The parts of ultralytics' WorldModel that YOLOWorld touches."""
+
+    def __init__(self):
+        self.model = [SimpleNamespace(nc=0)]
+        self.txt_feats = None
+        self.names = None
+        self.encoded = []
+
+    def set_classes(self, class_names):
+        self.encoded.append(list(class_names))
+        self.txt_feats = fake_txt_feats(class_names).reshape(1, len(class_names), -1)
+        self.model[-1].nc = len(class_names)
+
+
+class StandInYOLO:
+    """Detects one box per class, the box of image i at (i, i, i + 1, i + 1)."""
+
+    def __init__(self):
+        self.model = StandInWorldModel()
+        self.predictor = None
+        self.calls = []
+
+    def predict(self, images, conf, verbose):
+        names = self.model.names
+        # the vocabulary in place must be the one of the names set
+        torch.testing.assert_close(self.model.txt_feats[0], fake_txt_feats(names))
+        assert self.model.model[-1].nc == len(names)
+        self.calls.append((list(names), [int(image[0, 0, 0]) for image in images]))
+        results = []
+        for image in images:
+            marker = float(image[0, 0, 0])
+            boxes = SimpleNamespace(
+                xyxy=torch.tensor([[marker, marker, marker + 1, marker + 1]] * len(names)),
+                conf=torch.full((len(names),), 0.9),
+                cls=torch.arange(len(names), dtype=torch.float32),
+            )
+            results.append(SimpleNamespace(boxes=boxes))
+        return results
+
+
+@pytest.fixture
+def yolo_world(tmp_path):
+    # skips RoboflowCoreModel.__init__, which downloads the weights
+    model = YOLOWorld.__new__(YOLOWorld)
+    model.model = StandInYOLO()
+    model.class_names = None
+    model.text_embeddings = TextEmbeddingStore(str(tmp_path))
+    return model
+
+
+def marked_images(n):
+    # image i is filled with i and is 10 + i pixels high
+    return [np.full((10 + i, 20, 3), i, dtype=np.uint8) for i in range(n)]
+
+
+def test_responses_follow_the_input_order_across_interleaved_class_lists(yolo_world):
+    animals, vehicles, people = ["cat", "dog"], ["car", "bus", "truck"], ["person"]
+    text = [animals, vehicles, animals, people, vehicles, animals]
+
+    responses = yolo_world.infer_batch(marked_images(len(text)), text=text)
+
+    assert len(responses) == len(text)
+    for i, (response, classes) in enumerate(zip(responses, text)):
+        assert response.class_names == classes
+        assert response.image.height == 10 + i
+        np.testing.assert_array_equal(response.xyxy[:, 0], np.full(len(classes), i))
+        assert [p.class_name for p in response.predictions] == classes
+    # one predict call per class list, in order of first appearance
+    assert yolo_world.model.calls == [(animals, [0, 2, 5]), (vehicles, [1, 4]), (people, [3])]
+    # each class went through the text encoder once
+    assert sorted(sum(yolo_world.model.model.encoded, [])) == sorted(animals + vehicles + people)
+
+
+def test_shared_class_list_is_one_predict_call(yolo_world):
+    responses = yolo_world.infer_batch(marked_images(3), text=["cat", "dog"])
+    assert [r.class_names for r in responses] == [["cat", "dog"]] * 3
+    assert yolo_world.model.calls == [(["cat", "dog"], [0, 1, 2])]
+
+    # the classes stay set for requests without text
+    responses = yolo_world.infer_batch(marked_images(2))
+    assert [r.class_names for r in responses] == [["cat", "dog"]] * 2
+    assert yolo_world.model.model.encoded == [["cat", "dog"]]
+
+
+def test_missing_class_names_raise(yolo_world):
+    with pytest.raises(ValueError):
+        yolo_world.infer_batch(marked_images(2), text=None)